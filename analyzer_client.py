@@ -0,0 +1,119 @@
+"""
+Analyzer Client - This script talks to analyzer_daemon.py over its local sockets. It
+sends queries and prints the daemon's JSON answers, or sends the lines of perf log
+files to be analyzed, e.g. to try the daemon out or to replay a log into it.
+
+Usage: python analyzer_client.py stats
+       python analyzer_client.py group_by Table 10
+       python analyzer_client.py --send perf.log [perf.log.1 ...]
+       [--config log_analyzer.cfg] [--query-address tcp:127.0.0.1:9515]
+       [--ingest-address tcp:127.0.0.1:9514]
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import sys
+import json
+import socket
+import argparse
+import configparser
+
+from analyzer_daemon import get_socket_address, DEFAULT_DAEMON_INGEST_ADDRESS, DEFAULT_DAEMON_QUERY_ADDRESS
+
+# Bytes of lines sent to the daemon at a time
+SEND_BUFFER_BYTES = 64 * 1024
+
+# Most bytes of lines sent in each UDP datagram. Lines are packed into datagrams, since
+# the daemon splits each datagram it receives into lines.
+MAX_DATAGRAM_BYTES = 8 * 1024
+
+
+# Return a socket connected to a tcp or unix socket address, or for a udp address, a
+# UDP socket and the address to send to
+def connect(address):
+    protocol, host, port = get_socket_address(address)
+    if (protocol == "unix"):
+        client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client_socket.connect(host)
+        return (client_socket, None)
+    if (protocol == "udp"):
+        return (socket.socket(socket.AF_INET, socket.SOCK_DGRAM), (host, port))
+    return (socket.create_connection((host, port)), None)
+
+
+# Send a query to the daemon and return its answer, parsed from JSON
+def send_query(query_address, query):
+    client_socket, _ = connect(query_address)
+    with client_socket:
+        client_socket.sendall((query + "\n").encode())
+        answer = b""
+        while (not answer.endswith(b"\n")):
+            received = client_socket.recv(SEND_BUFFER_BYTES)
+            if (not received):
+                break
+            answer += received
+    return json.loads(answer)
+
+
+# Send the lines of perf log files to the daemon and return the number of lines sent.
+# Over TCP and Unix sockets, sending waits while the daemon's queue is full.
+def send_lines(ingest_address, perf_log_files):
+    client_socket, udp_address = connect(ingest_address)
+    line_count = 0
+    with client_socket:
+        for perf_log_file in perf_log_files:
+            with open(perf_log_file, 'rb') as perf_log:
+                if (udp_address == None):
+                    while (True):
+                        lines = perf_log.readlines(SEND_BUFFER_BYTES)
+                        if (not lines):
+                            break
+                        client_socket.sendall(b"".join(line if line.endswith(b"\n") else line + b"\n"
+                                                       for line in lines))
+                        line_count += len(lines)
+                else:
+                    datagram = b""
+                    for line in perf_log:
+                        line = line[:MAX_DATAGRAM_BYTES - 1].rstrip(b"\r\n") + b"\n"
+                        if (len(datagram) + len(line) > MAX_DATAGRAM_BYTES):
+                            client_socket.sendto(datagram, udp_address)
+                            datagram = b""
+                        datagram += line
+                        line_count += 1
+                    if (datagram):
+                        client_socket.sendto(datagram, udp_address)
+    return line_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query analyzer_daemon.py or send it perf log lines.")
+    parser.add_argument("query", nargs='*', help="Query, e.g. stats, counts, pairs, groups, or group_by NAME [N]")
+    parser.add_argument("--send", nargs='+', metavar="PERF_LOG", help="Perf log files to send to the daemon")
+    parser.add_argument("--config", default=None, help="log_analyzer config file to read the [daemon] addresses from")
+    parser.add_argument("--query-address", default=None, help="Daemon query address, e.g. tcp:127.0.0.1:9515")
+    parser.add_argument("--ingest-address", default=None, help="Daemon ingest address, e.g. tcp:127.0.0.1:9514")
+    args = parser.parse_args()
+
+    query_address = DEFAULT_DAEMON_QUERY_ADDRESS
+    ingest_address = DEFAULT_DAEMON_INGEST_ADDRESS
+    if (args.config != None):
+        config = configparser.ConfigParser(strict=False)
+        config.read(args.config)
+        query_address = config.get('daemon', 'query_address', fallback=query_address)
+        ingest_address = config.get('daemon', 'ingest_address', fallback=ingest_address)
+    query_address = args.query_address or query_address
+    ingest_address = args.ingest_address or ingest_address
+
+    if (args.send != None):
+        print("Sent {} lines to {}".format(send_lines(ingest_address, args.send), ingest_address))
+    if (len(args.query) > 0):
+        print(json.dumps(send_query(query_address, " ".join(args.query)), indent=2))
+    elif (args.send == None):
+        parser.print_usage()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""
+Analyzer Daemon - This script runs the analyzer as a long-running daemon for on-call
+use. It accepts perf log lines over a local TCP, UDP, or Unix socket, parses them with
+the config's [log-format], and keeps the timing pair, timing group, and group_by stats
+in memory, answering queries about them on a second socket while lines keep arriving.
+
+Lines are queued for analysis in a bounded queue. When it's full, TCP and Unix socket
+senders are no longer read from, so they're slowed down rather than lines piling up,
+and UDP lines are dropped and counted (datagrams the system drops before the daemon
+reads them aren't counted). The lines are analyzed a batch at a time on the event
+loop, which answers queries between batches, so a query waits for a few short batches
+at most (tens of ms) however fast lines arrive.
+
+Queries are one line each, answered with one line of JSON:
+  ping                     Check the daemon is up
+  counts                   Lines received, dropped, and queued, and entries analyzed
+  pairs                    Stats of each timing pair and the total time pair
+  groups                   Stats of each timing group
+  group_by NAME [N]        Stats of the N (default 20) largest groups of a group_by item
+  stats                    counts, pairs, and groups together
+Stats are count, min, max, avg, and percentiles in ms, plus max latency violations
+for timing pairs. See analyzer_client.py for sending lines and queries.
+
+On Ctrl-C or SIGTERM, the queued lines are analyzed and the results are written
+through the config's result sinks, without log details rows.
+
+Usage: python analyzer_daemon.py [--config log_analyzer.cfg]
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+
+from log_analyzer import *
+
+# Lines analyzed before the analysis task lets queries and ingestion run. A query takes
+# a few turns of the event loop, so smaller batches answer it sooner under load.
+ANALYSIS_BATCH_LINES = 64
+
+# Longest line accepted from a stream socket
+MAX_LINE_BYTES = 1024 * 1024
+
+# Socket receive buffer asked for on a UDP ingest address, so datagrams that arrive
+# while a batch is analyzed wait in it rather than being dropped by the system
+UDP_RECEIVE_BUFFER_BYTES = 8 * 1024 * 1024
+
+# Groups a group_by query returns by default
+DEFAULT_QUERY_GROUPS = 20
+
+# log_file of the entries analyzed by the daemon
+DAEMON_LOG_FILE = "daemon"
+
+
+# Return the (protocol, host or path, port) of a socket address like
+# "tcp:127.0.0.1:9514", "udp:127.0.0.1:9514", or "unix:/tmp/analyzer.sock"
+def get_socket_address(address):
+    protocol, _, location = address.strip().partition(":")
+    protocol = protocol.lower()
+    if (protocol == "unix" and location != ""):
+        return (protocol, location, None)
+    if (protocol in ("tcp", "udp")):
+        host, _, port = location.rpartition(":")
+        if (host != "" and port.isdigit()):
+            return (protocol, host, int(port))
+    raise ValueError("Invalid socket address \"{}\"".format(address))
+
+
+# Return a dict of the stats of a LatencyStats or TimingGroup for a query response
+def get_latency_summary(count, min_latency, max_latency, total_latency, get_percentile):
+    if (count == 0):
+        return {"count": 0}
+    latency_summary = {"count": count, "min": min_latency, "max": max_latency,
+                       "avg": round(total_latency / count, 2)}
+    for percentile in REPORT_PERCENTILES:
+        latency_summary["p{}".format(percentile)] = get_percentile(percentile)
+    return latency_summary
+
+
+""" UDPIngestProtocol class that queues the lines in each datagram the daemon receives """
+class UDPIngestProtocol(asyncio.DatagramProtocol):
+    def __init__(self, daemon):
+        self.daemon = daemon
+
+    def datagram_received(self, data, addr):
+        for line in data.splitlines():
+            self.daemon.queue_line_nowait(line)
+
+
+""" AnalyzerDaemon class that ingests perf log lines from a socket and answers stats queries """
+class AnalyzerDaemon:
+    def __init__(self, session, ingest_address, query_address, queue_lines):
+        self.session = session
+        self.ingest_address = get_socket_address(ingest_address)
+        self.query_address = get_socket_address(query_address)
+        self.queue_lines = queue_lines
+        self.line_queue = None # Created in run(), on the event loop
+        self.servers = []
+        self.udp_transport = None
+        self.lines_received = 0
+        self.lines_dropped = 0
+        self.line_number = 0
+        self.start_time = time.time()
+
+    # Listen for lines and queries until stopped, then analyze the queued lines
+    async def run(self):
+        self.line_queue = asyncio.Queue(maxsize=self.queue_lines)
+        await self.start_ingest_server()
+        self.servers.append(await self.start_stream_server(self.query_address, self.handle_query))
+        analysis_task = asyncio.create_task(self.analyze_lines())
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for stop_signal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(stop_signal, stop_event.set)
+            except (NotImplementedError, AttributeError):
+                pass # Not supported on Windows, where Ctrl-C stops the event loop instead
+        self.session.logger.info("Analyzer daemon ingesting lines on {} and answering queries on {}".format(
+            ":".join(str(part) for part in self.ingest_address if part != None),
+            ":".join(str(part) for part in self.query_address if part != None)))
+        await stop_event.wait()
+
+        self.session.logger.info("Analyzer daemon stopping. Analyzing {} queued lines.".format(
+            self.line_queue.qsize()))
+        for server in self.servers:
+            server.close()
+        if (self.udp_transport != None):
+            self.udp_transport.close()
+        await self.line_queue.put(None) # Stops the analysis task once the lines before it are analyzed
+        await analysis_task
+
+    async def start_ingest_server(self):
+        protocol, host, port = self.ingest_address
+        if (protocol == "udp"):
+            loop = asyncio.get_running_loop()
+            self.udp_transport, _ = await loop.create_datagram_endpoint(
+                lambda: UDPIngestProtocol(self), local_addr=(host, port))
+            try:
+                self.udp_transport.get_extra_info('socket').setsockopt(
+                    socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RECEIVE_BUFFER_BYTES)
+            except (OSError):
+                pass # Keep the system's default buffer size
+        else:
+            self.servers.append(await self.start_stream_server(self.ingest_address, self.handle_ingest))
+
+    async def start_stream_server(self, address, handler):
+        protocol, host, port = address
+        if (protocol == "unix"):
+            if (os.path.exists(host)):
+                os.remove(host) # Left by a daemon that didn't stop cleanly
+            return await asyncio.start_unix_server(handler, path=host, limit=MAX_LINE_BYTES)
+        if (protocol != "tcp"):
+            raise ValueError("Queries need a tcp or unix socket address")
+        return await asyncio.start_server(handler, host, port, limit=MAX_LINE_BYTES)
+
+    # Queue the lines from a stream connection. Waiting for room in the queue stops
+    # reading from the socket, so a sender faster than the analysis is slowed down.
+    async def handle_ingest(self, reader, writer):
+        try:
+            async for line in reader:
+                self.lines_received += 1
+                await self.line_queue.put(line)
+        except (ValueError, ConnectionError) as error:
+            self.session.logger.info("Problem reading perf log lines - " + str(error) +
+                                     " - Closing the connection.")
+        finally:
+            writer.close()
+
+    # Queue a line from a datagram, dropping it if the queue is full
+    def queue_line_nowait(self, line):
+        self.lines_received += 1
+        try:
+            self.line_queue.put_nowait(line)
+        except (asyncio.QueueFull):
+            self.lines_dropped += 1
+
+    # Analyze queued lines until the None queued by run(), a batch at a time so queries
+    # are answered between batches
+    async def analyze_lines(self):
+        while (True):
+            line = await self.line_queue.get()
+            batch_lines = 0
+            while (line != None):
+                self.analyze_line(line)
+                batch_lines += 1
+                if (batch_lines >= ANALYSIS_BATCH_LINES or self.line_queue.empty()):
+                    break
+                line = self.line_queue.get_nowait()
+            if (line == None):
+                return
+            await asyncio.sleep(0)
+
+    def analyze_line(self, line):
+        self.line_number += 1
+        entry = parse_log_line(self.session, line.decode(errors='replace'), self.line_number)
+        if (entry != None):
+            entry.log_file = DAEMON_LOG_FILE
+            analyze_log_entry(self.session, entry)
+
+    # Answer each query line on a connection with a line of JSON
+    async def handle_query(self, reader, writer):
+        try:
+            async for line in reader:
+                query = line.decode(errors='replace').split()
+                if (len(query) == 0):
+                    continue
+                writer.write((json.dumps(self.get_query_response(query)) + "\n").encode())
+                await writer.drain()
+        except (ValueError, ConnectionError):
+            pass # The client went away
+        finally:
+            writer.close()
+
+    def get_query_response(self, query):
+        command = query[0].lower()
+        if (command == "ping"):
+            return {"pong": True}
+        if (command == "counts"):
+            return self.get_counts()
+        if (command == "pairs"):
+            return self.get_pair_stats()
+        if (command == "groups"):
+            return self.get_group_stats()
+        if (command == "group_by" and len(query) in (2, 3)):
+            max_groups = int(query[2]) if (len(query) == 3 and query[2].isdigit()) else DEFAULT_QUERY_GROUPS
+            return self.get_group_by_stats(query[1], max_groups)
+        if (command == "stats"):
+            return {"counts": self.get_counts(), "pairs": self.get_pair_stats(),
+                    "groups": self.get_group_stats()}
+        return {"error": "Unknown query \"{}\". Queries are ping, counts, pairs, groups, ".format(
+            " ".join(query)) + "group_by NAME [N], and stats."}
+
+    def get_counts(self):
+        session = self.session
+        uptime = time.time() - self.start_time
+        return {"uptime_secs": round(uptime, 1), "lines_received": self.lines_received,
+                "lines_dropped": self.lines_dropped, "lines_queued": self.line_queue.qsize(),
+                "lines_per_sec": round(self.line_number / uptime, 1) if uptime > 0 else None,
+                "log_entries": session.log_entry_count, "valid_entries": session.valid_log_entry_count,
+                "invalid_entries": session.invalid_log_entry_count,
+                "lines_prefiltered": session.lines_prefiltered, "entries_filtered": session.entries_filtered}
+
+    def get_pair_stats(self):
+        timing_pairs = list(self.session.timing_pairs.values())
+        if (self.session.total_time != None):
+            timing_pairs.append(self.session.total_time)
+        pair_stats = {}
+        for timing_pair in timing_pairs:
+            latency_stats = timing_pair.latency_stats
+            pair_stats[timing_pair.display_name] = get_latency_summary(
+                latency_stats.count, latency_stats.min_latency, latency_stats.max_latency,
+                latency_stats.total_latency, latency_stats.get_percentile)
+            pair_stats[timing_pair.display_name]["violations"] = timing_pair.violation_count
+        return pair_stats
+
+    def get_group_stats(self):
+        return {timing_group.display_name: get_latency_summary(
+                    timing_group.group_count, timing_group.min_latency, timing_group.max_latency,
+                    timing_group.total_latency, timing_group.get_percentile)
+                for timing_group in self.session.timing_groups.values()}
+
+    def get_group_by_stats(self, display_name, max_groups):
+        for group_by in self.session.group_bys:
+            if (group_by.display_name == display_name):
+                return {"+".join(group_value): get_latency_summary(
+                            latency_stats.count, latency_stats.min_latency, latency_stats.max_latency,
+                            latency_stats.total_latency, latency_stats.get_percentile)
+                        for group_value, latency_stats, _ in group_by.group_stats.get_groups()[:max_groups]}
+        return {"error": "No group_by item \"{}\"".format(display_name)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the log analyzer as a daemon.")
+    parser.add_argument("--config", default=None,
+                        help="log_analyzer config file (default log_analyzer.cfg in the script directory)")
+    args = parser.parse_args()
+
+    session = AnalysisSession()
+    session.run_start_time = session.stage_timer.start_section()
+    load_config(session, args.config)
+    session.perf_log_files = [] # Lines come from the ingest socket
+    session.log_details_policy = "none"
+    session.log_details_heap = None
+    if (not is_dir_writable(session.app_log_file_dir)):
+        print("\nDirectory " + session.app_log_file_dir + " must exist and be writable. Exiting.\n")
+        sys.exit(1)
+    if (session.join_table != None):
+        print("\nThe daemon doesn't correlate lines. Leave correlate_by blank. Exiting.\n")
+        sys.exit(1)
+    if (setup(session) != True):
+        print("\nError during setup. Exiting.\n")
+        sys.exit(1)
+    session.stage_timer.end_section(session.run_start_time, ["config"])
+
+    daemon = AnalyzerDaemon(session, session.daemon_ingest_address, session.daemon_query_address,
+                            session.daemon_queue_lines)
+    section_start = session.stage_timer.start_section()
+    try:
+        asyncio.run(daemon.run())
+    except (KeyboardInterrupt):
+        session.logger.info("Analyzer daemon stopped.")
+    except (OSError, ValueError) as error:
+        shutdown(session, 1, "Problem running the analyzer daemon - " + str(error))
+    session.stage_timer.end_section(section_start, ["analyze"])
+
+    write_log_details_header(session)
+    write_analysis_results(session)
+    shutdown(session, 0, "Analyzer daemon exiting")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Batch Analyze - This script analyzes a directory of performance logs in one run, e.g.
+for a nightly sweep, instead of running log_analyzer once per log. The config is
+loaded once and the logs are analyzed in a pool of processes, largest first. Each
+log's results are written to results files named after it, and the combined results
+of all the logs to the config's results files, with a "Batch Files" table listing
+each log's status. A log that can't be analyzed is reported and left out of the
+combined results without stopping the batch.
+
+Usage: python batch_analyze.py DIRECTORY [--pattern "*.log*"] [--workers 4]
+       [--config log_analyzer.cfg]
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import os
+import sys
+import argparse
+
+from log_analyzer import *
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a directory of performance logs.")
+    parser.add_argument("directory", help="Directory of the performance logs to analyze")
+    parser.add_argument("--pattern", default=None,
+                        help="Glob pattern of the logs in the directory (default the config's perf_log_file_name)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes to analyze with (default the config's parallel_workers, or the CPU count)")
+    parser.add_argument("--config", default=None,
+                        help="log_analyzer config file (default log_analyzer.cfg in the script directory)")
+    args = parser.parse_args()
+
+    session = AnalysisSession()
+    session.run_start_time = session.stage_timer.start_section()
+    load_config(session, args.config)
+    pattern = args.pattern if args.pattern != None else session.perf_log_file_name
+    session.perf_log_file_dir = args.directory
+    session.perf_log_file_name = pattern
+    session.perf_log_file = os.path.join(args.directory, pattern)
+    session.perf_log_files = find_log_files(args.directory, pattern)
+    batch_workers = args.workers
+    if (batch_workers == None):
+        batch_workers = session.parallel_workers if session.parallel_workers > 1 else (os.cpu_count() or 1)
+    if (verify_config(session) != True):
+        print("\nError loading app configuration. Please check config file. Exiting.\n")
+        sys.exit(1)
+    if (setup(session) != True):
+        print("\nError during setup. Exiting.\n")
+        sys.exit(1)
+    session.stage_timer.end_section(session.run_start_time, ["config"])
+
+    section_start = session.stage_timer.start_section()
+    write_log_details_header(session)
+    failed_count = analyze_batch(session, session.perf_log_files, max(1, batch_workers))
+    session.stage_timer.end_section(section_start, ["analyze"])
+    write_analysis_results(session)
+    shutdown(session, 1 if failed_count > 0 else 0, "Batch analysis complete. Analyzer exiting")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Generate Perf Log - This script writes a synthetic performance log matching a
+log_analyzer config, for benchmarking the analyzer. Each line has the config's row
+header and separators, the timestamps of its timing pairs, the values of its timing
+groups, and a value for each other log field. A configurable share of lines are
+invalid (no row header or an invalid pair) or exceed a timing pair's max latency.
+The same arguments always generate the same log.
+
+Usage: python generate_perf_log.py --lines 1M --output perf.log [--config log_analyzer.cfg]
+       [--invalid-rate 0.01] [--violation-rate 0.05] [--seed 1]
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_analyzer import *
+
+# Config the log is generated for by default
+DEFAULT_CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   "log_analyzer.cfg")
+
+# Multipliers for line count suffixes, e.g. 10k or 100M
+LINE_COUNT_SUFFIXES = {"k": 1000, "m": 1000 * 1000}
+
+# Lines written to the log file at a time
+WRITE_BATCH_LINES = 10000
+
+# Value added to each timing group field's configured values, for entries in no group
+OTHER_GROUP_VALUE = "OTHER"
+
+# Distinct values of each log field that isn't a timestamp or timing group field
+FIELD_VALUE_COUNT = 100000
+
+# First timestamp of the log, in ms since the epoch (2024-01-01 UTC)
+FIRST_ENTRY_TIME_MS = 1704067200000
+
+# Most ms between consecutive entries' first timestamps
+MAX_ENTRY_GAP_MS = 20
+
+
+# Return the number of lines in a line count like "10000", "10k", or "100M"
+def get_line_count(line_count):
+    line_count = line_count.strip().lower()
+    if (line_count[-1:] in LINE_COUNT_SUFFIXES):
+        return int(float(line_count[:-1]) * LINE_COUNT_SUFFIXES[line_count[-1]])
+    return int(line_count)
+
+
+# Return the literal text a separator in the config matches, since a log can't be
+# generated for a separator regex that matches more than one string
+def get_separator_text(separator):
+    separator_char = literal_char(separator)
+    if (separator_char == None):
+        raise ValueError("Can't generate a log for separator \"{}\"".format(separator))
+    return separator_char
+
+
+""" PerfLogGenerator class that generates lines of a synthetic perf log for an analysis config """
+class PerfLogGenerator:
+    def __init__(self, session, invalid_rate, violation_rate, seed):
+        self.random = random.Random(seed)
+        self.invalid_rate = invalid_rate
+        self.violation_rate = violation_rate
+        self.row_header = session.row_header
+        self.pair_separator = get_separator_text(session.pair_separator) + " "
+        self.field_separator = get_separator_text(session.field_separator)
+
+        # Timestamps, in the order their timing pairs give, with the max latency between
+        # each one and the next. Timing pairs spanning several steps, like the total time
+        # pair, aren't exceeded unless a step is.
+        timing_pairs = list(session.timing_pairs.values())
+        if (session.total_time != None):
+            timing_pairs.append(session.total_time)
+        self.time_keys = []
+        for timing_pair in timing_pairs:
+            for key in (timing_pair.start_key, timing_pair.end_key):
+                if (key not in self.time_keys):
+                    self.time_keys.append(key)
+        step_max_latencies = {(timing_pair.start_key, timing_pair.end_key): int(timing_pair.max_latency)
+                              for timing_pair in timing_pairs}
+        self.step_max_latencies = []
+        for start_key, end_key in zip(self.time_keys, self.time_keys[1:]):
+            self.step_max_latencies.append(step_max_latencies.get((start_key, end_key), 1000))
+        for timing_pair in timing_pairs:
+            start_index = self.time_keys.index(timing_pair.start_key)
+            end_index = self.time_keys.index(timing_pair.end_key)
+            span_max_latency = sum(self.step_max_latencies[start_index:end_index])
+            if (end_index - start_index > 1 and span_max_latency > int(timing_pair.max_latency)):
+                scale = int(timing_pair.max_latency) / span_max_latency
+                for step_index in range(start_index, end_index):
+                    self.step_max_latencies[step_index] = max(1, int(self.step_max_latencies[step_index] * scale))
+
+        self.group_values = {}
+        for timing_group in session.timing_groups.values():
+            self.group_values.setdefault(timing_group.log_field_key, []).append(timing_group.log_field_value)
+        for group_by in session.group_bys:
+            for key in group_by.log_field_keys:
+                self.group_values.setdefault(key, [])
+        for values in self.group_values.values():
+            values.append(OTHER_GROUP_VALUE)
+        self.other_keys = [key for key in session.log_fields
+                           if key not in self.time_keys and key not in self.group_values]
+        self.start_time = FIRST_ENTRY_TIME_MS
+
+    # Return a list of count lines, each ending in a newline
+    def get_lines(self, count):
+        rand = self.random.random
+        randint = self.random.randint
+        choice = self.random.choice
+        field_separator = self.field_separator
+        lines = []
+        for _ in range(count):
+            self.start_time += randint(0, MAX_ENTRY_GAP_MS)
+            timestamp = self.start_time
+            pairs = [self.time_keys[0] + field_separator + str(timestamp)] if self.time_keys else []
+            violation_step = -1
+            if (rand() < self.violation_rate and len(self.step_max_latencies) > 0):
+                violation_step = randint(0, len(self.step_max_latencies) - 1)
+            for step_index, max_latency in enumerate(self.step_max_latencies):
+                if (step_index == violation_step):
+                    timestamp += max_latency + randint(1, max_latency // 2 + 1)
+                else:
+                    timestamp += randint(1, max_latency)
+                pairs.append(self.time_keys[step_index + 1] + field_separator + str(timestamp))
+            for key, values in self.group_values.items():
+                pairs.append(key + field_separator + choice(values))
+            for key in self.other_keys:
+                pairs.append(key + field_separator + str(randint(1, FIELD_VALUE_COUNT)))
+
+            row_header = self.row_header
+            if (rand() < self.invalid_rate):
+                if (rand() < 0.5):
+                    row_header = "No-header"
+                else:
+                    pairs.append("invalid-pair")
+            lines.append("{} INFO {} {}\n".format(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.start_time // 1000)),
+                row_header, self.pair_separator.join(pairs)))
+        return lines
+
+
+# Write a perf log of line_count lines for the config in config_file to output_file
+def generate_perf_log(config_file, output_file, line_count, invalid_rate=0.01,
+                      violation_rate=0.05, seed=1):
+    session = AnalysisSession()
+    load_config(session, config_file)
+    generator = PerfLogGenerator(session, invalid_rate, violation_rate, seed)
+    with open(output_file + ".tmp", 'w') as perf_log:
+        lines_written = 0
+        while (lines_written < line_count):
+            batch_lines = min(WRITE_BATCH_LINES, line_count - lines_written)
+            perf_log.writelines(generator.get_lines(batch_lines))
+            lines_written += batch_lines
+    os.replace(output_file + ".tmp", output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic performance log.")
+    parser.add_argument("--lines", default="100k", help="Lines to write, e.g. 10k, 1M, or 100M")
+    parser.add_argument("--output", required=True, help="Performance log file to write")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_FILE, help="log_analyzer config file")
+    parser.add_argument("--invalid-rate", type=float, default=0.01,
+                        help="Share of lines with no row header or an invalid pair")
+    parser.add_argument("--violation-rate", type=float, default=0.05,
+                        help="Share of lines exceeding a timing pair's max latency")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    args = parser.parse_args()
+    generate_perf_log(args.config, args.output, get_line_count(args.lines), args.invalid_rate,
+                      args.violation_rate, args.seed)
+
+
+if __name__ == "__main__":
+    main()
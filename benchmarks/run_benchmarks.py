@@ -0,0 +1,247 @@
+"""
+Run Benchmarks - This script times the analyzer's stages on synthetic performance logs
+of several sizes, and writes the results to a JSON file so they can be compared across
+versions. For each size, a log is generated for the config (see generate_perf_log.py)
+and then analyzed in a separate process, timing parse_log_line, load_performance_log,
+analyze_performance_log, and write_analysis_results one after another. Each stage
+reports its seconds, lines/sec, MB/sec, and the process's peak RSS when it finished.
+The config's analysis options and result sinks are used, with the results and app log
+written to the work directory.
+
+Startup is timed too, since short runs, e.g. from cron, are mostly startup: the median
+secs of starting Python, of importing log_analyzer, and of whole runs on the smallest
+log, with the config's result sinks and with summary_only = True.
+
+Usage: python run_benchmarks.py [--sizes 10k,100k,1M] [--config log_analyzer.cfg]
+       [--work-dir benchmark_work] [--output benchmark_results.json]
+       [--invalid-rate 0.01] [--violation-rate 0.05] [--seed 1]
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from generate_perf_log import *
+
+try:
+    import resource
+except (ImportError):
+    resource = None # Not available on Windows, so peak RSS isn't reported
+
+# Version of the benchmark results file layout
+BENCHMARK_RESULTS_VERSION = 2
+
+# Most lines the parse_log_line stage parses, since they're held in memory first
+MAX_PARSE_SAMPLE_LINES = 1000 * 1000
+
+# Times each startup measurement is taken, of which the median is reported
+STARTUP_RUNS = 5
+
+
+# Return the peak RSS of this process in MB, or None if it isn't available
+def get_peak_rss_mb():
+    if (resource == None):
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if (sys.platform == "darwin"):
+        return round(peak_rss / (1024 * 1024), 1) # Bytes on macOS
+    return round(peak_rss / 1024, 1) # KB elsewhere
+
+
+# Return the results of a stage that took secs to process line_count lines of byte_count bytes
+def get_stage_results(secs, line_count, byte_count):
+    return {"secs": round(secs, 4), "lines": line_count,
+            "lines_per_sec": round(line_count / secs, 1) if secs > 0 else None,
+            "mb_per_sec": round(byte_count / (1024 * 1024) / secs, 3) if secs > 0 else None,
+            "peak_rss_mb": get_peak_rss_mb()}
+
+
+# Return a session set up to analyze perf_log_file with the config in config_file,
+# writing the results and app log to work_dir
+def get_benchmark_session(config_file, perf_log_file, work_dir, summary_only=False):
+    session = AnalysisSession()
+    session.run_start_time = session.stage_timer.start_section()
+    load_config(session, config_file)
+    session.perf_log_file_dir = os.path.dirname(perf_log_file)
+    session.perf_log_file_name = os.path.basename(perf_log_file)
+    session.perf_log_file = perf_log_file
+    session.perf_log_files = [perf_log_file]
+    session.app_log_file_dir = work_dir
+    session.app_log_file = os.path.join(work_dir, session.app_log_file_name)
+    session.quiet_mode = True
+    if (summary_only == True):
+        session.summary_only = True
+        set_summary_only(session)
+    if (verify_config(session) != True or setup(session) != True):
+        raise RuntimeError("Couldn't set up the analyzer with config " + config_file)
+    return session
+
+
+# Time each stage of analyzing perf_log_file with the config in config_file, writing
+# the results and app log to work_dir. Returns a dict of each stage's results.
+def time_stages(config_file, perf_log_file, work_dir):
+    session = get_benchmark_session(config_file, perf_log_file, work_dir)
+    stages = {}
+    log_bytes = os.path.getsize(perf_log_file)
+    try:
+        # Lines are read and decoded first, so only parsing is timed
+        with open(perf_log_file, 'rb') as perf_log:
+            sample_lines = [line.decode(errors='replace') for _, line
+                            in zip(range(MAX_PARSE_SAMPLE_LINES), perf_log)]
+        sample_bytes = sum(len(line) for line in sample_lines)
+        start_time = time.perf_counter()
+        for line_index, line in enumerate(sample_lines):
+            parse_log_line(session, line, line_index + 1)
+        stages["parse_log_line"] = get_stage_results(time.perf_counter() - start_time,
+                                                     len(sample_lines), sample_bytes)
+        sample_lines = None
+
+        start_time = time.perf_counter()
+        load_performance_log(session)
+        line_count = len(session.log_entry_list)
+        stages["load_performance_log"] = get_stage_results(time.perf_counter() - start_time,
+                                                           line_count, log_bytes)
+
+        start_time = time.perf_counter()
+        analyze_performance_log(session)
+        stages["analyze_performance_log"] = get_stage_results(time.perf_counter() - start_time,
+                                                              line_count, log_bytes)
+
+        start_time = time.perf_counter()
+        write_analysis_results(session)
+        stages["write_analysis_results"] = get_stage_results(time.perf_counter() - start_time,
+                                                             line_count, log_bytes)
+    finally:
+        session.logger.shutdown()
+    return stages
+
+
+# Analyze perf_log_file in a single pass and write the results, as a run of the
+# analyzer with the config in config_file would, or with summary_only = True
+def run_analysis(config_file, perf_log_file, work_dir, summary_only):
+    session = get_benchmark_session(config_file, perf_log_file, work_dir, summary_only)
+    try:
+        analyze_performance_log(session, get_analysis_entries(session, read_performance_log(session)))
+        write_analysis_results(session)
+    finally:
+        session.logger.shutdown()
+
+
+# Return the median wall secs of running Python with process_args STARTUP_RUNS times
+def time_process(process_args):
+    run_secs = []
+    for _ in range(STARTUP_RUNS):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable] + process_args, check=True, stdout=subprocess.DEVNULL,
+                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        run_secs.append(time.perf_counter() - start_time)
+    return round(sorted(run_secs)[len(run_secs) // 2], 4)
+
+
+# Time starting Python, importing log_analyzer, and whole runs on perf_log_file with
+# the config's result sinks and with summary_only = True. Returns a dict of the secs.
+def time_startup(args, perf_log_file):
+    run_args = [os.path.abspath(__file__), "--config", os.path.abspath(args.config),
+                "--run", os.path.abspath(perf_log_file), "--work-dir", os.path.abspath(args.work_dir)]
+    startup = {"lines": get_line_count(args.sizes.split(',')[0]),
+               "python_secs": time_process(["-c", "pass"]),
+               "import_secs": time_process(["-c", "import log_analyzer"]),
+               "run_secs": time_process(run_args),
+               "summary_only_run_secs": time_process(run_args + ["--summary-only"])}
+    # Importing log_analyzer is timed in a new process, so Python's own startup is taken off
+    startup["import_secs"] = round(max(0, startup["import_secs"] - startup["python_secs"]), 4)
+    return startup
+
+
+# Generate the perf log for a benchmark run in work_dir, unless it's already there, and
+# return its path
+def get_perf_log(args, line_count):
+    perf_log_file = os.path.join(args.work_dir, "perf-{}-{}-{}-{}.log".format(
+        line_count, args.invalid_rate, args.violation_rate, args.seed))
+    if (not os.path.exists(perf_log_file)):
+        print("Generating {} line performance log {}".format(line_count, perf_log_file))
+        generate_perf_log(args.config, perf_log_file, line_count, args.invalid_rate,
+                          args.violation_rate, args.seed)
+    return perf_log_file
+
+
+# Run the benchmark for each size, each in its own process so peak RSS is per size
+def run_benchmarks(args):
+    os.makedirs(args.work_dir, exist_ok=True)
+    benchmark_results = {"version": BENCHMARK_RESULTS_VERSION, "app_version": APP_VERSION,
+                         "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                         "python_version": platform.python_version(),
+                         "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                         "config": os.path.abspath(args.config), "invalid_rate": args.invalid_rate,
+                         "violation_rate": args.violation_rate, "seed": args.seed, "runs": []}
+    for size in args.sizes.split(','):
+        line_count = get_line_count(size)
+        perf_log_file = get_perf_log(args, line_count)
+        stages_file = os.path.join(args.work_dir, "stages.json")
+        print("Benchmarking {} lines".format(line_count))
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--config", args.config,
+                        "--time-stages", perf_log_file, "--work-dir", args.work_dir,
+                        "--output", stages_file], check=True)
+        with open(stages_file) as stages:
+            benchmark_results["runs"].append({"lines": line_count,
+                                              "bytes": os.path.getsize(perf_log_file),
+                                              "stages": json.load(stages)})
+        os.remove(stages_file)
+        for stage_name, stage_results in benchmark_results["runs"][-1]["stages"].items():
+            print("  {:<26} {:>9.3f} secs {:>12} lines/sec {:>9} MB/sec {:>8} MB peak RSS".format(
+                stage_name, stage_results["secs"], stage_results["lines_per_sec"],
+                stage_results["mb_per_sec"], stage_results["peak_rss_mb"]))
+
+    print("Benchmarking startup")
+    benchmark_results["startup"] = time_startup(args, get_perf_log(args, get_line_count(
+        args.sizes.split(',')[0])))
+    for name, value in benchmark_results["startup"].items():
+        print("  {:<26} {:>9}".format(name, value))
+
+    with open(args.output, 'w') as results_file:
+        json.dump(benchmark_results, results_file, indent=2)
+    print("Benchmark results written to " + args.output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the log analyzer's stages.")
+    parser.add_argument("--sizes", default="10k,100k,1M",
+                        help="Perf log line counts to benchmark, separated by commas")
+    parser.add_argument("--config", default=DEFAULT_CONFIG_FILE, help="log_analyzer config file")
+    parser.add_argument("--work-dir", default="benchmark_work",
+                        help="Directory for the generated logs and analysis results")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results file to write")
+    parser.add_argument("--invalid-rate", type=float, default=0.01,
+                        help="Share of lines with no row header or an invalid pair")
+    parser.add_argument("--violation-rate", type=float, default=0.05,
+                        help="Share of lines exceeding a timing pair's max latency")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed")
+    parser.add_argument("--time-stages", metavar="PERF_LOG", help=argparse.SUPPRESS)
+    parser.add_argument("--run", metavar="PERF_LOG", help=argparse.SUPPRESS)
+    parser.add_argument("--summary-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if (args.run != None):
+        # Run by time_startup() to time a whole run
+        run_analysis(args.config, args.run, args.work_dir, args.summary_only)
+    elif (args.time_stages != None):
+        # Run by run_benchmarks() to time one log's stages
+        stages = time_stages(args.config, args.time_stages, args.work_dir)
+        with open(args.output, 'w') as stages_file:
+            json.dump(stages, stages_file)
+    else:
+        run_benchmarks(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""
+Cache Utilities - This module provides an on-disk cache of parsed performance logs, so
+analyzing a log again with a different analysis config doesn't parse it again. Each
+log file's parsed fields are saved as typed columns in a binary cache file that's
+memory mapped when it's read back.
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+from array import array
+
+from input_util import *
+
+# Version of the parse cache file layout
+PARSE_CACHE_VERSION = 1
+
+# Rows of each column held in memory while a cache file is written or read
+CACHE_BLOCK_ROWS = 65536
+
+# Line kinds in the line_kinds column
+LINE_PARSED = 0 # Row header found
+LINE_NO_HEADER = 1 # Row header not found
+LINE_PROBLEM = 2 # Parsing failed, so the line has no log entry
+
+# Bytes each column's data is aligned to in a cache file
+COLUMN_ALIGNMENT = 8
+
+# Value of a missing field in an int column
+MISSING_INT = -2**63
+
+
+# Return a key identifying a log format, from the items of the log-format config section
+def get_log_format_key(log_format_items):
+    return hashlib.sha1(json.dumps(sorted(log_format_items)).encode()).hexdigest()
+
+
+""" ParseCache class that finds, reads, writes, and evicts parse cache files """
+class ParseCache:
+    # Cache files go in cache_dir, whose cache files are kept under max_bytes in total
+    # by removing the least recently used. log_format_key identifies the log format
+    # the cached logs were parsed with.
+    def __init__(self, cache_dir, max_bytes, log_format_key):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.log_format_key = log_format_key
+
+    def get_cache_file(self, log_file_path):
+        path_key = hashlib.sha1(os.path.abspath(log_file_path).encode()).hexdigest()
+        return os.path.join(self.cache_dir, path_key[:20] + ".cache")
+
+    # Return the path, size, and modification time that identify a log file's contents
+    def get_source(self, log_file_path):
+        file_stat = os.stat(log_file_path)
+        return {"path": os.path.abspath(log_file_path), "size": file_stat.st_size,
+                "mtime_ns": file_stat.st_mtime_ns}
+
+    # Return a CachedLog for a log file, or None if it isn't cached, it's changed since
+    # it was cached, it was cached with another log format, or the cache doesn't have
+    # all of keys. The log file must be uncompressed.
+    def read(self, log_file_path, keys):
+        cache_file = self.get_cache_file(log_file_path)
+        try:
+            cached_log = CachedLog(cache_file)
+        except (OSError, ValueError, KeyError):
+            return None # Not cached or not readable
+        header = cached_log.header
+        if (header["version"] != PARSE_CACHE_VERSION or
+                header["log_format_key"] != self.log_format_key or
+                header["source"] != self.get_source(log_file_path) or
+                not set(keys).issubset(header["keys"])):
+            cached_log.close()
+            return None
+        os.utime(cache_file) # Mark as recently used for eviction
+        return cached_log
+
+    # Return a ParseCacheWriter for caching a log file's parsed fields for keys
+    def create_writer(self, log_file_path, keys):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        return ParseCacheWriter(self, self.get_cache_file(log_file_path),
+                                self.get_source(log_file_path), keys)
+
+    # Remove the least recently used cache files until the rest fit in max_bytes
+    def evict(self):
+        cache_files = []
+        for file_name in os.listdir(self.cache_dir):
+            if (file_name.endswith(".cache")):
+                file_stat = os.stat(os.path.join(self.cache_dir, file_name))
+                cache_files.append((file_stat.st_mtime, file_stat.st_size, file_name))
+        total_bytes = sum(file_size for _, file_size, _ in cache_files)
+        for _, file_size, file_name in sorted(cache_files):
+            if (total_bytes <= self.max_bytes):
+                break
+            os.remove(os.path.join(self.cache_dir, file_name))
+            total_bytes -= file_size
+
+
+""" ParseCacheWriter class that collects a log file's parsed lines and writes their cache file """
+class ParseCacheWriter:
+    # Columns are held a block at a time and then appended to a temp file per column,
+    # which are joined into the cache file when it's closed. A key's values go in an
+    # int64 column, with MISSING_INT for a missing value, as long as every value is an
+    # integer that converts back to the same text. Otherwise they go in a string column
+    # of codes into a table of the key's values, with -1 for a missing value.
+    def __init__(self, parse_cache, cache_file, source, keys):
+        self.parse_cache = parse_cache
+        self.cache_file = cache_file
+        self.source = source
+        self.keys = sorted(keys)
+        self.line_count = 0
+        self.notes = {} # Line index -> invalid pairs, or the problem for LINE_PROBLEM lines
+        self.string_tables = {} # Key of a string column -> {value: code}
+        self.columns = {"line_starts": array('q'), "line_ends": array('q'), "line_kinds": array('b')}
+        for key in self.keys:
+            self.columns[key] = array('q')
+        self.column_files = {}
+        for column_name in self.columns:
+            self.column_files[column_name] = open(self.get_column_file(column_name), 'wb')
+
+    def get_column_file(self, column_name):
+        return "{}.{}.tmp".format(self.cache_file, hashlib.sha1(column_name.encode()).hexdigest()[:12])
+
+    # Add a parsed line, where fields and invalid_pairs are as returned by LineParser.parse()
+    # and fields is None if the row header wasn't found. problem is the message for a line
+    # that couldn't be parsed, which has no fields.
+    def add_line(self, line_start, line_end, fields, invalid_pairs, problem=None):
+        columns = self.columns
+        columns["line_starts"].append(line_start)
+        columns["line_ends"].append(line_end)
+        if (problem != None):
+            columns["line_kinds"].append(LINE_PROBLEM)
+            self.notes[self.line_count] = problem
+        elif (fields == None):
+            columns["line_kinds"].append(LINE_NO_HEADER)
+        else:
+            columns["line_kinds"].append(LINE_PARSED)
+            if (len(invalid_pairs) > 0):
+                self.notes[self.line_count] = invalid_pairs
+        if (fields == None):
+            fields = {}
+
+        string_tables = self.string_tables
+        for key in self.keys:
+            value = fields.get(key)
+            if (key in string_tables):
+                columns[key].append(-1 if value == None else
+                                    string_tables[key].setdefault(value, len(string_tables[key])))
+            elif (value == None):
+                columns[key].append(MISSING_INT)
+            else:
+                try:
+                    int_value = int(value)
+                    if (str(int_value) != value or not MISSING_INT < int_value < 2**63):
+                        raise ValueError()
+                    columns[key].append(int_value)
+                except (ValueError):
+                    self.convert_to_string_column(key)
+                    columns[key].append(string_tables[key].setdefault(value, len(string_tables[key])))
+
+        self.line_count += 1
+        if (len(columns["line_starts"]) >= CACHE_BLOCK_ROWS):
+            self.write_columns()
+
+    # Convert an int column, including the blocks already written, to a string column
+    def convert_to_string_column(self, key):
+        string_table = self.string_tables[key] = {}
+        self.column_files[key].close()
+        with open(self.get_column_file(key), 'rb') as int_file, \
+                open(self.get_column_file(key) + ".str", 'wb') as string_file:
+            int_block = int_file.read(CACHE_BLOCK_ROWS * 8)
+            while (len(int_block) > 0):
+                codes = array('i', [-1 if int_value == MISSING_INT else
+                                    string_table.setdefault(str(int_value), len(string_table))
+                                    for int_value in array('q', int_block)])
+                codes.tofile(string_file)
+                int_block = int_file.read(CACHE_BLOCK_ROWS * 8)
+        os.replace(self.get_column_file(key) + ".str", self.get_column_file(key))
+        self.column_files[key] = open(self.get_column_file(key), 'ab')
+        self.columns[key] = array('i', [-1 if int_value == MISSING_INT else
+                                        string_table.setdefault(str(int_value), len(string_table))
+                                        for int_value in self.columns[key]])
+
+    # Append the held block of each column to its temp file
+    def write_columns(self):
+        for column_name, column in self.columns.items():
+            column.tofile(self.column_files[column_name])
+            self.columns[column_name] = array(column.typecode)
+
+    # Write the cache file and remove the temp files, then evict old cache files
+    def close(self):
+        self.write_columns()
+        for column_file in self.column_files.values():
+            column_file.close()
+        header = {"version": PARSE_CACHE_VERSION, "log_format_key": self.parse_cache.log_format_key,
+                  "source": self.source, "keys": self.keys, "line_count": self.line_count,
+                  "byte_order": sys.byteorder, "columns": {},
+                  "string_tables": {key: list(string_table) for key, string_table
+                                    in self.string_tables.items()},
+                  "notes": self.notes}
+        try:
+            with open(self.cache_file + ".tmp", 'wb') as cache:
+                cache.write(struct.pack("<Q", 0)) # Header offset, filled in below
+                for column_name, column in self.columns.items():
+                    cache.write(b"\0" * (-cache.tell() % COLUMN_ALIGNMENT))
+                    column_offset = cache.tell()
+                    with open(self.get_column_file(column_name), 'rb') as column_file:
+                        column_block = column_file.read(1024 * 1024)
+                        while (len(column_block) > 0):
+                            cache.write(column_block)
+                            column_block = column_file.read(1024 * 1024)
+                    header["columns"][column_name] = [column_offset, cache.tell() - column_offset,
+                                                      column.typecode]
+                header_offset = cache.tell()
+                cache.write(json.dumps(header).encode())
+                cache.seek(0)
+                cache.write(struct.pack("<Q", header_offset))
+            os.replace(self.cache_file + ".tmp", self.cache_file)
+        finally:
+            self.remove_temp_files()
+        self.parse_cache.evict()
+
+    # Remove the temp files, without writing the cache file if it hasn't been written,
+    # e.g. when parsing stopped before the end of the log
+    def remove_temp_files(self):
+        for column_name, column_file in self.column_files.items():
+            column_file.close()
+            if (os.path.exists(self.get_column_file(column_name))):
+                os.remove(self.get_column_file(column_name))
+        if (os.path.exists(self.cache_file + ".tmp")):
+            os.remove(self.cache_file + ".tmp")
+
+
+""" CachedLog class that reads the parsed lines of a log file back from its memory mapped cache file """
+class CachedLog:
+    def __init__(self, cache_file):
+        self.cache_file = cache_file
+        with open(cache_file, 'rb') as cache:
+            self.mapped_cache = mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            header_offset = struct.unpack_from("<Q", self.mapped_cache, 0)[0]
+            self.header = json.loads(self.mapped_cache[header_offset:])
+            if (self.header["byte_order"] != sys.byteorder):
+                raise ValueError("Cache file has another byte order")
+        except (Exception):
+            self.close()
+            raise
+
+    # Return a column as a typed memoryview of the mapped cache file, without copying it
+    def get_column(self, column_name):
+        column_offset, column_bytes, typecode = self.header["columns"][column_name]
+        return memoryview(self.mapped_cache)[column_offset:column_offset + column_bytes].cast(typecode)
+
+    # Generator that yields a (line_view, line_number, fields, invalid_pairs, problem) tuple for
+    # each line of the cached log file, where line_view is a memoryview of the line, without its
+    # newline, in the memory mapped log file, fields is a dict of the values of keys in the line
+    # (None if the row header wasn't found), and problem is the message for a line that couldn't
+    # be parsed. Values are str, like LineParser.parse() returns them, except the values of
+    # int_keys, e.g. timestamps, are ints if they're in an int column.
+    def read_lines(self, log_file_path, keys, int_keys=()):
+        notes = self.header["notes"]
+        string_tables = self.header["string_tables"]
+        line_count = self.header["line_count"]
+        columns = [self.get_column(column_name) for column_name
+                   in ["line_starts", "line_ends", "line_kinds"] + list(keys)]
+        mapped_log = None
+        log_view = None
+        if (line_count > 0): # Empty files can't be mapped
+            with open(log_file_path, 'rb') as log_file:
+                mapped_log = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+            log_view = memoryview(mapped_log)
+        try:
+            for block_start in range(0, line_count, CACHE_BLOCK_ROWS):
+                block_end = min(block_start + CACHE_BLOCK_ROWS, line_count)
+                line_starts, line_ends, line_kinds = [column[block_start:block_end].tolist()
+                                                      for column in columns[:3]]
+                key_values = []
+                for key, column in zip(keys, columns[3:]):
+                    block_values = column[block_start:block_end].tolist()
+                    if (key in string_tables):
+                        string_table = string_tables[key]
+                        key_values.append([string_table[code] if code != -1 else None
+                                           for code in block_values])
+                    elif (key in int_keys):
+                        key_values.append([int_value if int_value != MISSING_INT else None
+                                           for int_value in block_values])
+                    else:
+                        key_values.append([str(int_value) if int_value != MISSING_INT else None
+                                           for int_value in block_values])
+                for block_index, line_values in enumerate(zip(*key_values) if len(keys) > 0
+                                                          else ((),) * (block_end - block_start)):
+                    line_index = block_start + block_index
+                    line_view = log_view[line_starts[block_index]:line_ends[block_index]]
+                    line_kind = line_kinds[block_index]
+                    if (line_kind == LINE_PROBLEM):
+                        yield (line_view, line_index + 1, None, [], notes[str(line_index)])
+                    elif (line_kind == LINE_NO_HEADER):
+                        yield (line_view, line_index + 1, None, [], None)
+                    else:
+                        fields = dict(zip(keys, line_values))
+                        if (None in line_values):
+                            fields = {key: value for key, value in fields.items() if value != None}
+                        yield (line_view, line_index + 1, fields, notes.get(str(line_index), []), None)
+        finally:
+            for column in columns:
+                column.release()
+            if (log_view != None):
+                log_view.release()
+                try:
+                    mapped_log.close()
+                except (BufferError):
+                    pass # Entries still hold views of lines. The map is closed once they're released.
+
+    def close(self):
+        try:
+            self.mapped_cache.close()
+        except (BufferError):
+            pass # Columns are still in use. The map is closed once they're released.
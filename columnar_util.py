@@ -0,0 +1,114 @@
+"""
+Columnar Utilities - This module provides NumPy versions of the per-entry latency
+calculations. The field values of a batch of log entries are gathered into column
+arrays so latencies, max latency violations, and latency stats are calculated for
+the whole batch at once. NumPy is only needed when the numpy analysis engine is used.
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import numpy as np
+
+from stats_util import *
+
+
+# Return a (values, present) tuple of arrays for the int field key, e.g. a timestamp,
+# in a list of log entry field dicts. values is an int64 array of the field's values,
+# with 0 where the field is missing, and present is a bool array of which entries have
+# the field.
+def get_int_column(field_dicts, key):
+    field_values = [fields.get(key) for fields in field_dicts]
+    present = np.array([field_value != None for field_value in field_values], dtype=bool)
+    values = np.array([field_value if field_value != None else 0
+                       for field_value in field_values], dtype=np.int64)
+    return (values, present)
+
+
+# Return a (deltas, present) tuple of arrays of end_key's value minus start_key's
+# value in a list of log entry field dicts, where present is a bool array of which
+# entries have both fields. int_columns is a dict of the get_int_column() columns
+# already made for the field dicts, and any new ones are added to it.
+def get_delta_column(field_dicts, int_columns, start_key, end_key):
+    for key in (start_key, end_key):
+        if (key not in int_columns):
+            int_columns[key] = get_int_column(field_dicts, key)
+    start_values, start_present = int_columns[start_key]
+    end_values, end_present = int_columns[end_key]
+    return (end_values - start_values, start_present & end_present)
+
+
+# Return a (codes, categories) tuple for a list of values, e.g. each entry's value
+# of a field, where categories maps each distinct value to its code and codes is
+# an int64 array of the code of each value.
+def get_category_column(values):
+    categories = {}
+    codes = np.array([categories.setdefault(value, len(categories)) for value in values],
+                     dtype=np.int64)
+    return (codes, categories)
+
+
+# Return get_category_column() for each entry's value of the field key in a list of log
+# entry field dicts, with None for a missing value. category_columns is a dict of the
+# columns already made for the field dicts, and a new one is added to it.
+def get_field_category_column(field_dicts, category_columns, key):
+    if (key not in category_columns):
+        category_columns[key] = get_category_column([fields.get(key) for fields in field_dicts])
+    return category_columns[key]
+
+
+# Return a (codes, group_values) tuple for grouping a list of log entry field dicts by
+# their combination of values for the field keys. group_values is a list of each
+# distinct combination as a tuple, with None for a missing value, and codes is an
+# int64 array of the index in group_values of each entry's combination.
+def get_group_column(field_dicts, category_columns, keys):
+    key_columns = [get_field_category_column(field_dicts, category_columns, key) for key in keys]
+    if (len(key_columns) == 1):
+        codes, categories = key_columns[0]
+        return (codes, [(value,) for value in categories])
+    combinations, codes = np.unique(np.stack([codes for codes, _ in key_columns], axis=1),
+                                    axis=0, return_inverse=True)
+    key_values = [list(categories) for _, categories in key_columns]
+    group_values = [tuple([values[code] for values, code in zip(key_values, combination)])
+                    for combination in combinations.tolist()]
+    return (codes.reshape(-1), group_values)
+
+
+# Return the number of bits needed to represent each of an array of non-negative values
+def get_bit_lengths(values):
+    bit_lengths = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        has_high_bits = (values >= (1 << shift))
+        bit_lengths += np.where(has_high_bits, shift, 0)
+        values = np.where(has_high_bits, values >> shift, values)
+    return bit_lengths + (values > 0)
+
+
+# Return the histogram bucket index of each of an array of latencies. Matches
+# get_bucket_index() in stats_util for every latency.
+def get_bucket_indexes(latencies):
+    magnitudes = np.abs(latencies)
+    shifts = np.maximum(0, get_bit_lengths(magnitudes) - SUB_BUCKET_BITS)
+    bucket_indexes = (shifts << (SUB_BUCKET_BITS - 1)) + (magnitudes >> shifts)
+    return np.where(latencies < 0, -1 - bucket_indexes, bucket_indexes)
+
+
+# Return a LatencyStats holding an array of latencies
+def get_latency_stats(latencies):
+    latency_stats = LatencyStats()
+    if (len(latencies) == 0):
+        return latency_stats
+    latency_stats.count = len(latencies)
+    latency_stats.total_latency = int(latencies.sum())
+    latency_stats.min_latency = int(latencies.min())
+    latency_stats.max_latency = int(latencies.max())
+
+    bucket_indexes = get_bucket_indexes(latencies)
+    first_bucket_index = int(bucket_indexes.min())
+    bucket_counts = np.bincount(bucket_indexes - first_bucket_index)
+    used_buckets = np.flatnonzero(bucket_counts)
+    latency_stats.histogram.count = len(latencies)
+    latency_stats.histogram.bucket_counts = dict(zip((used_buckets + first_bucket_index).tolist(),
+                                                     bucket_counts[used_buckets].tolist()))
+    return latency_stats
@@ -0,0 +1,107 @@
+"""
+Correlation Utilities - This module provides a join table for correlating log lines
+that share a key value, e.g. a record key logged on a line for each processing stage,
+into one logical record. Incomplete records are evicted when they've waited too long
+or the table is full, so memory stays bounded when some lines never show up.
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+# Reasons a record leaves the join table
+RECORD_COMPLETE = "complete"
+RECORD_EVICTED_TTL = "evicted after TTL"
+RECORD_EVICTED_SIZE = "evicted as join table full"
+RECORD_END_OF_LOG = "incomplete at end of log"
+
+
+""" PendingRecord class that holds the lines joined so far for one key value """
+class PendingRecord:
+    __slots__ = ("key_value", "fields", "entries", "start_time")
+
+    def __init__(self, key_value, start_time):
+        self.key_value = key_value
+        self.fields = {} # Fields of the joined lines. The first line with a field gives its value.
+        self.entries = [] # Joined log entries, in the order they were added
+        self.start_time = start_time # Earliest timestamp of the record, in ms
+
+
+""" JoinTable class that joins log lines into records by key value """
+class JoinTable:
+    # A record is complete once it has all of complete_keys. Incomplete records are
+    # evicted once the latest timestamp seen is more than ttl_ms past their start, or
+    # oldest first when more than max_records are pending. Time is log time, taken
+    # from the lines' timestamps, so replaying a log evicts the same records as
+    # following it did.
+    def __init__(self, complete_keys, ttl_ms, max_records):
+        self.complete_keys = tuple(complete_keys)
+        self.ttl_ms = ttl_ms
+        self.max_records = max_records
+        self.pending_records = {} # Key value -> PendingRecord, oldest first
+        self.latest_time = None # Latest timestamp seen, in ms
+        self.lines_joined = 0
+        self.reason_counts = {RECORD_COMPLETE: 0, RECORD_EVICTED_TTL: 0, RECORD_EVICTED_SIZE: 0,
+                              RECORD_END_OF_LOG: 0}
+        self.most_pending = 0
+
+    # Add a line's entry and fields to the record for key_value, where timestamps are
+    # the line's timestamps in ms. Returns a list of (record, reason) tuples for the
+    # records that left the table as a result, oldest first.
+    def add(self, key_value, fields, entry, timestamps):
+        self.lines_joined += 1
+        line_time = min(timestamps) if len(timestamps) > 0 else self.latest_time
+        if (len(timestamps) > 0 and (self.latest_time == None or max(timestamps) > self.latest_time)):
+            self.latest_time = max(timestamps)
+
+        left_records = []
+        record = self.pending_records.get(key_value)
+        if (record == None):
+            record = self.pending_records[key_value] = PendingRecord(key_value, line_time)
+            if (len(self.pending_records) > self.max_records):
+                oldest_key_value = next(iter(self.pending_records))
+                left_records.append((self.pending_records.pop(oldest_key_value), RECORD_EVICTED_SIZE))
+            self.most_pending = max(self.most_pending, len(self.pending_records))
+        elif (line_time != None and (record.start_time == None or line_time < record.start_time)):
+            record.start_time = line_time
+        record.entries.append(entry)
+        for key, value in fields.items():
+            record.fields.setdefault(key, value)
+
+        if (all(key in record.fields for key in self.complete_keys)):
+            del self.pending_records[key_value]
+            left_records.append((record, RECORD_COMPLETE))
+        left_records.extend(self.evict_expired())
+        for _, reason in left_records:
+            self.reason_counts[reason] += 1
+        return left_records
+
+    # Remove and return the records that have waited longer than the TTL. Records are
+    # checked oldest first, stopping at the first one that hasn't expired.
+    def evict_expired(self):
+        expired_records = []
+        if (self.latest_time == None or self.ttl_ms <= 0):
+            return expired_records
+        while (len(self.pending_records) > 0):
+            oldest_record = next(iter(self.pending_records.values()))
+            if (oldest_record.start_time == None):
+                oldest_record.start_time = self.latest_time # Added before any timestamps were seen
+            if (self.latest_time - oldest_record.start_time <= self.ttl_ms):
+                break
+            del self.pending_records[oldest_record.key_value]
+            expired_records.append((oldest_record, RECORD_EVICTED_TTL))
+        return expired_records
+
+    # Remove and return all the pending records, at the end of the log
+    def drain(self):
+        left_records = [(record, RECORD_END_OF_LOG) for record in self.pending_records.values()]
+        self.pending_records = {}
+        self.reason_counts[RECORD_END_OF_LOG] += len(left_records)
+        return left_records
+
+    # Add the record counts of another JoinTable, e.g. from another host's analysis
+    def merge_counts(self, other):
+        self.lines_joined += other.lines_joined
+        for reason, count in other.reason_counts.items():
+            self.reason_counts[reason] += count
+        self.most_pending = max(self.most_pending, other.most_pending)
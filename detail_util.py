@@ -0,0 +1,87 @@
+"""
+Detail Utilities - This module provides the bounded selection of log details rows for
+the detail policies that don't write every analyzed entry: the top N slowest entries,
+or a uniform sample of N entries. It also keeps each timing pair's worst max latency
+violations. Either way, a fixed number of rows is held however long the log is, and
+selections made in separate processes can be merged exactly.
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import heapq
+import zlib
+
+# Log details policies that can be set in the log_details_policy config option
+LOG_DETAILS_POLICIES = ("all", "none", "violations", "top_n", "sample")
+
+# Seed of the sample policy's row ranks, so the same log always gives the same sample
+SAMPLE_RANK_SEED = 0x9E3779B97F4A7C15
+
+MASK_64 = (1 << 64) - 1
+
+
+# Return the sample rank of the entry on log_line of log_file, a 64-bit hash of the two.
+# Keeping the rows with the highest ranks samples the entries uniformly, and since an
+# entry's rank doesn't depend on which process analyzed it or what came before it,
+# samples of separate parts of a log merge into the sample of the whole log.
+def get_sample_rank(log_file, log_line):
+    value = (((zlib.crc32(log_file.encode()) if log_file != None else 0) << 32) ^ log_line ^
+             SAMPLE_RANK_SEED) & MASK_64
+    # splitmix64 finalizer, so nearby line numbers get unrelated ranks
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return value ^ (value >> 31)
+
+
+""" DetailRowHeap class that keeps the max_rows log details rows with the highest ranks """
+class DetailRowHeap:
+    # Rows are kept in a min-heap of (rank, -sequence, row), so the root is the row to
+    # drop next. Of rows with the same rank, the earliest added are kept.
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.heap = []
+        self.sequence = 0 # Rows offered so far, which orders the rows in log order
+
+    # Return whether a row with rank would be kept, so callers only build rows that are
+    def would_keep(self, rank):
+        return (len(self.heap) < self.max_rows or (self.max_rows > 0 and rank > self.heap[0][0]))
+
+    # Offer a row with rank. Call would_keep() first to skip building rows that won't be kept.
+    def add(self, rank, row):
+        self.sequence += 1
+        if (len(self.heap) < self.max_rows):
+            heapq.heappush(self.heap, (rank, -self.sequence, row))
+        elif (self.max_rows > 0 and rank > self.heap[0][0]):
+            heapq.heapreplace(self.heap, (rank, -self.sequence, row))
+
+    # Count a row that wasn't offered since would_keep() was False for it
+    def skip(self):
+        self.sequence += 1
+
+    # Return the kept rows, highest rank first if by_rank is True, otherwise in log order
+    def get_rows(self, by_rank):
+        if (by_rank):
+            return [row for _, _, row in sorted(self.heap, reverse=True)]
+        return [row for _, _, row in sorted(self.heap, key=lambda item: -item[1])]
+
+    # Add the rows kept by another DetailRowHeap, for a later part of the log
+    def merge(self, other):
+        skipped_count = other.sequence - len(other.heap)
+        for rank, _, row in sorted(other.heap, key=lambda item: -item[1]):
+            self.add(rank, row)
+        self.sequence += skipped_count
+
+    # Return the kept rows as a dict that can be saved as JSON
+    def to_dict(self):
+        return {"max_rows": self.max_rows, "sequence": self.sequence,
+                "rows": [[rank, -negative_sequence, row] for rank, negative_sequence, row in self.heap]}
+
+    # Replace the kept rows with those in a dict from to_dict()
+    def load_dict(self, heap_dict):
+        self.sequence = heap_dict["sequence"]
+        self.heap = [(rank, -sequence, tuple(row)) for rank, sequence, row in heap_dict["rows"]]
+        heapq.heapify(self.heap)
+        while (len(self.heap) > self.max_rows):
+            heapq.heappop(self.heap)
@@ -11,6 +11,9 @@ import os
 from openpyxl import Workbook # Using https://openpyxl.readthedocs.io/en/stable/tutorial.html for write to Excel
 from openpyxl.styles import *
 
+# Most rows an Excel worksheet can hold
+EXCEL_MAX_ROWS = 1048576
+
 """ XLSFormat class that contains formatting details for Excel data """
 class XLSFormat:
     wb = None
@@ -34,33 +37,97 @@ class XLSDoc:
     excel_file_name = ""
     excel_file_dir = ""
     excel_file = ""
+    write_only = False
 
-    def __init__(self, excel_file_dir, excel_file_name):
+    # In write_only mode the workbook streams appended rows to disk instead of
+    # keeping a cell object for every value, and can only be saved once. Cells
+    # written with write_cell are held until save_doc and written then, so use
+    # write_cell for small sheets and append_row for large ones.
+    def __init__(self, excel_file_dir, excel_file_name, write_only=False):
         self.excel_file_name = excel_file_name
         self.excel_file_dir = excel_file_dir
         self.excel_file = os.path.join(excel_file_dir, excel_file_name)
+        self.write_only = write_only
+        self.held_cells = {} # Worksheet -> {(row, col): value} for write_only mode
 
-        self.wb = Workbook()
-        ws = self.wb.active
+        self.wb = Workbook(write_only=write_only)
 
     def save_doc(self):
+        if (self.write_only):
+            for ws, cells in self.held_cells.items():
+                self.append_held_cells(ws, cells)
+            self.held_cells = {}
         self.wb.save(self.excel_file)
 
     def create_worksheet(self, sheet_name, index):
-        self.wb.create_sheet(sheet_name, index) 
-        return self.wb[sheet_name]
+        return self.wb.create_sheet(sheet_name, index)
+
+    # Create a worksheet that rolls over to "sheet_name 2", "sheet_name 3", etc.
+    # when it reaches max_rows. Returns an XLSShardedSheet to append rows to.
+    def create_sharded_worksheet(self, sheet_name, index, max_rows=EXCEL_MAX_ROWS):
+        return XLSShardedSheet(self, sheet_name, index, max_rows)
 
     def delete_worksheet(self, sheet_name):
-        self.wb.remove(self.wb[sheet_name])
+        if (sheet_name in self.wb.sheetnames):
+            self.wb.remove(self.wb[sheet_name])
 
     def get_worksheet_by_name(self, sheet_name):
         return self.wb[sheet_name]
 
     def write_cell(self, ws, ws_row, ws_col, cell_value):
-        ws.cell(row=ws_row, column=ws_col).value = cell_value 
+        if (self.write_only):
+            self.held_cells.setdefault(ws, {})[(ws_row, ws_col)] = cell_value
+        else:
+            ws.cell(row=ws_row, column=ws_col).value = cell_value 
+
+    def append_row(self, ws, row_values):
+        ws.append(row_values)
+
+    # Append cells held for a write_only worksheet as rows, filling gaps with empty cells
+    def append_held_cells(self, ws, cells):
+        last_row = max(ws_row for ws_row, ws_col in cells)
+        last_col = max(ws_col for ws_row, ws_col in cells)
+        for ws_row in range(1, last_row + 1):
+            ws.append([cells.get((ws_row, ws_col)) for ws_col in range(1, last_col + 1)])
 
     def write_cell_with_format(self, ws, ws_row, ws_col, cell_value, font):
         ws.cell(row=ws_row, column=ws_col).value = cell_value 
         ws.cell(row=ws_row, column=ws_col).font = Font(bold=True)
         ws.cell(row=ws_row, column=ws_col).alignment = Alignment(
             horizontal="center", vertical="center")
+
+
+""" XLSShardedSheet class that spreads appended rows over as many worksheets as needed """
+class XLSShardedSheet:
+    def __init__(self, xls_doc, sheet_name, index, max_rows=EXCEL_MAX_ROWS):
+        self.xls_doc = xls_doc
+        self.sheet_name = sheet_name
+        self.index = index
+        self.max_rows = max_rows
+        self.header_row = None # Repeated as the first row of each worksheet
+        self.shard_count = 0
+        self.ws = None
+        self.ws_row_count = 0
+        self.add_shard()
+
+    # Append the header row and repeat it at the top of each later worksheet
+    def set_header_row(self, header_row):
+        self.header_row = header_row
+        self.append_row(header_row)
+
+    def append_row(self, row_values):
+        if (self.ws_row_count >= self.max_rows):
+            self.add_shard()
+            if (self.header_row != None):
+                self.xls_doc.append_row(self.ws, self.header_row)
+                self.ws_row_count += 1
+        self.xls_doc.append_row(self.ws, row_values)
+        self.ws_row_count += 1
+
+    def add_shard(self):
+        self.shard_count += 1
+        shard_name = self.sheet_name
+        if (self.shard_count > 1):
+            shard_name = "{} {}".format(self.sheet_name, self.shard_count)
+        self.ws = self.xls_doc.create_worksheet(shard_name, self.index + self.shard_count - 1)
+        self.ws_row_count = 0
@@ -0,0 +1,237 @@
+"""
+Filter Utilities - This module provides the analysis filter, a predicate on log entry
+fields like "Table=store_item AND DB-ACTION=UPDATE" that's compiled once. Besides
+checking parsed fields exactly, a filter gives a pre-check that rejects most lines
+that can't match with a substring scan, before they're parsed.
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import re
+
+# Most alternatives a pre-check is expanded to. Past that, lines aren't pre-checked.
+MAX_PRECHECK_ALTERNATIVES = 64
+
+# Filter tokens: parentheses, comparison operators, quoted values, and bare words
+FILTER_TOKEN_REGEX = re.compile(r'\s*(?:(\(|\))|(!=|<=|>=|=|<|>)|"((?:[^"\\]|\\.)*)"|([^\s()!=<>"]+))')
+
+
+# Return the tokens of filter text as a list of (kind, text) tuples, where kind is
+# "paren", "operator", "value" (quoted), or "word"
+def get_filter_tokens(filter_text):
+    tokens = []
+    position = 0
+    filter_text = filter_text.strip()
+    while (position < len(filter_text)):
+        token_match = FILTER_TOKEN_REGEX.match(filter_text, position)
+        if (token_match == None or token_match.end() == position):
+            raise ValueError("Invalid filter \"{}\" at \"{}\"".format(filter_text, filter_text[position:]))
+        paren, operator, quoted, word = token_match.groups()
+        if (paren != None):
+            tokens.append(("paren", paren))
+        elif (operator != None):
+            tokens.append(("operator", operator))
+        elif (quoted != None):
+            tokens.append(("value", re.sub(r'\\(.)', r'\1', quoted)))
+        else:
+            tokens.append(("word", word))
+        position = token_match.end()
+    return tokens
+
+
+# Return a field value and a filter value in a form they can be compared in: as ints
+# if they're both integers, otherwise as str
+def get_comparable_values(field_value, filter_value, filter_int_value):
+    if (filter_int_value != None):
+        if (isinstance(field_value, int)):
+            return (field_value, filter_int_value)
+        try:
+            return (int(field_value), filter_int_value)
+        except (ValueError):
+            pass
+    return (str(field_value), filter_value)
+
+
+""" FilterCondition class that compares one log field's value to a value """
+class FilterCondition:
+    def __init__(self, key, operator, value):
+        self.key = key
+        self.operator = operator
+        self.value = value
+        try:
+            self.int_value = int(value)
+        except (ValueError):
+            self.int_value = None
+
+    def matches(self, fields):
+        field_value = fields.get(self.key)
+        if (field_value == None):
+            return (self.operator == "!=") # A missing field isn't equal to anything
+        if (self.operator == "=" or self.operator == "!="):
+            if (field_value == self.value or (self.int_value != None and field_value == self.int_value)):
+                return (self.operator == "=")
+            return (self.operator == "!=")
+        field_value, value = get_comparable_values(field_value, self.value, self.int_value)
+        if (self.operator == "<"):
+            return field_value < value
+        if (self.operator == "<="):
+            return field_value <= value
+        if (self.operator == ">"):
+            return field_value > value
+        return field_value >= value
+
+    # A matching line has the value in it, as long as values don't have spaces in them,
+    # which the parser removes. Other conditions can match any line. Timestamps are
+    # compared as ints, so an integer value is checked by its digits alone (123 matches
+    # 0123 and +123 in a line), and one not written the usual way, like 0123, isn't checked.
+    def get_precheck(self):
+        if (self.operator != "=" or self.value == ""):
+            return None
+        if (self.int_value != None):
+            if (str(self.int_value) != self.value):
+                return None
+            return [(str(abs(self.int_value)),)]
+        return [(self.value,)]
+
+    def get_keys(self):
+        return {self.key}
+
+
+""" FilterOperation class that combines filter nodes with AND, OR, or NOT """
+class FilterOperation:
+    def __init__(self, operation, operands):
+        self.operation = operation
+        self.operands = operands
+
+    def matches(self, fields):
+        if (self.operation == "AND"):
+            return all(operand.matches(fields) for operand in self.operands)
+        if (self.operation == "OR"):
+            return any(operand.matches(fields) for operand in self.operands)
+        return not self.operands[0].matches(fields)
+
+    # Return the pre-check as a list of alternatives, each a tuple of substrings a line
+    # needs all of, where a line that can match has at least one alternative's. None
+    # means any line can match.
+    def get_precheck(self):
+        if (self.operation == "NOT"):
+            return None
+        operand_prechecks = [operand.get_precheck() for operand in self.operands]
+        if (self.operation == "OR"):
+            if (None in operand_prechecks):
+                return None
+            precheck = [alternative for operand_precheck in operand_prechecks
+                        for alternative in operand_precheck]
+            return precheck if len(precheck) <= MAX_PRECHECK_ALTERNATIVES else None
+
+        # A line matching all the operands has one alternative of each. Operands that
+        # can match any line are left out.
+        precheck = [()]
+        for operand_precheck in operand_prechecks:
+            if (operand_precheck == None):
+                continue
+            if (len(precheck) * len(operand_precheck) > MAX_PRECHECK_ALTERNATIVES):
+                continue # Check fewer substrings rather than too many alternatives
+            precheck = [alternative + operand_alternative for alternative in precheck
+                        for operand_alternative in operand_precheck]
+        return None if precheck == [()] else precheck
+
+    def get_keys(self):
+        return set().union(*[operand.get_keys() for operand in self.operands])
+
+
+""" LineFilter class that is compiled once from filter text and then checks log lines and fields """
+class LineFilter:
+    # Filter text is conditions like key=value, key!=value, or key<value (also <=, >,
+    # >=, compared as integers if both sides are), combined with AND, OR, NOT, and
+    # parentheses. Values with spaces or operator chars can be quoted.
+    def __init__(self, filter_text):
+        self.filter_text = filter_text
+        self.tokens = get_filter_tokens(filter_text)
+        self.position = 0
+        self.root = self.parse_or()
+        if (self.position < len(self.tokens)):
+            raise ValueError("Invalid filter \"{}\" at \"{}\"".format(filter_text,
+                                                                      self.tokens[self.position][1]))
+        self.tokens = None
+
+        precheck = self.root.get_precheck()
+        self.precheck = precheck
+        self.precheck_bytes = None
+        if (precheck != None):
+            self.precheck_bytes = [tuple(substring.encode() for substring in alternative)
+                                   for alternative in precheck]
+
+    # Recursive descent parser for filter text: OR binds loosest, then AND, then NOT
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while (self.is_word("OR")):
+            self.position += 1
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else FilterOperation("OR", operands)
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while (self.is_word("AND")):
+            self.position += 1
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else FilterOperation("AND", operands)
+
+    def parse_not(self):
+        if (self.is_word("NOT")):
+            self.position += 1
+            return FilterOperation("NOT", [self.parse_not()])
+        if (self.position < len(self.tokens) and self.tokens[self.position] == ("paren", "(")):
+            self.position += 1
+            node = self.parse_or()
+            if (self.position >= len(self.tokens) or self.tokens[self.position] != ("paren", ")")):
+                raise ValueError("Invalid filter \"{}\": missing \")\"".format(self.filter_text))
+            self.position += 1
+            return node
+        condition_tokens = self.tokens[self.position:self.position + 3]
+        if (len(condition_tokens) != 3 or condition_tokens[0][0] != "word" or
+                condition_tokens[1][0] != "operator" or condition_tokens[2][0] not in ("word", "value")):
+            raise ValueError("Invalid filter \"{}\": expected a condition like key=value".format(
+                self.filter_text))
+        self.position += 3
+        return FilterCondition(condition_tokens[0][1], condition_tokens[1][1], condition_tokens[2][1])
+
+    def is_word(self, word):
+        return (self.position < len(self.tokens) and self.tokens[self.position][0] == "word" and
+                self.tokens[self.position][1].upper() == word)
+
+    # Return the log field keys the filter checks
+    def get_keys(self):
+        return self.root.get_keys()
+
+    # Return whether a log line might match, checking only for the filter's values in
+    # it. False means it can't match, so it doesn't need to be parsed.
+    def may_match_text(self, line):
+        if (self.precheck == None):
+            return True
+        for alternative in self.precheck:
+            for substring in alternative:
+                if (substring not in line):
+                    break
+            else:
+                return True
+        return False
+
+    # may_match_text() for the line in buffer[start:end], without copying it
+    def may_match_buffer(self, buffer, start, end):
+        if (self.precheck_bytes == None):
+            return True
+        find = buffer.find
+        for alternative in self.precheck_bytes:
+            for substring in alternative:
+                if (find(substring, start, end) == -1):
+                    break
+            else:
+                return True
+        return False
+
+    # Return whether parsed log entry fields match the filter
+    def matches(self, fields):
+        return self.root.matches(fields)
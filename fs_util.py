@@ -44,3 +44,39 @@ def is_file_writable(file_path):
             return False
     else:
         return False
+
+
+# Split a file into byte ranges of roughly chunk_size bytes. Each range ends
+# just after a newline (or at the end of the file) so no line spans two ranges.
+# Returns a list of (start, end) tuples.
+def get_file_chunks(file_path, chunk_size):
+    file_size = os.path.getsize(file_path)
+    chunks = []
+    with open(file_path, 'rb') as chunk_file:
+        start = 0
+        while (start < file_size):
+            end = start + chunk_size
+            if (end >= file_size):
+                end = file_size
+            else:
+                chunk_file.seek(end - 1)
+                chunk_file.readline() # Move to the end of the line the range ends in
+                end = chunk_file.tell()
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+# Count the lines in the byte range [start, end) of a file
+def count_lines(file_path, start, end, block_size=1024 * 1024):
+    line_count = 0
+    with open(file_path, 'rb') as count_file:
+        count_file.seek(start)
+        remaining = end - start
+        while (remaining > 0):
+            block = count_file.read(min(block_size, remaining))
+            if (not block):
+                break
+            line_count += block.count(b"\n")
+            remaining -= len(block)
+    return line_count
@@ -0,0 +1,140 @@
+"""
+Input Utilities - This module provides functionality to find and read performance
+logs that may be compressed (gzip, bz2, xz) and split over a set of rotated files, and
+to read uncompressed logs through a memory map.
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import os
+import re
+import bz2
+import glob
+import gzip
+import lzma
+import mmap
+import queue
+import threading
+
+# Openers for compressed files by file extension. Other files are read as is.
+COMPRESSED_FILE_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open, ".lzma": lzma.open}
+
+# Bytes of lines read per batch handed from the background reader thread to the parser
+READ_BATCH_BYTES = 512 * 1024
+
+# Batches the background reader thread can get ahead of the parser
+READ_QUEUE_BATCHES = 16
+
+
+def is_compressed_file(file_path):
+    return os.path.splitext(file_path)[1].lower() in COMPRESSED_FILE_OPENERS
+
+
+# Open a log file for reading as bytes, decompressing it as it's read if it's compressed
+def open_log_file(file_path):
+    opener = COMPRESSED_FILE_OPENERS.get(os.path.splitext(file_path)[1].lower())
+    if (opener == None):
+        return open(file_path, 'rb')
+    return opener(file_path, 'rb')
+
+
+# Return the log files in directory matching file_name, which may be a glob pattern
+# like "app.log*", ordered oldest first. Rotated files are ordered by their rotation
+# number, so app.log.2.gz comes before app.log.1.gz, which comes before app.log.
+def find_log_files(directory, file_name):
+    if (not glob.has_magic(file_name)):
+        return [os.path.join(directory, file_name)]
+    file_paths = [file_path for file_path in glob.glob(os.path.join(directory, file_name))
+                  if os.path.isfile(file_path)]
+    return sorted(file_paths, key=get_rotation_sort_key)
+
+
+# Sort key that orders a rotated log set oldest first
+def get_rotation_sort_key(file_path):
+    file_name = os.path.basename(file_path)
+    if (is_compressed_file(file_name)):
+        file_name = os.path.splitext(file_name)[0]
+    rotation_match = re.match(r"^(.*)\.(\d+)$", file_name)
+    if (rotation_match != None):
+        return (rotation_match.group(1), -int(rotation_match.group(2)))
+    return (file_name, 0)
+
+
+# Generator that reads the lines of each file in file_paths in order, yielding
+# (file_path, line_number, line) tuples, where line_number starts at 1 in each file
+# and line is bytes. Reading and decompressing happen on a background thread so they
+# overlap with whatever the caller does with the lines.
+def read_log_lines(file_paths):
+    line_batches = queue.Queue(maxsize=READ_QUEUE_BATCHES)
+    stop_reading = threading.Event()
+    reader = threading.Thread(target=read_line_batches, daemon=True,
+                              args=(file_paths, line_batches, stop_reading))
+    reader.start()
+    try:
+        while (True):
+            line_batch = line_batches.get()
+            if (line_batch == None):
+                break
+            if (isinstance(line_batch, Exception)):
+                raise line_batch
+            file_path, line_number, lines = line_batch
+            for line in lines:
+                yield (file_path, line_number, line)
+                line_number += 1
+    finally:
+        stop_reading.set()
+        while (reader.is_alive()): # Unblock the reader if it's waiting on a full queue
+            try:
+                line_batches.get_nowait()
+            except (queue.Empty):
+                reader.join(0.1)
+
+
+# Background thread that reads the files in batches of lines into line_batches,
+# followed by None when done, or by the exception that stopped it
+def read_line_batches(file_paths, line_batches, stop_reading):
+    try:
+        for file_path in file_paths:
+            with open_log_file(file_path) as log_file:
+                line_number = 1
+                lines = log_file.readlines(READ_BATCH_BYTES)
+                while (len(lines) > 0 and not stop_reading.is_set()):
+                    line_batches.put((file_path, line_number, lines))
+                    line_number += len(lines)
+                    lines = log_file.readlines(READ_BATCH_BYTES)
+            if (stop_reading.is_set()):
+                return
+        line_batches.put(None)
+    except (Exception) as error:
+        line_batches.put(error)
+
+
+# Generator that memory maps an uncompressed log file and yields a (mapped_log, log_view,
+# start, end) tuple for each line in the byte range [start, end) of the file (the whole
+# file if end is None), where mapped_log[start:end] is the line including its newline
+# and log_view is a memoryview of mapped_log. Lines are found and handed out as offsets,
+# so nothing is read, decoded, or copied unless it's used.
+def map_log_lines(file_path, start=0, end=None):
+    with open(file_path, 'rb') as log_file:
+        if (os.fstat(log_file.fileno()).st_size == 0):
+            return # Empty files can't be mapped
+        mapped_log = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+    log_view = memoryview(mapped_log)
+    try:
+        if (end == None):
+            end = len(mapped_log)
+        find_newline = mapped_log.find
+        while (start < end):
+            line_end = find_newline(b"\n", start, end) + 1
+            if (line_end == 0):
+                line_end = end # Last line has no newline
+            yield (mapped_log, log_view, start, line_end)
+            start = line_end
+    finally:
+        log_view.release()
+        try:
+            mapped_log.close()
+        except (BufferError):
+            pass # Entries still hold views of lines. The map is closed once they're released.
@@ -21,13 +21,27 @@ import configparser
 import os
 import sys
 import re
+import json
+import socket
+import hashlib
+import importlib.util
 from datetime import datetime
 from enum import Enum
+from itertools import islice
+from collections import deque
 
 
 from log_util import *
 from fs_util import *
-from excel_util import *
+from parse_util import *
+from input_util import *
+from stats_util import *
+from sink_util import *
+from cache_util import *
+from profile_util import *
+from correlation_util import *
+from filter_util import *
+from detail_util import *
 
 
 APP_NAME = "Log Analyzer"
@@ -38,10 +52,90 @@ SOURCE_LINK = "https://github.com/crlamke/log-analyzer"
 LOG_SECTION_HEADER = "********"
 LOG_SECTION_FOOTER = "********"
 
+# Session holding the analysis config in each parallel analysis worker process
+chunk_worker_session = None
+
+# Version of the analysis state saved in checkpoint files
+ANALYSIS_STATE_VERSION = 1
+
+# Version of the partial state files exported for merging with merge_partial_states.py
+PARTIAL_STATE_VERSION = 1
+
 # We set min latency variables to MILLISECS_IN_DAY
 # to enable simple min latency calculation logic.
 MILLISECS_IN_DAY = 86400 * 1000
 
+# Latency percentiles reported in the analysis summary
+REPORT_PERCENTILES = (50, 95, 99)
+
+# Analysis engines that can be set in the analysis_engine config option
+ANALYSIS_ENGINES = ("python", "numpy")
+
+# Log entries the numpy analysis engine analyzes at once
+COLUMNAR_BATCH_SIZE = 8192
+
+# Most distinct group values in a batch that the numpy analysis engine calculates group
+# stats for one array at a time. Beyond that, group latencies are added one at a time.
+COLUMNAR_MAX_GROUP_VALUES = 256
+
+# Most groups each group_by item tracks by default. See GroupedLatencyStats.
+DEFAULT_MAX_GROUPS = 1000
+
+# Most time series buckets held by default. See LatencyTimeSeries.
+DEFAULT_MAX_TIME_BUCKETS = 1000
+
+# Milliseconds in each unit a time series bucket width can be given in
+DURATION_UNIT_MS = {"ms": 1, "s": 1000, "m": 60 * 1000, "h": 60 * 60 * 1000}
+
+# Rows the top_n and sample log details policies write by default
+DEFAULT_LOG_DETAILS_MAX_ROWS = 1000
+
+# Worst max latency violations kept for each timing pair by default
+DEFAULT_WORST_VIOLATIONS = 10
+
+# Notes on an entry's max latency violations and missing total time. Entries keep their
+# violations as (log line, timing pair ordinal, latency, max latency) tuples, with the
+# total time pair's ordinal after the timing pairs' and a latency of None if the total
+# time is missing, and the notes are only formatted when they're logged or written.
+MAX_LATENCY_NOTE = "Analysis Note: On log line #%d, %s -> %s delta of %d ms exceeds max allowed (%d ms)"
+TOTAL_TIME_NOTE = "Analysis Note: On log line #%d, total time of %d ms exceeds max allowed (%d ms)"
+TOTAL_TIME_MISSING_NOTE = "Analysis Error: On log line #%d, cannot calculate total time"
+
+# Parsing problems an entry keeps in its parse_notes, as (parse note, detail) tuples,
+# and the Parse Message text of each. The detail is the number of invalid pairs, the
+# invalid timestamp's key, or why an orphaned record left the join table.
+PARSE_NOTE_HEADER_NOT_FOUND = 1
+PARSE_NOTE_INVALID_PAIRS = 2
+PARSE_NOTE_INVALID_TIMESTAMP = 3
+PARSE_NOTE_ORPHANED_RECORD = 4
+PARSE_NOTE_TEXT = {PARSE_NOTE_HEADER_NOT_FOUND: "Header not found, ",
+                   PARSE_NOTE_INVALID_PAIRS: "Invalid Pair found, ",
+                   PARSE_NOTE_INVALID_TIMESTAMP: "Invalid Timestamp found, ",
+                   PARSE_NOTE_ORPHANED_RECORD: "Orphaned record {}, "}
+
+# Most MB of parse cache files kept by default
+DEFAULT_PARSE_CACHE_MAX_MB = 1024
+
+# Stages of a run timed in Run Info, in run order, with their display names
+RUN_STAGES = {"config": "Config", "load": "Load", "parse": "Parse", "analyze": "Analyze",
+              "write": "Write"}
+
+# Hot spots reported by default when a run is profiled
+DEFAULT_PROFILE_TOP_N = 25
+
+# Default secs of log time an incomplete correlated record waits for its other lines
+DEFAULT_CORRELATION_TTL_SECS = 300
+
+# Default most incomplete correlated records held at once
+DEFAULT_CORRELATION_MAX_RECORDS = 100000
+
+# Socket addresses analyzer_daemon.py listens on by default, for lines and for queries
+DEFAULT_DAEMON_INGEST_ADDRESS = "tcp:127.0.0.1:9514"
+DEFAULT_DAEMON_QUERY_ADDRESS = "tcp:127.0.0.1:9515"
+
+# Lines analyzer_daemon.py queues for analysis by default
+DEFAULT_DAEMON_QUEUE_LINES = 10000
+
 # Store log fields to parse and do calculations on or display for reference
 class LogField:
     """Store log fields to parse and do calculations on or display for reference"""
@@ -52,11 +146,26 @@ class LogField:
 # Stores pairs of log fields to calculate delta/latency for
 class TimingPair:
     """Stores pairs of log fields to calculate delta/latency on"""
-    def __init__(self, start_key, end_key, display_name, max_latency):
+    def __init__(self, start_key, end_key, display_name, max_latency,
+                 max_worst_violations=DEFAULT_WORST_VIOLATIONS):
         self.start_key = start_key
         self.end_key = end_key
         self.display_name = display_name
-        self.max_latency = max_latency
+        self.max_latency = max_latency # Max allowed latency in ms, as an int
+        self.latency_stats = LatencyStats() # Stats on the latencies found for this pair
+        self.violation_count = 0 # Latencies found that exceeded max_latency
+        # (log file, log line, latency) of the largest latencies that exceeded max_latency
+        self.worst_violations = DetailRowHeap(max_worst_violations)
+
+    # Count a latency that exceeded max_latency, keeping it if it's one of the worst
+    def add_violation(self, log_file, log_line, latency):
+        self.violation_count += 1
+        if (self.worst_violations.max_rows == 0):
+            return
+        if (self.worst_violations.would_keep(latency)):
+            self.worst_violations.add(latency, (log_file, log_line, latency))
+        else:
+            self.worst_violations.skip()
 
 # Stores pairs of log fields to calculate delta/latency for
 class TimingGroup:
@@ -73,74 +182,224 @@ class TimingGroup:
         self.min_latency = MILLISECS_IN_DAY
         self.max_latency = 0
         self.avg_latency = 0
-
-class LogEntryTiming:
+        self.latency_histogram = LatencyHistogram() # For latency percentiles
+
+    def add_latency(self, latency):
+        self.latency_histogram.add_latency(latency)
+        self.group_count += 1
+        self.total_latency += latency
+        if (self.min_latency > latency):
+            self.min_latency = latency
+        if (self.max_latency < latency):
+            self.max_latency = latency
+
+    # Add the latencies in a LatencyStats to the group
+    def add_latency_stats(self, latency_stats):
+        if (latency_stats.count == 0):
+            return
+        self.latency_histogram.merge(latency_stats.histogram)
+        self.group_count += latency_stats.count
+        self.total_latency += latency_stats.total_latency
+        if (self.min_latency > latency_stats.min_latency):
+            self.min_latency = latency_stats.min_latency
+        if (self.max_latency < latency_stats.max_latency):
+            self.max_latency = latency_stats.max_latency
+
+    # Add the latencies accumulated by another TimingGroup for the same group
+    def merge(self, other):
+        self.latency_histogram.merge(other.latency_histogram)
+        self.group_count += other.group_count
+        self.total_latency += other.total_latency
+        if (self.min_latency > other.min_latency):
+            self.min_latency = other.min_latency
+        if (self.max_latency < other.max_latency):
+            self.max_latency = other.max_latency
+
+    # Return the group's stats as a dict that can be saved as JSON
+    def to_dict(self):
+        return {"group_count": self.group_count, "total_latency": self.total_latency,
+                "min_latency": self.min_latency, "max_latency": self.max_latency,
+                "latency_histogram": self.latency_histogram.to_dict()}
+
+    # Replace the group's stats with those in a dict from to_dict()
+    def load_dict(self, group_dict):
+        self.group_count = group_dict["group_count"]
+        self.total_latency = group_dict["total_latency"]
+        self.min_latency = group_dict["min_latency"]
+        self.max_latency = group_dict["max_latency"]
+        self.latency_histogram.load_dict(group_dict["latency_histogram"])
+
+    # Return the latency at the given percentile (0-100), or None if the group is empty
+    def get_percentile(self, percentile):
+        return clamp_percentile(self.latency_histogram.get_percentile(percentile),
+                                self.min_latency, self.max_latency)
+
+# Stores log fields to group log entries by
+class GroupBy:
     """
-    Stores the time between two events
+    Stores the log field keys to group log entries by and the total time stats of
+    each distinct combination of their values
     """
-    def __init__(self, start_key, end_key, value):
-        self.start_key = start_key
-        self.end_key = end_key
-        self.value = value
+    def __init__(self, log_field_keys, max_groups):
+        self.log_field_keys = log_field_keys
+        self.display_name = "+".join(log_field_keys)
+        self.max_groups = max_groups
+        self.group_stats = GroupedLatencyStats(max_groups)
+
+    # Return the tuple of an entry's values for the group's fields, or None if it's missing one
+    def get_group_value(self, fields):
+        group_value = tuple(map(fields.get, self.log_field_keys))
+        if (None in group_value):
+            return None
+        return group_value
 
 class LogEntry:
     """Holds a log entry and associated data"""
+    # Entries may all be held in memory, so they have slots instead of a __dict__
+    __slots__ = ("valid", "parse_notes", "full_log_entry", "log_line", "log_file", "proc_start_time",
+                 "fields", "timings")
+
     def __init__(self):
         self.valid = True # Whether this is a valid log entry
-        self.parse_msg = "" # Store msg from parsing code
-        self.full_log_entry = None
+        self.parse_notes = None # List of (parse note, detail) for the parsing problems found, if any
+        self.full_log_entry = None # Line text, or a view of the line with mapped_input
         self.log_line = 0 # This log entry's line/position in the performance log
+        self.log_file = None # Name of the performance log file this entry is from
         self.proc_start_time = None # date/time when processing began on this msg/item
-        self.fields = {}
-        self.timings = {}
+        self.fields = None # Configured log field key -> value, with timestamps as ints
+        self.timings = None # Latency of each timing pair by ordinal, then total time. None if missing
 
 class AnalysisSession:
     """Hold the state for a log_analyzer session"""
     perf_log_file_name = None
     perf_log_file_dir = None
-    perf_log_file = None
+    perf_log_file = None # Path of the perf log, which may be a glob pattern
+    perf_log_files = [] # Perf log files the path matches, oldest first
     app_log_file = ''
     excel_results_file = ''
     app_log_file_dir = None
     app_log_file = None
     session_time = None
     verbose = False
+    quiet_mode = False # Don't echo the app log to the console
+    background_logging = True # Write the app log from a background thread
+    note_limit = DEFAULT_NOTE_LIMIT # Notes of each type logged before the rest are suppressed
+    note_interval = 0 # Seconds the note limit applies to before it resets. 0 means the whole run
     write_to_excel = True 
+    excel_write_only = False # Stream the Excel workbook's rows to disk as they're written
+    result_sink_names = ["excel"] # Formats to write results in. See RESULT_SINK_NAMES
+    result_sink = None # Analysis results are written through this
+    log_details_policy = "all" # Entries written to the log details. See LOG_DETAILS_POLICIES
+    log_details_max_rows = DEFAULT_LOG_DETAILS_MAX_ROWS # Rows the top_n and sample policies write
+    log_details_heap = None # DetailRowHeap of the rows the top_n or sample policy is keeping
+    log_details_row_count = 0 # Log details rows written
+    summary_only = False # Print the timing group and timing pair stats instead of writing results files
+    streaming_mode = False # Analyze entries as they're parsed instead of storing them
+    mapped_input = False # Parse uncompressed perf logs from a memory map, as bytes
+    analysis_engine = "python" # Analyze entries one at a time, or "numpy" to analyze batches of columns
+    parse_cache = None # ParseCache the parsed perf logs are saved to and read from, if enabled
+    stage_timer = None # StageTimer timing each stage of the run
+    worker_stage_timer = None # StageTimer holding the parallel workers' stage times, added up
+    run_start_time = None # StageTimer.start_section() at the start of the run
+    profile_calls = False # Profile the run with cProfile
+    trace_memory = False # Trace the run's memory allocations with tracemalloc
+    profile_top_n = DEFAULT_PROFILE_TOP_N # Hot spots reported when profiling
+    run_profiler = None # RunProfiler when profiling
+    parallel_workers = 0 # Number of processes to analyze with. 0 or 1 means don't run in parallel
+    parallel_chunk_size = 16 * 1024 * 1024 # Bytes of perf log each parallel task analyzes
+    follow_mode = False # Keep analyzing lines as they're added to the perf log
+    checkpoint_file = None # Where follow mode saves its position and stats
+    follow_poll_interval = 1.0 # Seconds to wait for new lines
+    follow_idle_exit = 0 # Stop following after this many idle seconds. 0 means never stop
+    follow_checkpoint_interval = 60 # Seconds between checkpoints while lines keep arriving
+    export_partial_state = False # Write the stats to a partial state file instead of the results
+    partial_state_dir = None # Where partial state files are written
+    daemon_ingest_address = DEFAULT_DAEMON_INGEST_ADDRESS # Where analyzer_daemon.py accepts lines
+    daemon_query_address = DEFAULT_DAEMON_QUERY_ADDRESS # Where analyzer_daemon.py answers queries
+    daemon_queue_lines = DEFAULT_DAEMON_QUEUE_LINES # Lines analyzer_daemon.py queues before applying backpressure
     logger = None
-    xls_doc = None
     log_entry_list = [] # Stores processed perf log entries
+    log_entry_count = 0 # Number of perf log entries analyzed
+    load_successful = True
     valid_log_entry_count = 0
     invalid_log_entry_count = 0
     log_fields = {}
     timing_pairs = {}
+    timing_pair_list = [] # Timing pairs by ordinal, the order they're configured in
     timing_groups = {}
+    timing_group_index = {} # Log field key -> {log field value: [timing groups]}
+    group_bys = [] # GroupBy for each item of the group_by config option
+    time_series_bucket_width = 0 # Configured time series bucket width in ms. 0 means no time series
+    time_series_max_buckets = DEFAULT_MAX_TIME_BUCKETS
+    time_series = None # Time series of the total time start timestamps
     total_time = None
+    timestamp_keys = () # Log field keys of the timing pair and total time timestamps
+    correlation_key = None # Log field key to join lines into one entry by. None means don't join
+    join_table = None # JoinTable of the lines waiting to be joined
+    lines_without_correlation_key = 0 # Valid lines that couldn't be joined, so were analyzed alone
+    analysis_filter = None # LineFilter entries must match to be analyzed. None means analyze all entries
+    line_filter = None # The analysis filter if it's checked on each line, i.e. lines aren't correlated
+    lines_prefiltered = 0 # Lines the filter's pre-check skipped without parsing them
+    entries_filtered = 0 # Parsed entries that didn't match the filter
     row_header = None
     field_separator = None
     pair_separator = None
-    wb = None
-    ws_run_info = None
-    ws_summary = None
-    ws_full_log = None
+    line_parser = None # Parser compiled from the log-format config
 
-
-def load_config(session):
+    def __init__(self):
+        # Give each session its own containers so sessions don't share state
+        self.log_entry_list = []
+        self.log_fields = {}
+        self.timing_pairs = {}
+        self.timing_pair_list = []
+        self.timing_groups = {}
+        self.timing_group_index = {}
+        self.group_bys = []
+        self.stage_timer = StageTimer()
+
+
+# Load the config from config_file, or from log_analyzer.cfg in the script directory if
+# config_file isn't given
+def load_config(session, config_file=None):
     session.session_time = time.strftime("%Y%m%d-%H%M%S")
     config = configparser.ConfigParser(strict=False)
-    config_file_path = os.path.abspath(os.path.dirname(sys.argv[0]))
-    config.read_file(open(config_file_path + os.path.sep + "log_analyzer.cfg"))
+    if (config_file == None):
+        config_file_path = os.path.abspath(os.path.dirname(sys.argv[0]))
+        config_file = config_file_path + os.path.sep + "log_analyzer.cfg"
+    config.read_file(open(config_file))
     session.perf_log_file_name = config.get('perf-log-file', 'perf_log_file_name')
     session.perf_log_file_dir = config.get('perf-log-file', 'perf_log_file_directory')
     session.perf_log_file = session.perf_log_file_dir + os.sep + session.perf_log_file_name
+    session.perf_log_files = find_log_files(session.perf_log_file_dir, session.perf_log_file_name)
     session.app_log_file = config.get('results-files', 'app_log_file')
     session.excel_results_file = config.get('results-files', 'excel_results_file')
     session.app_log_file_dir = config.get('results-files', 'app_log_file_directory')
     session.app_log_file_name = session.session_time + "-" + session.app_log_file
     session.excel_file_name = session.session_time  + "-" + session.excel_results_file
     session.app_log_file = session.app_log_file_dir + os.sep + session.app_log_file  
+    session.excel_write_only = config.getboolean('results-files', 'excel_write_only', fallback=False)
+    result_sinks = config.get('results-files', 'result_sinks', fallback="excel")
+    session.result_sink_names = [name.strip().lower() for name in result_sinks.split(',')
+                                 if name.strip() != ""]
+    session.write_to_excel = ("excel" in session.result_sink_names)
+    session.quiet_mode = config.getboolean('results-files', 'quiet_mode', fallback=False)
+    session.background_logging = config.getboolean('results-files', 'background_logging',
+                                                   fallback=True)
+    session.note_limit = config.getint('results-files', 'note_limit', fallback=DEFAULT_NOTE_LIMIT)
+    session.note_interval = config.getfloat('results-files', 'note_interval_secs', fallback=0)
+    session.log_details_policy = config.get('results-files', 'log_details_policy',
+                                            fallback="all").strip().lower()
+    session.log_details_max_rows = config.getint('results-files', 'log_details_max_rows',
+                                                 fallback=DEFAULT_LOG_DETAILS_MAX_ROWS)
+    if (session.log_details_policy in ("top_n", "sample")):
+        session.log_details_heap = DetailRowHeap(session.log_details_max_rows)
+    session.summary_only = config.getboolean('results-files', 'summary_only', fallback=False)
     session.row_header = config.get('log-format', 'row_header')
     session.pair_separator = config.get('log-format', 'pair_separator')
     session.field_separator = config.get('log-format', 'field_separator')
+    # Cached parsed logs are only reused with the same row header and separators
+    log_format_key = get_log_format_key([(option, config.get('log-format', option)) for option
+                                         in ('row_header', 'pair_separator', 'field_separator')])
 
     section = 'log-format'
     for option in config.options(section):
@@ -150,13 +409,16 @@ def load_config(session):
             log_field_item = LogField(log_field_split[0],log_field_split[1])
             session.log_fields[log_field_split[0]] = log_field_item
     
+    # Max latencies are converted to ints once here rather than for each entry analyzed
     section = 'analysis-reporting'
+    max_worst_violations = config.getint(section, 'worst_violations', fallback=DEFAULT_WORST_VIOLATIONS)
     for option in config.options(section):
         if option.startswith('timing_pair'):
             timing_pair_value = config.get(section,option)
             timing_pair_split = timing_pair_value.split(':')
             timing_pair_item = TimingPair(timing_pair_split[0],timing_pair_split[1],
-                                      timing_pair_split[2],int(timing_pair_split[3]))
+                                      timing_pair_split[2],int(timing_pair_split[3]),
+                                      max_worst_violations)
             timing_pair_key = timing_pair_split[0] + "-" + timing_pair_split[1]
             session.timing_pairs[timing_pair_key] = timing_pair_item
         elif option.startswith('timing_group'):
@@ -170,186 +432,1182 @@ def load_config(session):
             timing_pair_value = config.get(section,option)
             timing_pair_split = timing_pair_value.split(':')
             timing_pair_item = TimingPair(timing_pair_split[0],timing_pair_split[1],
-                                      timing_pair_split[2],int(timing_pair_split[3]))
+                                      timing_pair_split[2],int(timing_pair_split[3]),
+                                      max_worst_violations)
             session.total_time = timing_pair_item
+    # Violations refer to timing pairs by ordinal, which is their place in this list
+    session.timing_pair_list = list(session.timing_pairs.values())
+    session.timing_group_index = get_timing_group_index(session.timing_groups)
+    session.timestamp_keys = get_timestamp_keys(session)
+
+    # Group entries by every distinct value of each group_by item, which is a log field
+    # key or several joined by "+"
+    max_groups = config.getint(section, 'group_by_max_groups', fallback=DEFAULT_MAX_GROUPS)
+    for group_by_item in config.get(section, 'group_by', fallback="").split(','):
+        if (group_by_item.strip() != ""):
+            log_field_keys = [key.strip() for key in group_by_item.split('+')]
+            session.group_bys.append(GroupBy(log_field_keys, max_groups))
+
+    # Bucket entries by their total time start timestamp, in ms, for a time series
+    time_series_bucket = config.get(section, 'time_series_bucket', fallback="").strip()
+    if (time_series_bucket != ""):
+        session.time_series_bucket_width = get_duration_ms(time_series_bucket)
+        session.time_series_max_buckets = config.getint(section, 'time_series_max_buckets',
+                                                        fallback=DEFAULT_MAX_TIME_BUCKETS)
+        session.time_series = LatencyTimeSeries(session.time_series_bucket_width,
+                                                session.time_series_max_buckets)
+
+    # Join the lines with the same correlation key value into one entry, for logs with
+    # a line per processing stage
+    section = 'correlation'
+    if (config.has_section(section) and config.get(section, 'correlate_by', fallback="").strip() != ""):
+        session.correlation_key = config.get(section, 'correlate_by').strip()
+        ttl_secs = config.getfloat(section, 'correlation_ttl_secs', fallback=DEFAULT_CORRELATION_TTL_SECS)
+        max_records = config.getint(section, 'correlation_max_records',
+                                    fallback=DEFAULT_CORRELATION_MAX_RECORDS)
+        session.join_table = JoinTable(session.timestamp_keys, int(ttl_secs * 1000), max_records)
+
+    # Only analyze the entries matching the filter. Lines are pre-checked for the
+    # filter's values before they're parsed, unless they're correlated, in which case
+    # the filter is checked on the joined entries.
+    section = 'analysis-filter'
+    if (config.has_section(section) and config.get(section, 'filter', fallback="").strip() != ""):
+        session.analysis_filter = LineFilter(config.get(section, 'filter').strip())
+        if (session.join_table == None):
+            session.line_filter = session.analysis_filter
+
+    session.line_parser = LineParser(session.row_header, session.pair_separator,
+                                     session.field_separator, get_analysis_keys(session))
+
+    section = 'follow'
+    session.checkpoint_file = (session.app_log_file_dir + os.sep +
+                               "log_analyzer_checkpoint.json")
+    if (config.has_section(section)):
+        session.follow_mode = config.getboolean(section, 'follow_mode', fallback=False)
+        session.checkpoint_file = config.get(section, 'checkpoint_file',
+                                             fallback=session.checkpoint_file)
+        session.follow_poll_interval = config.getfloat(section, 'poll_interval_secs', fallback=1.0)
+        session.follow_idle_exit = config.getfloat(section, 'idle_exit_secs', fallback=0)
+        session.follow_checkpoint_interval = config.getfloat(section, 'checkpoint_interval_secs',
+                                                             fallback=60)
+
+    section = 'partial-state'
+    session.partial_state_dir = session.app_log_file_dir
+    if (config.has_section(section)):
+        session.export_partial_state = config.getboolean(section, 'export_partial_state', fallback=False)
+        if (config.get(section, 'partial_state_directory', fallback="").strip() != ""):
+            session.partial_state_dir = config.get(section, 'partial_state_directory').strip()
+
+    section = 'daemon'
+    if (config.has_section(section)):
+        session.daemon_ingest_address = config.get(section, 'ingest_address',
+                                                   fallback=DEFAULT_DAEMON_INGEST_ADDRESS).strip()
+        session.daemon_query_address = config.get(section, 'query_address',
+                                                  fallback=DEFAULT_DAEMON_QUERY_ADDRESS).strip()
+        session.daemon_queue_lines = config.getint(section, 'queue_lines',
+                                                   fallback=DEFAULT_DAEMON_QUEUE_LINES)
+
+    section = 'analysis-options'
+    if (config.has_section(section)):
+        session.streaming_mode = config.getboolean(section, 'streaming_mode', fallback=False)
+        session.mapped_input = config.getboolean(section, 'mapped_input', fallback=False)
+        session.analysis_engine = config.get(section, 'analysis_engine', fallback="python").lower()
+        session.parallel_workers = config.getint(section, 'parallel_workers', fallback=0)
+        parallel_chunk_size_mb = config.getint(section, 'parallel_chunk_size_mb', fallback=16)
+        session.parallel_chunk_size = parallel_chunk_size_mb * 1024 * 1024
+        session.profile_calls = config.getboolean(section, 'profile', fallback=False)
+        session.trace_memory = config.getboolean(section, 'trace_memory', fallback=False)
+        session.profile_top_n = config.getint(section, 'profile_top_n', fallback=DEFAULT_PROFILE_TOP_N)
+        if (config.getboolean(section, 'parse_cache', fallback=False)):
+            parse_cache_dir = config.get(section, 'parse_cache_dir',
+                                         fallback=session.app_log_file_dir + os.sep + "parse_cache")
+            parse_cache_max_mb = config.getint(section, 'parse_cache_max_mb',
+                                               fallback=DEFAULT_PARSE_CACHE_MAX_MB)
+            session.parse_cache = ParseCache(parse_cache_dir, parse_cache_max_mb * 1024 * 1024,
+                                             log_format_key)
+
+
+# Return the log keys the analysis uses: the configured log fields plus any keys
+# referenced by the timing pairs, total time pair, and timing groups.
+def get_analysis_keys(session):
+    analysis_keys = set(session.log_fields)
+    for timing_pair in session.timing_pairs.values():
+        analysis_keys.update((timing_pair.start_key, timing_pair.end_key))
+    if (session.total_time != None):
+        analysis_keys.update((session.total_time.start_key, session.total_time.end_key))
+    for timing_group in session.timing_groups.values():
+        analysis_keys.add(timing_group.log_field_key)
+    for group_by in session.group_bys:
+        analysis_keys.update(group_by.log_field_keys)
+    if (session.correlation_key != None):
+        analysis_keys.add(session.correlation_key)
+    if (session.analysis_filter != None):
+        analysis_keys.update(session.analysis_filter.get_keys())
+    return analysis_keys
+
+
+# Return the log keys of the timing pair and total time timestamps, which are
+# converted to ints when a line is parsed
+def get_timestamp_keys(session):
+    timestamp_keys = set()
+    for timing_pair in session.timing_pairs.values():
+        timestamp_keys.update((timing_pair.start_key, timing_pair.end_key))
+    if (session.total_time != None):
+        timestamp_keys.update((session.total_time.start_key, session.total_time.end_key))
+    return tuple(sorted(timestamp_keys))
+
+
+# Return the ms in a duration like "500ms", "1s", "5m", or "1h". A bare number is seconds.
+def get_duration_ms(duration):
+    duration_match = re.match(r"^(\d+)\s*(ms|s|m|h)?$", duration.strip().lower())
+    if (duration_match == None):
+        raise ValueError("Invalid duration \"{}\"".format(duration))
+    return int(duration_match.group(1)) * DURATION_UNIT_MS[duration_match.group(2) or "s"]
+
+
+# Return a dict mapping each timing group log field key to a dict of each of its
+# values' timing groups, so an entry's timing groups are found with one lookup per field
+def get_timing_group_index(timing_groups):
+    timing_group_index = {}
+    for timing_group in timing_groups.values():
+        value_groups = timing_group_index.setdefault(timing_group.log_field_key, {})
+        value_groups.setdefault(timing_group.log_field_value, []).append(timing_group)
+    return timing_group_index
 
 
 # Do basic sanity checking on the app's config and exit if sanity checking fails.
 def verify_config(session):
     configVerified = True
 
-    if (not is_file_readable(session.perf_log_file)):
+    if (len(session.perf_log_files) == 0):
         configVerified = False
-        logging.error("File " + session.perf_log_file + " must exist and be readable.")
+        logging.error("No files match " + session.perf_log_file + ".")
+
+    for perf_log_file in session.perf_log_files:
+        if (not is_file_readable(perf_log_file)):
+            configVerified = False
+            logging.error("File " + perf_log_file + " must exist and be readable.")
 
     if (not is_dir_writable(session.app_log_file_dir)):
         configVerified = False
         logging.error("File " + session.app_log_file_dir + " must exist and be writable.")
 
+    if (session.export_partial_state == True and not is_dir_writable(session.partial_state_dir)):
+        configVerified = False
+        logging.error("Directory " + session.partial_state_dir + " must exist and be writable.")
+
+    if (session.log_details_policy not in LOG_DETAILS_POLICIES):
+        configVerified = False
+        logging.error("Log details policy " + session.log_details_policy + " must be one of " +
+                      ", ".join(LOG_DETAILS_POLICIES) + ".")
+
+    if (session.analysis_engine not in ANALYSIS_ENGINES):
+        configVerified = False
+        logging.error("Analysis engine " + session.analysis_engine + " must be one of " +
+                      ", ".join(ANALYSIS_ENGINES) + ".")
+    elif (session.analysis_engine == "numpy" and importlib.util.find_spec("numpy") == None):
+        configVerified = False
+        logging.error("Analysis engine numpy requires NumPy to be installed.")
+
     return configVerified
 
 
-# Read perf log file a line at a time.
+# Read perf log file a line at a time, storing each parsed entry in session.log_entry_list.
 def load_performance_log(session):
     session.logger.info("Begin loading performance log")
-    successful_load = True
+    for log_entry in get_analysis_entries(session, read_performance_log(session)):
+        session.log_entry_list.append(log_entry)
+    session.logger.info("End loading performance log")
+    return session.load_successful
+
+
+# Return the entries to analyze from parsed log entries, which are the entries themselves
+# unless they're joined into correlated entries, which are then filtered
+def get_analysis_entries(session, log_entries):
+    if (session.join_table == None):
+        return log_entries
+    if (session.analysis_filter != None):
+        return filter_log_entries(session, correlate_log_entries(session, log_entries))
+    return correlate_log_entries(session, log_entries)
+
+
+# Generator that yields the log entries matching the analysis filter
+def filter_log_entries(session, log_entries):
+    analysis_filter = session.analysis_filter
+    for log_entry in log_entries:
+        if (log_entry.fields != None and analysis_filter.matches(log_entry.fields)):
+            yield log_entry
+        else:
+            session.entries_filtered += 1
+
+
+# Generator that joins parsed log entries with the same correlation key value into one
+# entry each, yielding an entry once it has all the timing pair and total time
+# timestamps. Entries without a row header or the key are yielded as is. Incomplete
+# entries evicted from the join table or left at the end of the log are yielded with
+# what they have, so their timing pairs are still analyzed, and are reported as orphans.
+def correlate_log_entries(session, log_entries):
+    correlation_key = session.correlation_key
+    timestamp_keys = session.timestamp_keys
+    join_table = session.join_table
+    for log_entry in log_entries:
+        fields = log_entry.fields
+        key_value = fields.get(correlation_key) if (log_entry.valid == True) else None
+        if (key_value == None):
+            if (log_entry.valid == True):
+                session.lines_without_correlation_key += 1
+            yield log_entry
+            continue
+        timestamps = [fields[key] for key in timestamp_keys if key in fields]
+        left_records = join_table.add(key_value, fields, log_entry, timestamps)
+        log_entry.fields = None # The record holds the fields now
+        for record, reason in left_records:
+            yield get_correlated_log_entry(session, record, reason)
+    for record, reason in join_table.drain():
+        yield get_correlated_log_entry(session, record, reason)
+
+
+# Return the log entry for a record that left the join table. Its line number and file
+# are those of the record's first line, and its full_log_entry is its lines joined by " | ".
+def get_correlated_log_entry(session, record, reason):
+    first_entry = record.entries[0]
+    log_entry = LogEntry()
+    log_entry.log_line = first_entry.log_line
+    log_entry.log_file = first_entry.log_file
+    log_entry.fields = record.fields
+    log_entry.full_log_entry = " | ".join(get_line_text(entry.full_log_entry) for entry in record.entries)
+    parse_notes = [parse_note for entry in record.entries if entry.parse_notes != None
+                   for parse_note in entry.parse_notes]
+    log_entry.parse_notes = parse_notes if len(parse_notes) > 0 else None
+    if (reason != RECORD_COMPLETE):
+        missing_keys = [key for key in session.timestamp_keys if key not in record.fields]
+        session.logger.note("orphaned record",
+                            "Correlation Note: %s %s from log line #%d was %s, missing %s",
+                            session.correlation_key, record.key_value, first_entry.log_line,
+                            reason, ", ".join(missing_keys))
+        if (log_entry.parse_notes == None):
+            log_entry.parse_notes = []
+        log_entry.parse_notes.append((PARSE_NOTE_ORPHANED_RECORD, reason))
+    return log_entry
+
+
+# Generator that reads the perf log files a line at a time and yields each parsed
+# log entry. Nothing is kept once an entry has been handed off, so callers that
+# analyze entries as they arrive use memory independent of the log size.
+def read_performance_log(session):
+    session.load_successful = True
     try:
-        with open(session.perf_log_file, 'r') as perf_log:
-            line_number = 1
-            for line in perf_log:
-                parse_log_line(session, line, line_number)
+        for perf_log_file in session.perf_log_files:
+            session.logger.info("Reading performance log file " + perf_log_file)
+            yield from read_log_file_entries(session, perf_log_file)
+
+    except (IOError) as error:
+        session.logger.info("Problem reading " + session.perf_log_file + 
+                            " Performance log load incomplete.")
+        session.load_successful = False
+
+
+# Generator that yields the parsed log entries for the lines in the byte range
+# [start, end) of a perf log file, or the whole file if end is None, numbering
+# them from first_line_number. With mapped_input, an uncompressed file is memory
+# mapped and its lines are parsed as bytes, so the part of each line before the
+# row header is never decoded and the line itself is only decoded if it's written
+# to the results. Otherwise lines are read and decoded, with compressed files decompressed
+# on a background thread while the entries are analyzed. With a parse cache, a whole
+# uncompressed file is read from the cache instead, if it's cached.
+def read_log_file_entries(session, perf_log_file, start=0, end=None, first_line_number=1):
+    log_file_name = os.path.basename(perf_log_file)
+    line_number = first_line_number
+    if (session.parse_cache != None and start == 0 and end == None and
+            not is_compressed_file(perf_log_file)):
+        yield from read_cached_log_file_entries(session, perf_log_file)
+    elif (session.mapped_input == True and not is_compressed_file(perf_log_file)):
+        for mapped_log, log_view, line_start, line_end in map_log_lines(perf_log_file, start, end):
+            log_entry = parse_mapped_log_line(session, mapped_log, log_view, line_start, line_end,
+                                              line_number)
+            line_number += 1
+            if (log_entry != None):
+                log_entry.log_file = log_file_name
+                yield log_entry
+    elif (start == 0 and end == None):
+        for _, line_number, line in read_log_lines([perf_log_file]):
+            log_entry = parse_log_line(session, line.decode(errors='replace'), line_number)
+            if (log_entry != None):
+                log_entry.log_file = log_file_name
+                yield log_entry
+    else:
+        with open(perf_log_file, 'rb') as perf_log:
+            perf_log.seek(start)
+            position = start
+            while (end == None or position < end):
+                line = perf_log.readline()
+                if (not line):
+                    break
+                position += len(line)
+                log_entry = parse_log_line(session, line.decode(errors='replace'), line_number)
                 line_number += 1
-    
+                if (log_entry != None):
+                    log_entry.log_file = log_file_name
+                    yield log_entry
+
+
+# Generator that yields the parsed log entries of an uncompressed perf log file from the
+# parse cache, parsing the file and caching it first if it isn't cached. Entries read
+# from the cache are the same as parsed ones, including their parsing notes, with
+# full_log_entry a view of the line in the memory mapped perf log file.
+def read_cached_log_file_entries(session, perf_log_file):
+    log_file_name = os.path.basename(perf_log_file)
+    analysis_keys = sorted(get_analysis_keys(session))
+    cached_log = session.parse_cache.read(perf_log_file, analysis_keys)
+    if (cached_log != None):
+        session.logger.info("Reading parsed performance log from cache " + cached_log.cache_file)
+        try:
+            for line_view, line_number, fields, invalid_pairs, problem in cached_log.read_lines(
+                    perf_log_file, analysis_keys, session.timestamp_keys):
+                if (problem != None):
+                    session.logger.note("parsing problem", "Problem - %s - parsing log line: %s",
+                                        problem, get_line_text(line_view))
+                    continue
+                log_entry = get_parsed_log_entry(session, (line_view, fields, invalid_pairs),
+                                                 line_number)
+                if (log_entry != None):
+                    log_entry.log_file = log_file_name
+                    yield log_entry
+        finally:
+            cached_log.close()
+        return
+
+    cache_writer = session.parse_cache.create_writer(perf_log_file, analysis_keys)
+    cache_written = False
+    try:
+        line_number = 1
+        for mapped_log, log_view, line_start, line_end in map_log_lines(perf_log_file):
+            parse_start = time.perf_counter()
+            try:
+                parse_result = session.line_parser.parse_buffer(mapped_log, line_start, line_end,
+                                                                log_view)
+                session.stage_timer.add_wall_time("parse", time.perf_counter() - parse_start)
+            except Exception as err:
+                line_text = mapped_log[line_start:line_end].rstrip(LINE_END_BYTES)
+                cache_writer.add_line(line_start, line_start + len(line_text), None, [], str(err))
+                session.logger.note("parsing problem", "Problem - %s - parsing log line: %s",
+                                    err, line_text.decode(errors='replace'))
+                line_number += 1
+                continue
+            full_log_entry, fields, invalid_pairs = parse_result
+            cache_writer.add_line(line_start, line_start + len(full_log_entry), fields, invalid_pairs)
+            log_entry = get_parsed_log_entry(session, parse_result, line_number)
+            line_number += 1
+            if (log_entry != None):
+                log_entry.log_file = log_file_name
+                yield log_entry
+        cache_written = True
+        try:
+            cache_writer.close()
+            session.logger.info("Saved parsed performance log to cache " + cache_writer.cache_file)
+        except (OSError) as error:
+            session.logger.info("Problem saving parsed performance log to cache - " + str(error))
+    finally:
+        if (cache_written == False):
+            cache_writer.remove_temp_files()
+
+
+# Generator that follows the perf log like "tail -f", yielding a parsed log entry for
+# each complete line as it's added. Follow mode resumes from the checkpoint file's
+# offset and stats if there is one, so only lines added since the last run are read.
+# If the log is rotated (a new file with the same name) or truncated, following
+# restarts at the beginning of the new log. When the perf log path matches several
+# files, the newest one is followed. Stops after follow_idle_exit seconds
+# without new lines, or on Ctrl-C, saving a checkpoint either way.
+def follow_performance_log(session):
+    session.load_successful = True
+    offset, line_number, inode = load_checkpoint(session)
+    follow_file = session.perf_log_files[-1]
+    last_line_time = time.time()
+    last_checkpoint_time = time.time()
+    perf_log = None
+
+    try:
+        while (True):
+            if (perf_log == None):
+                perf_log = open(follow_file, 'rb')
+                file_stat = os.fstat(perf_log.fileno())
+                if (file_stat.st_ino != inode or file_stat.st_size < offset):
+                    if (inode != None):
+                        session.logger.info("Performance log was rotated or truncated. " +
+                                            "Following it from the beginning.")
+                    offset, line_number, inode = 0, 1, file_stat.st_ino
+                perf_log.seek(offset)
+
+            line = perf_log.readline()
+            if (line.endswith(b"\n")):
+                offset += len(line)
+                entry = parse_log_line(session, line.decode(errors='replace'), line_number)
+                line_number += 1
+                last_line_time = time.time()
+                if (entry != None):
+                    entry.log_file = os.path.basename(follow_file)
+                    yield entry
+                if (time.time() - last_checkpoint_time >= session.follow_checkpoint_interval):
+                    save_checkpoint(session, offset, line_number, inode)
+                    last_checkpoint_time = time.time()
+                continue
+
+            # No complete line yet. Leave any partial line to be read once it's finished.
+            perf_log.seek(offset)
+            if (time.time() - last_checkpoint_time >= session.follow_checkpoint_interval):
+                save_checkpoint(session, offset, line_number, inode)
+                last_checkpoint_time = time.time()
+            if (session.follow_idle_exit > 0 and
+                    time.time() - last_line_time >= session.follow_idle_exit):
+                break
+            if (is_file_replaced(follow_file, inode, offset)):
+                perf_log.close()
+                perf_log = None
+                continue
+            time.sleep(session.follow_poll_interval)
+
+    except (KeyboardInterrupt):
+        session.logger.info("Stopped following performance log.")
+
     except (IOError) as error:
         session.logger.info("Problem reading " + session.perf_log_file + 
                             " Performance log load incomplete.")
-        successful_load = False
+        session.load_successful = False
+
     finally:
-        session.logger.info("End loading performance log")
-        return (successful_load == True)
+        if (perf_log != None):
+            perf_log.close()
+        save_checkpoint(session, offset, line_number, inode)
 
 
-# Parse a line in the perf log file
+# Whether the file at file_path is no longer the one with inode, or has been
+# truncated to less than offset bytes
+def is_file_replaced(file_path, inode, offset):
+    try:
+        file_stat = os.stat(file_path)
+    except (OSError):
+        return False # Rotation in progress. Keep the current file until a new one appears.
+    return (file_stat.st_ino != inode or file_stat.st_size < offset)
+
+
+# Return the analysis stats of session as a dict that can be saved as JSON
+def get_analysis_state(session):
+    analysis_state = {
+        "version": ANALYSIS_STATE_VERSION,
+        "log_entry_count": session.log_entry_count,
+        "valid_log_entry_count": session.valid_log_entry_count,
+        "invalid_log_entry_count": session.invalid_log_entry_count,
+        "timing_pairs": {key: timing_pair.latency_stats.to_dict()
+                         for key, timing_pair in session.timing_pairs.items()},
+        "timing_groups": {key: timing_group.to_dict()
+                          for key, timing_group in session.timing_groups.items()},
+        "group_bys": {group_by.display_name: group_by.group_stats.to_dict()
+                      for group_by in session.group_bys},
+        "time_series": None,
+        "total_time": None,
+        "violation_counts": {key: timing_pair.violation_count
+                             for key, timing_pair in session.timing_pairs.items()},
+        "total_time_violation_count": 0,
+        "worst_violations": {key: timing_pair.worst_violations.to_dict()
+                             for key, timing_pair in session.timing_pairs.items()},
+        "total_time_worst_violations": None,
+        "lines_prefiltered": session.lines_prefiltered,
+        "entries_filtered": session.entries_filtered,
+        "correlation": None}
+    if (session.time_series != None):
+        analysis_state["time_series"] = session.time_series.to_dict()
+    if (session.total_time != None):
+        analysis_state["total_time"] = session.total_time.latency_stats.to_dict()
+        analysis_state["total_time_violation_count"] = session.total_time.violation_count
+        analysis_state["total_time_worst_violations"] = session.total_time.worst_violations.to_dict()
+    if (session.join_table != None):
+        analysis_state["correlation"] = {
+            "lines_joined": session.join_table.lines_joined,
+            "reason_counts": session.join_table.reason_counts,
+            "most_pending": session.join_table.most_pending,
+            "lines_without_correlation_key": session.lines_without_correlation_key}
+    return analysis_state
+
+
+# Load analysis stats from a dict from get_analysis_state() into session. Stats for
+# timing pairs and timing groups that are no longer configured are ignored.
+def load_analysis_state(session, analysis_state):
+    session.log_entry_count = analysis_state["log_entry_count"]
+    session.valid_log_entry_count = analysis_state["valid_log_entry_count"]
+    session.invalid_log_entry_count = analysis_state["invalid_log_entry_count"]
+    session.lines_prefiltered = analysis_state.get("lines_prefiltered", 0)
+    session.entries_filtered = analysis_state.get("entries_filtered", 0)
+    for key, stats_dict in analysis_state["timing_pairs"].items():
+        if (key in session.timing_pairs):
+            session.timing_pairs[key].latency_stats.load_dict(stats_dict)
+    for key, violation_count in analysis_state.get("violation_counts", {}).items():
+        if (key in session.timing_pairs):
+            session.timing_pairs[key].violation_count = violation_count
+    for key, heap_dict in analysis_state.get("worst_violations", {}).items():
+        if (key in session.timing_pairs):
+            session.timing_pairs[key].worst_violations.load_dict(heap_dict)
+    for key, group_dict in analysis_state["timing_groups"].items():
+        if (key in session.timing_groups):
+            session.timing_groups[key].load_dict(group_dict)
+    group_bys_state = analysis_state.get("group_bys", {})
+    for group_by in session.group_bys:
+        if (group_by.display_name in group_bys_state):
+            group_by.group_stats.load_dict(group_bys_state[group_by.display_name])
+    if (session.time_series != None and analysis_state.get("time_series") != None):
+        session.time_series.load_dict(analysis_state["time_series"])
+    if (session.total_time != None and analysis_state["total_time"] != None):
+        session.total_time.latency_stats.load_dict(analysis_state["total_time"])
+        session.total_time.violation_count = analysis_state.get("total_time_violation_count", 0)
+        if (analysis_state.get("total_time_worst_violations") != None):
+            session.total_time.worst_violations.load_dict(analysis_state["total_time_worst_violations"])
+    correlation_state = analysis_state.get("correlation")
+    if (session.join_table != None and correlation_state != None):
+        session.join_table.lines_joined = correlation_state["lines_joined"]
+        session.join_table.reason_counts.update(correlation_state["reason_counts"])
+        session.join_table.most_pending = correlation_state["most_pending"]
+        session.lines_without_correlation_key = correlation_state["lines_without_correlation_key"]
+
+
+# Return a key identifying the stats a session's config accumulates, so partial states
+# from runs with other timing pairs or groups can be told apart
+def get_analysis_config_key(session):
+    config_items = [[key, timing_pair.start_key, timing_pair.end_key, int(timing_pair.max_latency)]
+                    for key, timing_pair in session.timing_pairs.items()]
+    if (session.total_time != None):
+        config_items.append(["total_time", session.total_time.start_key, session.total_time.end_key,
+                             int(session.total_time.max_latency)])
+    config_items.append(sorted(session.timing_groups))
+    config_items.append([group_by.display_name for group_by in session.group_bys])
+    config_items.append([session.correlation_key, session.time_series_bucket_width,
+                         session.analysis_filter.filter_text if session.analysis_filter else None])
+    return hashlib.sha1(json.dumps(config_items).encode()).hexdigest()
+
+
+# Write the session's analysis stats to a partial state file in partial_state_dir, to be
+# merged with other hosts' by merge_partial_states.py. Returns whether it was written.
+def write_partial_state(session):
+    section_start = session.stage_timer.start_section()
+    host_name = socket.gethostname()
+    partial_state = {"version": PARTIAL_STATE_VERSION, "app_version": APP_VERSION,
+                     "host": host_name, "session_time": session.session_time,
+                     "perf_log_files": session.perf_log_files,
+                     "analysis_config": get_analysis_config_key(session),
+                     "analysis_state": get_analysis_state(session)}
+    # The process ID keeps exports started on a host in the same second apart. If the
+    # file's there anyway, a counter is added rather than replacing it.
+    partial_state_name = "{}-{}-{}".format(session.session_time, host_name, os.getpid())
+    partial_state_file = os.path.join(session.partial_state_dir, partial_state_name + "-partial_state.json")
+    name_count = 1
+    while (os.path.exists(partial_state_file)):
+        session.logger.warning("Partial state file " + partial_state_file +
+                               " already exists. Writing the partial state to a new file instead.")
+        name_count += 1
+        partial_state_file = os.path.join(session.partial_state_dir, "{}-{}-partial_state.json".format(
+            partial_state_name, name_count))
+    try:
+        # Write a new file and then rename it so a merge can't read a partial file
+        with open(partial_state_file + ".tmp", 'w') as partial_state_output:
+            json.dump(partial_state, partial_state_output, separators=(',', ':'))
+        os.replace(partial_state_file + ".tmp", partial_state_file)
+    except (IOError) as error:
+        session.logger.info("Problem writing partial state " + partial_state_file + " - " + str(error))
+        return False
+    session.logger.info("Partial state of {} log entries written to {} ({:.1f} KB)".format(
+        session.log_entry_count, partial_state_file, os.path.getsize(partial_state_file) / 1024))
+    session.stage_timer.end_section(section_start, ["write"])
+    write_run_stats(session)
+    return True
+
+
+# Merge the stats in partial state files from write_partial_state() into session.
+# Files that can't be read or are from another version are skipped. Returns the
+# number of files merged.
+def merge_partial_state_files(session, partial_state_files):
+    config_key = get_analysis_config_key(session)
+    merged_count = 0
+    for partial_state_file in partial_state_files:
+        try:
+            with open(partial_state_file, 'r') as partial_state_input:
+                partial_state = json.load(partial_state_input)
+            if (partial_state["version"] != PARTIAL_STATE_VERSION or
+                    partial_state["analysis_state"]["version"] != ANALYSIS_STATE_VERSION):
+                session.logger.info("Skipping partial state " + partial_state_file +
+                                    " since it's from another version.")
+                continue
+            if (partial_state["analysis_config"] != config_key):
+                session.logger.info("Partial state " + partial_state_file + " is from another " +
+                                    "analysis config. Only its stats for configured timing pairs " +
+                                    "and groups are merged.")
+            merge_analysis_state(session, partial_state["analysis_state"])
+        except (IOError, ValueError, KeyError) as error:
+            session.logger.info("Problem reading partial state " + partial_state_file + " - " +
+                                str(error) + " - Skipping it.")
+            continue
+        merged_count += 1
+        session.logger.info("Merged partial state of {} log entries from host {} ({})".format(
+            partial_state["analysis_state"]["log_entry_count"], partial_state["host"],
+            ", ".join(partial_state["perf_log_files"])))
+        session.result_sink.write_run_info("Merged partial state", "{} from host {}".format(
+            os.path.basename(partial_state_file), partial_state["host"]))
+    return merged_count
+
+
+# Add the analysis stats in a dict from get_analysis_state(), e.g. from another host's
+# partial state file, to those of session. The stats are loaded into a session with
+# the same config and merged the way parallel chunks are.
+def merge_analysis_state(session, analysis_state):
+    state_session = copy_analysis_config(session)
+    load_analysis_state(state_session, analysis_state)
+    merge_analysis_stats(session, state_session)
+
+
+# Load the follow mode checkpoint for the session's perf log, restoring the saved stats.
+# Returns the (offset, line number, inode) to resume from, or (0, 1, None) if there's
+# no usable checkpoint.
+def load_checkpoint(session):
+    if (not is_file_readable(session.checkpoint_file)):
+        return (0, 1, None)
+    try:
+        with open(session.checkpoint_file, 'r') as checkpoint:
+            checkpoint_state = json.load(checkpoint)
+        if (checkpoint_state["version"] != ANALYSIS_STATE_VERSION or
+                checkpoint_state["perf_log_file"] != session.perf_log_file):
+            session.logger.info("Checkpoint " + session.checkpoint_file +
+                                " is for another log or version. Starting from the beginning.")
+            return (0, 1, None)
+        load_analysis_state(session, checkpoint_state["analysis_state"])
+        if (session.join_table != None and checkpoint_state.get("pending_records") != None):
+            load_pending_records(session.join_table, checkpoint_state["pending_records"])
+    except (IOError, ValueError, KeyError) as error:
+        session.logger.info("Problem reading checkpoint " + session.checkpoint_file + " - " +
+                            str(error) + " - Starting from the beginning.")
+        return (0, 1, None)
+    session.logger.info("Resuming from checkpoint at line #{}, byte offset {}".format(
+        checkpoint_state["line_number"], checkpoint_state["offset"]))
+    return (checkpoint_state["offset"], checkpoint_state["line_number"], checkpoint_state["inode"])
+
+
+# Save the follow mode position in the perf log and the stats so far to the checkpoint file,
+# along with the records waiting in the join table, whose lines are before the position
+def save_checkpoint(session, offset, line_number, inode):
+    checkpoint_state = {"version": ANALYSIS_STATE_VERSION,
+                        "perf_log_file": session.perf_log_file,
+                        "inode": inode, "offset": offset, "line_number": line_number,
+                        "analysis_state": get_analysis_state(session),
+                        "pending_records": None}
+    if (session.join_table != None):
+        checkpoint_state["pending_records"] = get_pending_records(session.join_table)
+    try:
+        # Write a new file and then replace the old one so a crash can't leave a partial checkpoint
+        with open(session.checkpoint_file + ".tmp", 'w') as checkpoint:
+            json.dump(checkpoint_state, checkpoint)
+        os.replace(session.checkpoint_file + ".tmp", session.checkpoint_file)
+    except (IOError) as error:
+        session.logger.info("Problem saving checkpoint " + session.checkpoint_file + " - " + str(error))
+
+
+# Return the records waiting in a join table as a dict that can be saved as JSON. Each
+# record's entries keep only what's needed to analyze the record once it leaves the table.
+def get_pending_records(join_table):
+    return {"latest_time": join_table.latest_time,
+            "records": [[record.key_value, record.start_time, record.fields,
+                         [[entry.log_file, entry.log_line, get_line_text(entry.full_log_entry),
+                           entry.parse_notes] for entry in record.entries]]
+                        for record in join_table.pending_records.values()]}
+
+
+# Put the records in a dict from get_pending_records() back in a join table, oldest first
+def load_pending_records(join_table, pending_records):
+    join_table.latest_time = pending_records["latest_time"]
+    for key_value, start_time, fields, entries in pending_records["records"]:
+        record = PendingRecord(key_value, start_time)
+        record.fields = fields
+        for log_file, log_line, line_text, parse_notes in entries:
+            log_entry = LogEntry()
+            log_entry.log_file = log_file
+            log_entry.log_line = log_line
+            log_entry.full_log_entry = line_text
+            if (parse_notes != None):
+                log_entry.parse_notes = [tuple(parse_note) for parse_note in parse_notes]
+            record.entries.append(log_entry)
+        join_table.pending_records[key_value] = record
+
+
+# Parse a line in the perf log file and return the resulting log entry, or None if it
+# couldn't be parsed or doesn't match the filter. Only the keys the analysis uses are
+# kept in the entry's fields.
 def parse_log_line(session, log_line, log_line_number):
+    if (session.line_filter != None and not session.line_filter.may_match_text(log_line)):
+        session.lines_prefiltered += 1
+        return None
+    parse_start = time.perf_counter()
     try:
-        log_entry_is_valid = True
-        log_entry = LogEntry()
-        log_entry.log_line = log_line_number
-        parse_line = log_line.rstrip() # Strip the newline char
-        log_entry.full_log_entry = parse_line # Store log entry without new line
-
-        # Check for valid row header
-        header_index = parse_line.find(session.row_header)
-        if (header_index != -1):
-            line_position = header_index + len(session.row_header) + 1
-            parse_line = parse_line[line_position:] # Move past header
-        else:
-            log_entry.valid = False
-            session.log_entry_list.append(log_entry)
-            session.logger.info("Parsing Note: log line #{} is invalid. Header not found".format(
-                str(log_line_number)))
-            log_entry.parse_msg += "Header not found, "
-            return
-
-        parse_line = parse_line.replace(" ", "") # Remove spaces from line
-        split_line = re.split(session.pair_separator, 
-                                parse_line) # Split line into key/value pairs
-        for item in split_line:
-            split_pair = re.split(session.field_separator,
-                                    item) # Split pair into key and value
-            if (len(split_pair) == 2):
-                log_entry.fields[split_pair[0]] = split_pair[1]
-            else: # Discard the invalid pair
-                session.logger.info("Parsing Note: On log line #{}, discarding invalid Pair: \"{}\"".format(
-                    str(log_line_number), item))
-                log_entry.parse_msg += "Invalid Pair found, "
-
-        log_entry.valid = (log_entry_is_valid == True)
-        session.log_entry_list.append(log_entry)
+        parse_result = session.line_parser.parse(log_line)
+        session.stage_timer.add_wall_time("parse", time.perf_counter() - parse_start)
+        return get_parsed_log_entry(session, parse_result, log_line_number)
     except Exception as err:
-        session.logger.info("Problem - " + str(err) + " - parsing log line: " + log_line)
+        session.logger.note("parsing problem", "Problem - %s - parsing log line: %s", err, log_line)
+        return None
 
 
-def analyze_performance_log(session):
+# Parse the perf log line in mapped_log[start:end] and return the resulting log entry.
+# The entry's full_log_entry is a view of the line that's decoded only if it's written.
+def parse_mapped_log_line(session, mapped_log, log_view, start, end, log_line_number):
+    if (session.line_filter != None and not session.line_filter.may_match_buffer(mapped_log, start, end)):
+        session.lines_prefiltered += 1
+        return None
+    parse_start = time.perf_counter()
+    try:
+        parse_result = session.line_parser.parse_buffer(mapped_log, start, end, log_view)
+        session.stage_timer.add_wall_time("parse", time.perf_counter() - parse_start)
+        return get_parsed_log_entry(session, parse_result, log_line_number)
+    except Exception as err:
+        session.logger.note("parsing problem", "Problem - %s - parsing log line: %s", err,
+                            mapped_log[start:end].decode(errors='replace'))
+        return None
+
+
+# Return the log entry for a line parsed by the session's LineParser, or None if it
+# doesn't match the filter
+def get_parsed_log_entry(session, parse_result, log_line_number):
+    full_log_entry, fields, invalid_pairs = parse_result
+    if (session.line_filter != None and (fields == None or not session.line_filter.matches(fields))):
+        session.entries_filtered += 1
+        return None
+
+    log_entry = LogEntry()
+    log_entry.log_line = log_line_number
+    log_entry.full_log_entry = full_log_entry
+
+    # Check for valid row header
+    if (fields == None):
+        log_entry.valid = False
+        session.logger.note("header not found",
+                            "Parsing Note: log line #%d is invalid. Header not found", log_line_number)
+        log_entry.parse_notes = [(PARSE_NOTE_HEADER_NOT_FOUND, None)]
+        return log_entry
+
+    log_entry.fields = fields
+    if (len(invalid_pairs) > 0):
+        for item in invalid_pairs: # Discard the invalid pairs
+            session.logger.note("invalid pair", "Parsing Note: On log line #%d, discarding invalid Pair: \"%s\"",
+                                log_line_number, item)
+        log_entry.parse_notes = [(PARSE_NOTE_INVALID_PAIRS, len(invalid_pairs))]
+
+    # Convert the timestamps to ints once here rather than for each timing pair that uses them
+    for key in session.timestamp_keys:
+        value = fields.get(key)
+        if (value != None):
+            try:
+                fields[key] = int(value)
+            except (ValueError):
+                del fields[key] # Discard the invalid timestamp
+                session.logger.note("invalid timestamp",
+                                    "Parsing Note: On log line #%d, discarding invalid timestamp %s: \"%s\"",
+                                    log_line_number, key, value)
+                if (log_entry.parse_notes == None):
+                    log_entry.parse_notes = []
+                log_entry.parse_notes.append((PARSE_NOTE_INVALID_TIMESTAMP, key))
+
+    return log_entry
+
+
+# Analyze perf log entries. If log_entries isn't given, the entries loaded into
+# session.log_entry_list are analyzed. Passing a generator such as the one returned
+# by read_performance_log() analyzes each entry as it's parsed, so no entry is
+# held once its results are written.
+def analyze_performance_log(session, log_entries=None):
 
     # Ideally, we'll loop through all the log entries only once, doing all the processing
     # we can in this loop.
 
     session.logger.info("Starting performance log analysis.")
 
+    if (log_entries == None):
+        log_entries = session.log_entry_list
+
     try:
+        write_log_details_header(session)
+
+        for log_details_row in analyze_log_entries(session, log_entries):
+            write_log_details_row(session, log_details_row)
+        write_kept_log_details_rows(session)
+
+    except (Exception) as ex:
+        session.logger.info("Problem during performance analysis - " + str(ex) + " - Exiting analysis.")
+
+    finally:
+        session.logger.info("Completed performance analysis.")
+
+
+# Set up header row of log details sheet in analysis results doc
+def write_log_details_header(session):
+    session.result_sink.write_log_details_header(("Log Line", "Total Processing Time", "Parse Message",
+                                                  "Analysis Errors", "Full Log Entry", "Log File"))
 
-        # Set up header row of log details sheet in analysis results doc
-        ws_row = 1
-        ws_col = 1
-        log_line_col = 1
-        total_proc_time_col = 2
-        parse_msg_col = 3
-        analysis_errors_col = 4
-        full_log_entry_col = 5
-        session.xls_doc.write_cell(session.ws_full_log,ws_row, log_line_col, "Log Line")
-        session.xls_doc.write_cell(session.ws_full_log,ws_row, total_proc_time_col, "Total Processing Time")
-        session.xls_doc.write_cell(session.ws_full_log,ws_row, parse_msg_col, "Parse Message")
-        session.xls_doc.write_cell(session.ws_full_log,ws_row, analysis_errors_col, "Analysis Errors")
-        session.xls_doc.write_cell(session.ws_full_log,ws_row, full_log_entry_col, "Full Log Entry")
-
-        for entry in session.log_entry_list:
-            if (entry.valid == True):
-                session.valid_log_entry_count += 1
+
+# Return the log details row for an analyzed entry, with the text of its parse notes
+# and violations
+def get_log_details_row(session, entry, entry_total_proc_time, violations):
+    return (entry.log_line, entry_total_proc_time, get_parse_message(entry.parse_notes),
+            get_violations_text(session, violations), get_line_text(entry.full_log_entry),
+            entry.log_file)
+
+
+# Return the Parse Message text of an entry's parse notes
+def get_parse_message(parse_notes):
+    if (parse_notes == None):
+        return ""
+    parse_message = ""
+    for parse_note, detail in parse_notes:
+        if (parse_note == PARSE_NOTE_INVALID_PAIRS):
+            parse_message += PARSE_NOTE_TEXT[parse_note] * detail
+        else:
+            parse_message += PARSE_NOTE_TEXT[parse_note].format(detail)
+    return parse_message
+
+
+# Return the note text of a violation from analyze_log_entry()
+def get_violation_note(session, violation):
+    log_line, timing_index, delta, max_latency = violation
+    if (delta == None):
+        return TOTAL_TIME_MISSING_NOTE % (log_line,)
+    if (timing_index == len(session.timing_pairs)):
+        return TOTAL_TIME_NOTE % (log_line, delta, max_latency)
+    timing_pair = session.timing_pair_list[timing_index]
+    return MAX_LATENCY_NOTE % (log_line, timing_pair.start_key, timing_pair.end_key, delta, max_latency)
+
+
+# Log the note of a violation from analyze_log_entry(). Notes past the note limit aren't formatted.
+def note_violation(session, violation):
+    log_line, timing_index, delta, max_latency = violation
+    if (delta == None):
+        session.logger.note("total time missing", TOTAL_TIME_MISSING_NOTE, log_line,
+                            log_level=LogLevel.ERROR)
+    elif (timing_index == len(session.timing_pairs)):
+        session.logger.note("max latency exceeded", TOTAL_TIME_NOTE, log_line, delta, max_latency)
+    else:
+        timing_pair = session.timing_pair_list[timing_index]
+        session.logger.note("max latency exceeded", MAX_LATENCY_NOTE, log_line, timing_pair.start_key,
+                            timing_pair.end_key, delta, max_latency)
+
+
+# Return the Analysis Errors text of an entry's violations
+def get_violations_text(session, violations):
+    if (violations == None):
+        return ""
+    return "".join("{} - ".format(get_violation_note(session, violation)) for violation in violations)
+
+
+# Write a log details row from get_log_details_row() to the next row of the log details sheet
+def write_log_details_row(session, log_details_row):
+    session.result_sink.write_log_details_row(log_details_row)
+    session.log_details_row_count += 1
+
+
+# Return the log details row for an analyzed entry if the log details policy writes it
+# now, or None if it doesn't. The top_n and sample policies keep the rows they select
+# in session.log_details_heap until write_kept_log_details_rows(). Rows are only built
+# for the entries that are selected, since building one decodes the entry's line and
+# formats its notes.
+def select_log_details_row(session, entry, entry_total_proc_time, violations):
+    log_details_policy = session.log_details_policy
+    if (log_details_policy == "all"):
+        return get_log_details_row(session, entry, entry_total_proc_time, violations)
+    if (log_details_policy == "none"):
+        return None
+    if (log_details_policy == "violations"):
+        if (violations == None):
+            return None
+        return get_log_details_row(session, entry, entry_total_proc_time, violations)
+
+    if (log_details_policy == "top_n"):
+        rank = entry_total_proc_time
+    else:
+        rank = get_sample_rank(entry.log_file, entry.log_line)
+    log_details_heap = session.log_details_heap
+    if (log_details_heap.would_keep(rank)):
+        log_details_heap.add(rank, get_log_details_row(session, entry, entry_total_proc_time, violations))
+    else:
+        log_details_heap.skip()
+    return None
+
+
+# Write the log details rows kept by the top_n policy, slowest first, or the sample
+# policy, in log order
+def write_kept_log_details_rows(session):
+    if (session.log_details_heap == None):
+        return
+    for log_details_row in session.log_details_heap.get_rows(session.log_details_policy == "top_n"):
+        write_log_details_row(session, log_details_row)
+
+
+# Generator that analyzes log entries with the session's analysis engine and yields
+# the log details row for each valid entry the log details policy writes now. The numpy engine analyzes the entries in
+# batches, except in follow mode, where entries are analyzed as they arrive.
+def analyze_log_entries(session, log_entries):
+    if (session.analysis_engine == "numpy" and session.follow_mode != True):
+        log_entries = iter(log_entries)
+        entry_batch = list(islice(log_entries, COLUMNAR_BATCH_SIZE))
+        while (len(entry_batch) > 0):
+            for entry, entry_total_proc_time, violations in analyze_log_entry_batch(session, entry_batch):
+                log_details_row = select_log_details_row(session, entry, entry_total_proc_time, violations)
+                if (log_details_row != None):
+                    yield log_details_row
+            entry_batch = list(islice(log_entries, COLUMNAR_BATCH_SIZE))
+        return
+
+    for entry in log_entries:
+        analysis_result = analyze_log_entry(session, entry)
+        if (analysis_result == None):
+            continue # Don't include this log entry in analysis
+
+        entry_total_proc_time, violations = analysis_result
+        log_details_row = select_log_details_row(session, entry, entry_total_proc_time, violations)
+        if (log_details_row != None):
+            yield log_details_row
+
+
+# Analyze a single log entry, updating the session's timing pairs and timing groups. Returns None
+# for an invalid entry, otherwise a (total processing time, violations) tuple for the
+# entry's row in the log details sheet, where violations is None or a list of the
+# entry's (log line, timing pair ordinal, latency, max latency) violations.
+def analyze_log_entry(session, entry):
+    session.log_entry_count += 1
+    if (entry.valid == True):
+        session.valid_log_entry_count += 1
+    else:
+        session.invalid_log_entry_count += 1
+        return None
+
+    violations = None # Only formatted if the entry's log details row is written
+    fields = entry.fields
+    timings = entry.timings = [None] * (len(session.timing_pairs) + 1)
+
+    # Loop through timing pairs and update vars based on this log entry
+    for timing_index, timing_pair in enumerate(session.timing_pairs.values()):
+        start_key = timing_pair.start_key
+        end_key = timing_pair.end_key
+        max_latency = timing_pair.max_latency
+        if (start_key in fields and end_key in fields):
+            delta = fields[end_key] - fields[start_key]
+            if (delta > max_latency):
+                timing_pair.add_violation(entry.log_file, entry.log_line, delta)
+                session.logger.note("max latency exceeded", MAX_LATENCY_NOTE, entry.log_line,
+                                    start_key, end_key, delta, max_latency)
+                if (violations == None):
+                    violations = []
+                violations.append((entry.log_line, timing_index, delta, max_latency))
+            timings[timing_index] = delta
+            timing_pair.latency_stats.add_latency(delta)
+
+    # Get the total_time for this entry. We need it for the timing_groups below.
+    start_key = session.total_time.start_key
+    end_key = session.total_time.end_key
+    max_latency = session.total_time.max_latency
+    entry_total_proc_time = 0
+    if (start_key in fields and end_key in fields):
+        delta = fields[end_key] - fields[start_key]
+        if (delta > max_latency):
+            session.total_time.add_violation(entry.log_file, entry.log_line, delta)
+            session.logger.note("max latency exceeded", TOTAL_TIME_NOTE, entry.log_line, delta, max_latency)
+            if (violations == None):
+                violations = []
+            violations.append((entry.log_line, len(timings) - 1, delta, max_latency))
+        timings[-1] = delta
+        entry_total_proc_time = delta
+        session.total_time.latency_stats.add_latency(delta)
+    else: #TODO need to do more to handle this error since using this log entry will result in invalid stats
+        session.logger.note("total time missing", TOTAL_TIME_MISSING_NOTE, entry.log_line,
+                            log_level=LogLevel.ERROR)
+        if (violations == None):
+            violations = []
+        violations.append((entry.log_line, len(timings) - 1, None, max_latency))
+
+    # Update the timing groups and group_by groups of this entry's field values
+    if (timings[-1] != None):
+        for log_field_key, value_groups in session.timing_group_index.items():
+            for timing_group in value_groups.get(fields.get(log_field_key), ()):
+                timing_group.add_latency(entry_total_proc_time)
+        for group_by in session.group_bys:
+            group_value = group_by.get_group_value(fields)
+            if (group_value != None):
+                group_by.group_stats.add_latency(group_value, entry_total_proc_time)
+
+        # Add the entry's latencies to the time series bucket its total time starts in
+        if (session.time_series != None):
+            time_bucket = session.time_series.get_bucket(fields[start_key])
+            time_bucket.entry_count += 1
+            for key, delta in zip(session.timing_pairs, timings):
+                if (delta != None):
+                    time_bucket.add_latency(key, delta)
+            time_bucket.add_latency("total_time", entry_total_proc_time)
+
+    return (entry_total_proc_time, violations)
+
+
+# Analyze a batch of log entries with the numpy engine, updating the session's timing
+# pairs and timing groups and logging the same notes as analyze_log_entry() does for
+# each entry. The configured timestamps become int64 columns and the timing group
+# fields become category code columns, so each timing pair's latencies and max latency
+# violations and each timing group's stats are calculated for the whole batch at once.
+# Returns an (entry, total processing time, violations) tuple for each valid entry.
+def analyze_log_entry_batch(session, entry_batch):
+    # Imported here so NumPy is only loaded when the numpy engine is used
+    from columnar_util import get_delta_column, get_field_category_column, get_group_column
+    from columnar_util import get_latency_stats
+    import numpy as np
+
+    valid_entries = [entry for entry in entry_batch if entry.valid == True]
+    session.log_entry_count += len(entry_batch)
+    session.valid_log_entry_count += len(valid_entries)
+    session.invalid_log_entry_count += len(entry_batch) - len(valid_entries)
+    if (len(valid_entries) == 0):
+        return []
+
+    field_dicts = [entry.fields for entry in valid_entries]
+    int_columns = {} # Timestamp columns, shared by the pairs that use them
+    category_columns = {} # Group field columns, shared by the groups that use them
+    entry_violations = {} # Entry index -> list of violations, as analyze_log_entry() returns them
+
+    # Timing pair latencies and max latency violations
+    pair_columns = {}
+    for timing_index, key in enumerate(session.timing_pairs):
+        timing_pair = session.timing_pairs[key]
+        deltas, present = get_delta_column(field_dicts, int_columns, timing_pair.start_key,
+                                           timing_pair.end_key)
+        pair_columns[key] = (deltas, present)
+        max_latency = timing_pair.max_latency
+        violation_indexes = np.flatnonzero(present & (deltas > max_latency)).tolist()
+        for entry_index, delta in zip(violation_indexes, deltas[violation_indexes].tolist()):
+            entry = valid_entries[entry_index]
+            timing_pair.add_violation(entry.log_file, entry.log_line, delta)
+            entry_violations.setdefault(entry_index, []).append(
+                (entry.log_line, timing_index, delta, max_latency))
+        timing_pair.latency_stats.merge(get_latency_stats(deltas[present]))
+
+    # Total time, which the timing groups below are calculated on
+    total_deltas, total_present = get_delta_column(field_dicts, int_columns, session.total_time.start_key,
+                                                   session.total_time.end_key)
+    max_latency = session.total_time.max_latency
+    total_index = len(session.timing_pairs)
+    violation_indexes = np.flatnonzero(total_present & (total_deltas > max_latency)).tolist()
+    for entry_index, delta in zip(violation_indexes, total_deltas[violation_indexes].tolist()):
+        entry = valid_entries[entry_index]
+        session.total_time.add_violation(entry.log_file, entry.log_line, delta)
+        entry_violations.setdefault(entry_index, []).append((entry.log_line, total_index, delta, max_latency))
+    for entry_index in np.flatnonzero(~total_present).tolist():
+        entry_violations.setdefault(entry_index, []).append(
+            (valid_entries[entry_index].log_line, total_index, None, max_latency))
+    session.total_time.latency_stats.merge(get_latency_stats(total_deltas[total_present]))
+
+    # Timing groups, with each group field's column shared by the groups on that field
+    for log_field_key, value_groups in session.timing_group_index.items():
+        codes, categories = get_field_category_column(field_dicts, category_columns, log_field_key)
+        for log_field_value, timing_groups in value_groups.items():
+            if (log_field_value in categories):
+                in_group = total_present & (codes == categories[log_field_value])
+                for timing_group in timing_groups:
+                    timing_group.add_latency_stats(get_latency_stats(total_deltas[in_group]))
+
+    # group_by groups, an array at a time unless the batch has too many group values
+    entry_totals = np.where(total_present, total_deltas, 0).tolist()
+    for group_by in session.group_bys:
+        codes, group_values = get_group_column(field_dicts, category_columns, group_by.log_field_keys)
+        if (len(group_values) <= COLUMNAR_MAX_GROUP_VALUES):
+            for code, group_value in enumerate(group_values):
+                in_group = total_present & (codes == code)
+                if (None not in group_value and in_group.any()):
+                    group_by.group_stats.add_latency_stats(group_value,
+                                                           get_latency_stats(total_deltas[in_group]))
+        else:
+            entry_codes = codes.tolist()
+            for entry_index in np.flatnonzero(total_present).tolist():
+                group_value = group_values[entry_codes[entry_index]]
+                if (None not in group_value):
+                    group_by.group_stats.add_latency(group_value, entry_totals[entry_index])
+
+    # Time series buckets of the total time start timestamps
+    if (session.time_series != None and total_present.any()):
+        bucket_width = session.time_series.bucket_width
+        bucket_indexes = int_columns[session.total_time.start_key][0] // bucket_width
+        for bucket_index in np.unique(bucket_indexes[total_present]).tolist():
+            in_bucket = total_present & (bucket_indexes == bucket_index)
+            time_bucket = session.time_series.get_bucket(bucket_index * bucket_width)
+            time_bucket.entry_count += int(in_bucket.sum())
+            for key, (deltas, present) in pair_columns.items():
+                if ((in_bucket & present).any()):
+                    time_bucket.add_latency_stats(key, get_latency_stats(deltas[in_bucket & present]))
+            time_bucket.add_latency_stats("total_time", get_latency_stats(total_deltas[in_bucket]))
+
+    # Log the notes in log order and return the entries' log details
+    analysis_results = []
+    for entry_index, entry in enumerate(valid_entries):
+        violations = entry_violations.get(entry_index)
+        if (violations != None):
+            for violation in violations:
+                note_violation(session, violation)
+        analysis_results.append((entry, entry_totals[entry_index], violations))
+    return analysis_results
+
+
+# Analyze the perf log with a pool of processes. The log is split into byte ranges that
+# end on line boundaries and each range is parsed and analyzed in a worker process. The
+# workers' timing pair and timing group stats are merged into the session, and their
+# results are merged in log order so the log details sheet and the app log match a
+# single process analysis, exact line numbers included.
+def analyze_performance_log_parallel(session):
+    # Imported here so multiprocessing is only loaded when the log is analyzed in parallel
+    from concurrent.futures import ProcessPoolExecutor
+
+    session.logger.info("Starting parallel performance log analysis with {} processes.".format(
+        session.parallel_workers))
+    session.load_successful = True
+
+    try:
+        write_log_details_header(session)
+        # Compressed files can't be split, so each is one chunk
+        chunks = []
+        for perf_log_file in session.perf_log_files:
+            if (is_compressed_file(perf_log_file)):
+                chunks.append((perf_log_file, 0, None))
             else:
-                session.invalid_log_entry_count += 1
-                continue # Don't include this log entry in analysis
-
-            ws_row += 1 # Move to a new row to write log entry analysis results.
-
-            err_msgs = "" # Keep all err msgs together and then write to column in xls doc
-
-            # Loop through timing pairs and update vars based on this log entry
-            for key in session.timing_pairs:
-                start_key = session.timing_pairs[key].start_key
-                end_key = session.timing_pairs[key].end_key
-                display_name = session.timing_pairs[key].display_name
-                max_latency = int(session.timing_pairs[key].max_latency)
-                if (start_key in entry.fields and end_key in entry.fields):
-                    delta = int(entry.fields[end_key]) - int(entry.fields[start_key])
-                    if (delta > max_latency):
-                        max_allowed_violation = "Analysis Note: On log line #{}, {} -> {} delta of {} ms exceeds max allowed ({} ms)".format(
-                            str(entry.log_line), start_key, end_key, delta, max_latency)
-                        session.logger.info(max_allowed_violation)
-                        err_msgs += "{} - ".format(max_allowed_violation)
-                    entry.timings[key] = LogEntryTiming(start_key, end_key, delta)
-                    #print("entry.timings = {}".format(entry.timings))
-
-            # Get the total_time for this entry. We need it for the timing_groups below.
-            start_key = session.total_time.start_key
-            end_key = session.total_time.end_key
-            max_latency = session.total_time.max_latency
-            entry_total_proc_time = 0
-            if (start_key in entry.fields and end_key in entry.fields):
-                delta = int(entry.fields[end_key]) - int(entry.fields[start_key])
-                if (delta > max_latency):
-                    max_allowed_violation = "Analysis Note: On log line #{}, total time of {} ms exceeds max allowed ({} ms)".format(
-                        entry.log_line, delta, max_latency)
-                    session.logger.info(max_allowed_violation)
-                    err_msgs += "{} - ".format(max_allowed_violation)
-                entry.timings["total_time"] = LogEntryTiming(start_key, end_key, delta)
-                entry_total_proc_time = entry.timings["total_time"].value
-            else: #TODO need to do more to handle this error since using this log entry will result in invalid stats
-                total_time_error = "Analysis Error: On log line #{}, cannot calculate total time".format(
-                        entry.log_line)
-                session.logger.error(total_time_error)
-                err_msgs += "{} - ".format(total_time_error)
-
-            # Loop through timing groups and update vars based on this log entry
-            for key in session.timing_groups:
-                log_field_key = session.timing_groups[key].log_field_key
-                log_field_value = session.timing_groups[key].log_field_value
-                if (log_field_key in entry.fields):
-                    if (entry.fields[log_field_key] == log_field_value):
-                        session.timing_groups[key].group_count += 1
-                        timing_value = entry.timings["total_time"].value
-                        session.timing_groups[key].total_latency += timing_value
-                        if (session.timing_groups[key].min_latency > timing_value):
-                            session.timing_groups[key].min_latency = timing_value
-                        if (session.timing_groups[key].max_latency < timing_value):
-                            session.timing_groups[key].max_latency = timing_value
-                        #print("Found entry.fields[log_field_key] = {}".format(log_field_value))
-
-            session.xls_doc.write_cell(session.ws_full_log,ws_row, log_line_col, entry.log_line)
-            session.xls_doc.write_cell(session.ws_full_log,ws_row, total_proc_time_col, entry_total_proc_time)
-            session.xls_doc.write_cell(session.ws_full_log,ws_row, full_log_entry_col, entry.full_log_entry)
-            session.xls_doc.write_cell(session.ws_full_log,ws_row, parse_msg_col, entry.parse_msg)
-            session.xls_doc.write_cell(session.ws_full_log,ws_row, analysis_errors_col, err_msgs)
-
-            '''
-            self.valid = True # Whether this is a valid log entry
-            self.parse_msg = "" # Store msg from parsing code
-            self.full_log_entry = None
-            self.log_line = 0 # This log entry's line/position in the performance log
-            self.proc_start_time = None # date/time when processing began on this msg/item
-            self.fields = {}
-            self.timings = {}
-            '''
+                chunks.extend((perf_log_file, start, end) for start, end in
+                              get_file_chunks(perf_log_file, session.parallel_chunk_size))
+        with ProcessPoolExecutor(max_workers=session.parallel_workers,
+                                 initializer=init_chunk_worker,
+                                 initargs=(copy_analysis_config(session),)) as executor:
+            # Count the lines in each chunk of an uncompressed file first so
+            # each worker knows the line number its chunk starts at.
+            split_chunks = [chunk for chunk in chunks if chunk[2] != None]
+            chunk_line_counts = dict(zip(split_chunks, executor.map(
+                count_lines, [chunk[0] for chunk in split_chunks],
+                [chunk[1] for chunk in split_chunks], [chunk[2] for chunk in split_chunks])))
+            chunk_tasks = []
+            for perf_log_file, start, end in chunks:
+                if (start == 0):
+                    first_line_number = 1 # Line numbers start over in each file
+                chunk_tasks.append((perf_log_file, start, end, first_line_number))
+                if (end != None):
+                    first_line_number += chunk_line_counts[(perf_log_file, start, end)]
+
+            # Keep a bounded number of chunks in flight so finished chunks don't
+            # pile up in memory while earlier ones are still being merged.
+            chunk_tasks = iter(chunk_tasks)
+            pending_chunks = deque(executor.submit(analyze_log_chunk, chunk_task) for chunk_task in
+                                   islice(chunk_tasks, session.parallel_workers * 2))
+            while (len(pending_chunks) > 0):
+                chunk_session, log_details_rows = pending_chunks.popleft().result()
+                for chunk_task in islice(chunk_tasks, 1):
+                    pending_chunks.append(executor.submit(analyze_log_chunk, chunk_task))
+                merge_chunk_results(session, chunk_session, log_details_rows)
+        write_kept_log_details_rows(session)
+
+    except (IOError) as error:
+        session.logger.info("Problem reading " + session.perf_log_file +
+                            " Performance log load incomplete.")
+        session.load_successful = False
 
     except (Exception) as ex:
         session.logger.info("Problem during performance analysis - " + str(ex) + " - Exiting analysis.")
@@ -358,25 +1616,283 @@ def analyze_performance_log(session):
         session.logger.info("Completed performance analysis.")
 
 
+# Return a new session with the log format and analysis config of session and none of its results
+def copy_analysis_config(session):
+    analysis_session = AnalysisSession()
+    analysis_session.perf_log_file = session.perf_log_file
+    analysis_session.perf_log_files = session.perf_log_files
+    analysis_session.row_header = session.row_header
+    analysis_session.field_separator = session.field_separator
+    analysis_session.pair_separator = session.pair_separator
+    analysis_session.line_parser = session.line_parser
+    analysis_session.mapped_input = session.mapped_input
+    analysis_session.analysis_engine = session.analysis_engine
+    analysis_session.note_limit = session.note_limit
+    analysis_session.log_details_policy = session.log_details_policy
+    analysis_session.log_details_max_rows = session.log_details_max_rows
+    if (session.log_details_heap != None):
+        analysis_session.log_details_heap = DetailRowHeap(session.log_details_max_rows)
+    analysis_session.log_fields = session.log_fields
+    for key, timing_pair in session.timing_pairs.items():
+        analysis_session.timing_pairs[key] = TimingPair(timing_pair.start_key, timing_pair.end_key,
+                                                        timing_pair.display_name,
+                                                        timing_pair.max_latency,
+                                                        timing_pair.worst_violations.max_rows)
+    analysis_session.timing_pair_list = list(analysis_session.timing_pairs.values())
+    for key, timing_group in session.timing_groups.items():
+        analysis_session.timing_groups[key] = TimingGroup(timing_group.log_field_key,
+                                                          timing_group.log_field_value,
+                                                          timing_group.display_name)
+    analysis_session.timing_group_index = get_timing_group_index(analysis_session.timing_groups)
+    analysis_session.timestamp_keys = session.timestamp_keys
+    analysis_session.analysis_filter = session.analysis_filter
+    analysis_session.line_filter = session.line_filter
+    analysis_session.correlation_key = session.correlation_key
+    if (session.join_table != None):
+        analysis_session.join_table = JoinTable(session.join_table.complete_keys,
+                                                session.join_table.ttl_ms,
+                                                session.join_table.max_records)
+    for group_by in session.group_bys:
+        analysis_session.group_bys.append(GroupBy(group_by.log_field_keys, group_by.max_groups))
+    analysis_session.time_series_bucket_width = session.time_series_bucket_width
+    analysis_session.time_series_max_buckets = session.time_series_max_buckets
+    if (session.time_series != None):
+        analysis_session.time_series = LatencyTimeSeries(session.time_series_bucket_width,
+                                                         session.time_series_max_buckets)
+    if (session.total_time != None):
+        analysis_session.total_time = TimingPair(session.total_time.start_key,
+                                                 session.total_time.end_key,
+                                                 session.total_time.display_name,
+                                                 session.total_time.max_latency,
+                                                 session.total_time.worst_violations.max_rows)
+    return analysis_session
+
+
+def init_chunk_worker(worker_session):
+    global chunk_worker_session
+    chunk_worker_session = worker_session
+
+
+# Parse and analyze the lines in one byte range of a perf log file, or in the whole
+# file if end is None. Runs in a worker process. Returns the session holding the
+# chunk's stats and log messages, and the chunk's log details rows.
+def analyze_log_chunk(chunk_task):
+    perf_log_file, start, end, first_line_number = chunk_task
+    session = copy_analysis_config(chunk_worker_session)
+    session.logger = BufferedLogger(session.note_limit)
+    section_start = session.stage_timer.start_section()
+    log_details_rows = list(analyze_log_entries(session, time_log_entries(
+        session.stage_timer, read_log_file_entries(session, perf_log_file, start, end,
+                                                   first_line_number))))
+    session.stage_timer.end_section(section_start, ["parse", "load", "analyze"])
+    return (session, log_details_rows)
+
+
+# Merge the stats, log messages, and log details rows of an analyzed chunk into session
+def merge_chunk_results(session, chunk_session, log_details_rows):
+    chunk_session.logger.replay(session.logger)
+    if (session.worker_stage_timer == None):
+        session.worker_stage_timer = StageTimer()
+    session.worker_stage_timer.merge(chunk_session.stage_timer)
+    merge_analysis_stats(session, chunk_session)
+    for log_details_row in log_details_rows:
+        write_log_details_row(session, log_details_row)
+    if (session.log_details_heap != None):
+        session.log_details_heap.merge(chunk_session.log_details_heap)
+
+
+# Add the analysis stats of other_session, which has the same config, to those of session
+def merge_analysis_stats(session, other_session):
+    session.log_entry_count += other_session.log_entry_count
+    session.valid_log_entry_count += other_session.valid_log_entry_count
+    session.invalid_log_entry_count += other_session.invalid_log_entry_count
+    session.lines_prefiltered += other_session.lines_prefiltered
+    session.entries_filtered += other_session.entries_filtered
+    for key in session.timing_pairs:
+        session.timing_pairs[key].latency_stats.merge(other_session.timing_pairs[key].latency_stats)
+        session.timing_pairs[key].violation_count += other_session.timing_pairs[key].violation_count
+        session.timing_pairs[key].worst_violations.merge(other_session.timing_pairs[key].worst_violations)
+    if (session.total_time != None):
+        session.total_time.latency_stats.merge(other_session.total_time.latency_stats)
+        session.total_time.violation_count += other_session.total_time.violation_count
+        session.total_time.worst_violations.merge(other_session.total_time.worst_violations)
+    for key in session.timing_groups:
+        session.timing_groups[key].merge(other_session.timing_groups[key])
+    for group_by, other_group_by in zip(session.group_bys, other_session.group_bys):
+        group_by.group_stats.merge(other_group_by.group_stats)
+    if (session.time_series != None):
+        session.time_series.merge(other_session.time_series)
+    if (session.join_table != None and other_session.join_table != None):
+        session.join_table.merge_counts(other_session.join_table)
+        session.lines_without_correlation_key += other_session.lines_without_correlation_key
+
+
+# Analyze each of perf_log_files on its own with a pool of batch_workers processes,
+# writing each file's results to its own results files, and then write the combined
+# results of all of them through the session's result sinks. The config is loaded and
+# compiled once and sent to each worker once. Files are analyzed largest first so a
+# large file doesn't start last and hold up the batch. A file that fails is reported,
+# its results files are removed, and it's left out of the combined results, and the
+# rest of the batch carries on.
+def analyze_batch(session, perf_log_files, batch_workers):
+    # Imported here so multiprocessing is only loaded for batches
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    # A file that can't be sized, e.g. since it was removed after the batch was listed,
+    # fails without being analyzed
+    file_results = {}
+    file_sizes = {}
+    for perf_log_file in perf_log_files:
+        try:
+            file_sizes[perf_log_file] = os.path.getsize(perf_log_file)
+        except (OSError) as error:
+            file_sizes[perf_log_file] = None
+            file_results[perf_log_file] = {"perf_log_file": perf_log_file, "error": str(error),
+                                           "logger": None, "stage_timer": None, "analysis_state": None,
+                                           "secs": None, "results_prefix": None}
+            session.logger.info("Problem analyzing " + perf_log_file + " - " + str(error) +
+                                " - Leaving it out of the combined results.")
+    perf_log_files = sorted([perf_log_file for perf_log_file in perf_log_files
+                             if file_sizes[perf_log_file] != None],
+                            key=lambda perf_log_file: -file_sizes[perf_log_file])
+    session.logger.info("Starting batch analysis of {} performance log files with {} processes.".format(
+        len(perf_log_files), batch_workers))
+    batch_config = copy_analysis_config(session)
+    batch_config.session_time = session.session_time
+    batch_config.app_log_file_dir = session.app_log_file_dir
+    batch_config.excel_results_file = session.excel_results_file
+    batch_config.excel_write_only = session.excel_write_only
+    batch_config.result_sink_names = session.result_sink_names
+
+    with ProcessPoolExecutor(max_workers=batch_workers, initializer=init_chunk_worker,
+                             initargs=(batch_config,)) as executor:
+        pending_files = {executor.submit(analyze_batch_file, perf_log_file): perf_log_file
+                         for perf_log_file in perf_log_files}
+        for future in as_completed(pending_files):
+            perf_log_file = pending_files[future]
+            try:
+                file_result = future.result()
+            except (Exception) as ex:
+                # The worker itself failed, e.g. it was killed
+                file_result = {"perf_log_file": perf_log_file, "error": str(ex), "logger": None,
+                               "stage_timer": None, "analysis_state": None, "secs": None,
+                               "results_prefix": None}
+            file_results[perf_log_file] = file_result
+            session.logger.info("{} Results for {} {}".format(LOG_SECTION_HEADER, perf_log_file,
+                                                              LOG_SECTION_FOOTER))
+            if (file_result["logger"] != None):
+                file_result["logger"].replay(session.logger)
+            if (file_result["error"] != None):
+                session.logger.info("Problem analyzing " + perf_log_file + " - " + file_result["error"] +
+                                    " - Leaving it out of the combined results.")
+
+    # Merge the files' stats in file order so the combined results don't depend on
+    # which worker finished first
+    batch_rows = []
+    for perf_log_file in sorted(file_results):
+        file_result = file_results[perf_log_file]
+        analysis_state = file_result["analysis_state"]
+        if (file_result["stage_timer"] != None):
+            if (session.worker_stage_timer == None):
+                session.worker_stage_timer = StageTimer()
+            session.worker_stage_timer.merge(file_result["stage_timer"])
+        if (file_result["error"] == None):
+            merge_analysis_state(session, analysis_state)
+        batch_rows.append([perf_log_file, file_sizes[perf_log_file],
+                           "failed" if file_result["error"] != None else "analyzed",
+                           analysis_state["log_entry_count"] if analysis_state != None else None,
+                           analysis_state["valid_log_entry_count"] if analysis_state != None else None,
+                           round(file_result["secs"], 3) if file_result["secs"] != None else None,
+                           file_result["results_prefix"], file_result["error"] or ""])
+    failed_count = sum(1 for file_result in file_results.values() if file_result["error"] != None)
+    session.logger.info("Batch analysis complete - {} files analyzed - {} failed".format(
+        len(file_results) - failed_count, failed_count))
+    session.result_sink.write_summary_table(
+        "Batch Files",
+        ["Perf Log File", "Bytes", "Status", "Entries", "Valid Entries", "Secs", "Results Files", "Problem"],
+        batch_rows)
+    return failed_count
+
+
+# Analyze one perf log file of a batch in a worker process, writing its results to
+# results files named after it. Returns a dict of the file's log messages, stage
+# times, and analysis state, or the problem that stopped it being analyzed.
+def analyze_batch_file(perf_log_file):
+    batch_config = chunk_worker_session
+    session = copy_analysis_config(batch_config)
+    session.perf_log_file = perf_log_file
+    session.perf_log_files = [perf_log_file]
+    session.logger = BufferedLogger(session.note_limit)
+    results_prefix = "{}-{}-{}".format(batch_config.session_time, os.path.basename(perf_log_file),
+                                       os.path.splitext(batch_config.excel_results_file)[0])
+    file_result = {"perf_log_file": perf_log_file, "error": None, "logger": session.logger,
+                   "stage_timer": session.stage_timer, "analysis_state": None, "secs": None,
+                   "results_prefix": results_prefix}
+    start_time = time.perf_counter()
+    try:
+        session.result_sink = create_result_sinks(
+            batch_config.result_sink_names, batch_config.app_log_file_dir, results_prefix,
+            "{}-{}-{}".format(batch_config.session_time, os.path.basename(perf_log_file),
+                              batch_config.excel_results_file),
+            batch_config.excel_write_only)
+        session.result_sink.write_run_info("App version", APP_VERSION)
+        session.result_sink.write_run_info("Performance log file", perf_log_file)
+        session.result_sink.write_run_info("Analyzer start time", batch_config.session_time)
+
+        # Analyzed here rather than by analyze_performance_log() so problems aren't
+        # just logged but fail the file
+        section_start = session.stage_timer.start_section()
+        write_log_details_header(session)
+        for log_details_row in analyze_log_entries(session, time_log_entries(
+                session.stage_timer, get_analysis_entries(session, read_performance_log(session)))):
+            write_log_details_row(session, log_details_row)
+        write_kept_log_details_rows(session)
+        session.stage_timer.end_section(section_start, ["parse", "load", "analyze"])
+        if (session.load_successful != True):
+            raise IOError("Performance log not fully read")
+        if (write_analysis_results(session) == False):
+            raise RuntimeError("Results files not written")
+        file_result["analysis_state"] = get_analysis_state(session)
+    except (Exception) as ex:
+        file_result["error"] = str(ex)
+        file_result["results_prefix"] = None
+        if (session.result_sink != None):
+            # Remove the file's partial results so they can't be taken for good ones
+            try:
+                session.result_sink.discard()
+            except (Exception):
+                pass # Already reporting the problem that stopped the file
+    file_result["secs"] = time.perf_counter() - start_time
+    return file_result
+
+
 def write_analysis_results(session):
+    section_start = session.stage_timer.start_section()
 
     try:
         analysis_results_header = "***Beginning Analysis Results***"
         session.logger.info(analysis_results_header)
 
-        entries_analyzed = ("{} log entries Analyzed - ".format(str(len(session.log_entry_list))) +
+        entries_analyzed = ("{} log entries Analyzed - ".format(str(session.log_entry_count)) +
                             "{} valid entries included in analysis - ".format(str(session.valid_log_entry_count)) +
                             "{} invalid entries excluded from analysis".format(str(session.invalid_log_entry_count)))
         session.logger.info(entries_analyzed)
-        session.ws_summary.cell(row=1, column=1).value = "Analysis Results Summary"
-
-        ws_row = 3
-        ws_col = 1
-        session.ws_summary.cell(row=ws_row, column=1).value = "Timing Group"
-        session.ws_summary.cell(row=ws_row, column=2).value = "Min Time (ms)"
-        session.ws_summary.cell(row=ws_row, column=3).value = "Max Time (ms)"
-        session.ws_summary.cell(row=ws_row, column=4).value = "Avg Time (ms)"
-        ws_row += 1
+        if (session.log_details_policy != "all"):
+            session.logger.info("Log details policy {} wrote {} of {} valid entries".format(
+                session.log_details_policy, session.log_details_row_count, session.valid_log_entry_count))
+        session.result_sink.write_run_info("Log details policy", session.log_details_policy)
+        session.result_sink.write_run_info("Log details rows", session.log_details_row_count)
+        if (session.analysis_filter != None):
+            filter_results = ("Filter \"{}\" skipped {} lines before parsing - ".format(
+                                  session.analysis_filter.filter_text, session.lines_prefiltered) +
+                              "{} parsed entries didn't match".format(session.entries_filtered))
+            session.logger.info(filter_results)
+            session.result_sink.write_run_info("Analysis filter", session.analysis_filter.filter_text)
+            session.result_sink.write_run_info("Lines skipped by filter pre-check", session.lines_prefiltered)
+            session.result_sink.write_run_info("Entries not matching filter", session.entries_filtered)
+
+        percentile_headers = ["P{} Time (ms)".format(percentile) for percentile in REPORT_PERCENTILES]
+        timing_group_rows = []
         for key in session.timing_groups:
             if (session.timing_groups[key].group_count > 0):
                 avg_time = session.timing_groups[key].total_latency / session.timing_groups[key].group_count
@@ -384,20 +1900,169 @@ def write_analysis_results(session):
                 group_report_line_0 += ", min time = {} ms".format(session.timing_groups[key].min_latency)
                 group_report_line_0 += ", max time = {} ms".format(session.timing_groups[key].max_latency)
                 group_report_line_0 += ", avg time = {:.2f} ms".format(avg_time)
+                for percentile in REPORT_PERCENTILES:
+                    group_report_line_0 += ", p{} time = {} ms".format(
+                        percentile, session.timing_groups[key].get_percentile(percentile))
                 session.logger.info(group_report_line_0)
-                session.ws_summary.cell(row=ws_row, column=1).value = session.timing_groups[key].display_name
-                session.ws_summary.cell(row=ws_row, column=2).value = session.timing_groups[key].min_latency
-                session.ws_summary.cell(row=ws_row, column=3).value = session.timing_groups[key].max_latency
-                session.ws_summary.cell(row=ws_row, column=4).value = "{:.2f}".format(avg_time)
-                ws_row += 1
+                timing_group_rows.append([session.timing_groups[key].display_name,
+                                          session.timing_groups[key].min_latency,
+                                          session.timing_groups[key].max_latency,
+                                          round(avg_time, 2)] +
+                                         [session.timing_groups[key].get_percentile(percentile)
+                                          for percentile in REPORT_PERCENTILES])
             else:
                 group_report_line_0 = "For timing group \"{}\"".format(session.timing_groups[key].display_name)
                 group_report_line_0 += ", no records found so no stats calculated"
                 session.logger.info(group_report_line_0)
-
-        save_file_name = (session.app_log_file_dir + os.sep + session.session_time
-                           + "-" + session.excel_results_file)
-        session.xls_doc.save_doc()
+        session.result_sink.write_summary_table(
+            "Timing Groups",
+            ["Timing Group", "Min Time (ms)", "Max Time (ms)", "Avg Time (ms)"] + percentile_headers,
+            timing_group_rows)
+
+        # Stats for each timing pair and the total time pair, with how many latencies
+        # exceeded the pair's max latency and what share of its latencies they are
+        timing_pair_rows = []
+        timing_pairs = list(session.timing_pairs.values())
+        if (session.total_time != None):
+            timing_pairs.append(session.total_time)
+        for timing_pair in timing_pairs:
+            latency_stats = timing_pair.latency_stats
+            pair_report_line_0 = "For timing pair \"{}\"".format(timing_pair.display_name)
+            if (latency_stats.count == 0):
+                pair_report_line_0 += ", no records found so no stats calculated"
+                session.logger.info(pair_report_line_0)
+                continue
+            pair_report_line_0 += ", min time = {} ms".format(latency_stats.min_latency)
+            pair_report_line_0 += ", max time = {} ms".format(latency_stats.max_latency)
+            pair_report_line_0 += ", avg time = {:.2f} ms".format(latency_stats.get_avg_latency())
+            for percentile in REPORT_PERCENTILES:
+                pair_report_line_0 += ", p{} time = {} ms".format(
+                    percentile, latency_stats.get_percentile(percentile))
+            pair_report_line_0 += ", count = {}".format(latency_stats.count)
+            violation_percent = 100 * timing_pair.violation_count / latency_stats.count
+            pair_report_line_0 += ", max allowed time exceeded {} times ({:.2f}%)".format(
+                timing_pair.violation_count, violation_percent)
+            session.logger.info(pair_report_line_0)
+            timing_pair_rows.append([timing_pair.display_name, latency_stats.min_latency,
+                                     latency_stats.max_latency,
+                                     round(latency_stats.get_avg_latency(), 2)] +
+                                    [latency_stats.get_percentile(percentile)
+                                     for percentile in REPORT_PERCENTILES] +
+                                    [latency_stats.count, timing_pair.max_latency,
+                                     timing_pair.violation_count, round(violation_percent, 2)])
+        session.result_sink.write_summary_table(
+            "Timing Pairs",
+            ["Timing Pair", "Min Time (ms)", "Max Time (ms)", "Avg Time (ms)"] + percentile_headers +
+            ["Count", "Max Allowed Time (ms)", "Violations", "Violation Rate (%)"],
+            timing_pair_rows)
+
+        # The largest latencies of each timing pair that exceeded its max latency,
+        # which summary_only leaves out
+        if (session.summary_only != True):
+            worst_violation_rows = []
+            for timing_pair in timing_pairs:
+                worst_violations = timing_pair.worst_violations.get_rows(True)
+                if (len(worst_violations) == 0):
+                    continue
+                session.logger.info("For timing pair \"{}\", worst violations = {}".format(
+                    timing_pair.display_name, ", ".join("{} ms on log line #{} of {}".format(
+                        latency, log_line, log_file) for log_file, log_line, latency in worst_violations)))
+                for rank, (log_file, log_line, latency) in enumerate(worst_violations, start=1):
+                    worst_violation_rows.append([timing_pair.display_name, rank, latency,
+                                                 timing_pair.max_latency,
+                                                 latency - timing_pair.max_latency, log_file, log_line])
+            if (len(worst_violation_rows) > 0):
+                session.result_sink.write_summary_table(
+                    "Worst Violations",
+                    ["Timing Pair", "Rank", "Time (ms)", "Max Allowed Time (ms)", "Over By (ms)", "Log File",
+                     "Log Line"],
+                    worst_violation_rows)
+
+        # Total time stats for each group of each group_by item, largest groups first.
+        # Count Error is nonzero for groups tracked after the group limit was reached,
+        # and is how many more entries the group may have had.
+        if (len(session.group_bys) > 0):
+            group_by_rows = []
+            for group_by in session.group_bys:
+                for group_value, latency_stats, count_error in group_by.group_stats.get_groups():
+                    group_name = "+".join(group_value)
+                    group_report_line_0 = "For group by \"{}\" group \"{}\"".format(
+                        group_by.display_name, group_name)
+                    group_report_line_0 += ", min time = {} ms".format(latency_stats.min_latency)
+                    group_report_line_0 += ", max time = {} ms".format(latency_stats.max_latency)
+                    group_report_line_0 += ", avg time = {:.2f} ms".format(latency_stats.get_avg_latency())
+                    for percentile in REPORT_PERCENTILES:
+                        group_report_line_0 += ", p{} time = {} ms".format(
+                            percentile, latency_stats.get_percentile(percentile))
+                    group_report_line_0 += ", count = {}".format(latency_stats.count)
+                    if (count_error > 0):
+                        group_report_line_0 += " (up to {} more)".format(count_error)
+                    session.logger.info(group_report_line_0)
+                    group_by_rows.append([group_by.display_name, group_name, latency_stats.min_latency,
+                                          latency_stats.max_latency,
+                                          round(latency_stats.get_avg_latency(), 2)] +
+                                         [latency_stats.get_percentile(percentile)
+                                          for percentile in REPORT_PERCENTILES] +
+                                         [latency_stats.count, count_error])
+            session.result_sink.write_summary_table(
+                "Group By",
+                ["Group By", "Group", "Min Time (ms)", "Max Time (ms)", "Avg Time (ms)"] +
+                percentile_headers + ["Count", "Count Error"],
+                group_by_rows)
+
+        # Entries per second and each timing pair's stats in each time series bucket
+        if (session.time_series != None):
+            bucket_secs = session.time_series.bucket_width / 1000
+            time_buckets = session.time_series.get_buckets()
+            session.logger.info("Time series has {} buckets of {:g} secs".format(len(time_buckets),
+                                                                                 bucket_secs))
+            series_names = [(key, timing_pair.display_name)
+                            for key, timing_pair in session.timing_pairs.items()]
+            series_names.append(("total_time", session.total_time.display_name))
+            time_series_rows = []
+            for bucket_start, time_bucket in time_buckets:
+                bucket_start_text = get_time_text(bucket_start)
+                entries_per_sec = round(time_bucket.entry_count / bucket_secs, 2)
+                for key, display_name in series_names:
+                    latency_stats = time_bucket.latency_stats.get(key)
+                    if (latency_stats == None):
+                        continue
+                    time_series_rows.append([bucket_start_text, bucket_secs, time_bucket.entry_count,
+                                             entries_per_sec, display_name, latency_stats.min_latency,
+                                             latency_stats.max_latency,
+                                             round(latency_stats.get_avg_latency(), 2)] +
+                                            [latency_stats.get_percentile(percentile)
+                                             for percentile in REPORT_PERCENTILES] +
+                                            [latency_stats.count])
+            session.result_sink.write_summary_table(
+                "Time Series",
+                ["Bucket Start", "Bucket Secs", "Entries", "Entries/sec", "Timing Pair",
+                 "Min Time (ms)", "Max Time (ms)", "Avg Time (ms)"] + percentile_headers + ["Count"],
+                time_series_rows)
+
+        # Correlated records, with those that left the join table incomplete as orphans
+        if (session.join_table != None):
+            join_table = session.join_table
+            reason_counts = join_table.reason_counts
+            orphan_count = sum(reason_counts.values()) - reason_counts[RECORD_COMPLETE]
+            session.logger.info("Correlation by {} joined {} lines into {} complete records and {} orphaned records".format(
+                session.correlation_key, join_table.lines_joined, reason_counts[RECORD_COMPLETE],
+                orphan_count))
+            session.result_sink.write_summary_table(
+                "Correlation",
+                ["Correlation Key", "Lines Joined", "Complete Records", "Orphans Evicted After TTL",
+                 "Orphans Evicted As Table Full", "Orphans Incomplete At End", "Lines Without Key",
+                 "Most Pending Records"],
+                [[session.correlation_key, join_table.lines_joined, reason_counts[RECORD_COMPLETE],
+                  reason_counts[RECORD_EVICTED_TTL], reason_counts[RECORD_EVICTED_SIZE],
+                  reason_counts[RECORD_END_OF_LOG], session.lines_without_correlation_key,
+                  join_table.most_pending]])
+
+        session.stage_timer.end_section(section_start, ["write"])
+        write_run_stats(session)
+        close_start = time.perf_counter()
+        session.result_sink.close()
+        session.logger.info("Results files closed in {:.3f} secs".format(time.perf_counter() - close_start))
 
     except (Exception) as ex:
         print("Problem during analysis results calculation - " + str(ex) + " - Exiting analyzer.")
@@ -407,39 +2072,106 @@ def write_analysis_results(session):
     session.logger.info(analysis_results_footer)
 
 
+# Write how the run performed to Run Info and the app log: the wall and CPU time of
+# each stage, the perf log lines and bytes processed, and peak memory. Parallel workers'
+# stage times are added up over the workers, so they can be more than the run's.
+def write_run_stats(session):
+    stage_timer = session.stage_timer
+    run_stats = []
+    for stage_name, display_name in RUN_STAGES.items():
+        run_stats.append(("{} wall secs".format(display_name),
+                          round(stage_timer.get_wall_time(stage_name), 3)))
+        run_stats.append(("{} CPU secs".format(display_name),
+                          round(stage_timer.get_cpu_time(stage_name), 3)))
+    if (session.worker_stage_timer != None):
+        for stage_name in ("load", "parse", "analyze"):
+            run_stats.append(("Worker {} wall secs".format(RUN_STAGES[stage_name]),
+                              round(session.worker_stage_timer.get_wall_time(stage_name), 3)))
+            run_stats.append(("Worker {} CPU secs".format(RUN_STAGES[stage_name]),
+                              round(session.worker_stage_timer.get_cpu_time(stage_name), 3)))
+    if (session.run_start_time != None):
+        run_stats.append(("Run wall secs", round(time.perf_counter() - session.run_start_time[0], 3)))
+        run_stats.append(("Run CPU secs", round(time.process_time() - session.run_start_time[1], 3)))
+
+    # Throughput over the stages that read and analyze the log
+    log_bytes = sum(os.path.getsize(perf_log_file) for perf_log_file in session.perf_log_files
+                    if os.path.exists(perf_log_file))
+    analysis_wall = sum(stage_timer.get_wall_time(stage_name) for stage_name in ("load", "parse", "analyze"))
+    run_stats.append(("Lines processed", session.log_entry_count))
+    run_stats.append(("Perf log MB", round(log_bytes / (1024 * 1024), 3)))
+    if (analysis_wall > 0):
+        run_stats.append(("Lines/sec", round(session.log_entry_count / analysis_wall, 1)))
+        run_stats.append(("MB/sec", round(log_bytes / (1024 * 1024) / analysis_wall, 3)))
+    peak_memory = get_peak_memory_mb()
+    if (peak_memory != None):
+        run_stats.append(("Peak memory MB", round(peak_memory, 1)))
+        if (session.worker_stage_timer != None):
+            run_stats.append(("Peak worker memory MB", round(get_peak_memory_mb(children=True), 1)))
+
+    for name, value in run_stats:
+        session.result_sink.write_run_info(name, value)
+        session.logger.info("Run stats: {} = {}".format(name, value))
+
+
+# Return a time in ms since the epoch as local date and time text
+def get_time_text(timestamp):
+    try:
+        return datetime.fromtimestamp(timestamp / 1000).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    except (OverflowError, OSError, ValueError):
+        return str(timestamp) # Not an epoch time
+
+
+# Set session up to only print the timing group and timing pair stats on the console:
+# no results files (so no workbook is set up and openpyxl isn't imported), no log
+# details rows, no worst violations, group_by, or time series stats, and the app log not
+# echoed. Entries are analyzed as they're parsed rather than loaded into memory first.
+def set_summary_only(session):
+    session.result_sink_names = ["console"]
+    session.write_to_excel = False
+    session.log_details_policy = "none"
+    session.log_details_heap = None
+    for timing_pair in session.timing_pair_list:
+        timing_pair.worst_violations = DetailRowHeap(0)
+    if (session.total_time != None):
+        session.total_time.worst_violations = DetailRowHeap(0)
+    session.group_bys = []
+    session.time_series = None
+    session.quiet_mode = True
+    if (session.parallel_workers <= 1 and session.follow_mode != True):
+        session.streaming_mode = True
+
+
 def setup(session):
     ws_row = 1
     ws_col = 1
 
     try:        
-        session.logger = Logger(session.app_log_file_dir, session.app_log_file_name)
+        session.logger = Logger(session.app_log_file_dir, session.app_log_file_name,
+                                session.quiet_mode, session.background_logging,
+                                session.note_limit, session.note_interval)
 
-        session.xls_doc = XLSDoc(session.app_log_file_dir, session.excel_file_name)
-        session.ws_run_info = session.xls_doc.create_worksheet("Run Info", 2)
-        session.ws_summary = session.xls_doc.create_worksheet("Analysis Summary", 0)
-        session.ws_full_log = session.xls_doc.create_worksheet("Analysis Log", 1)
-        session.xls_doc.delete_worksheet("Sheet")
+        results_file_prefix = (session.session_time + "-" +
+                               os.path.splitext(session.excel_results_file)[0])
+        session.result_sink = create_result_sinks(session.result_sink_names,
+                                                  session.app_log_file_dir, results_file_prefix,
+                                                  session.excel_file_name,
+                                                  session.excel_write_only)
 
         session.logger.info(LOG_SECTION_HEADER)
         session.logger.info(APP_NAME + " " + APP_VERSION)
-        session.ws_run_info.cell(row=1, column=1).value = "App Name"
-        session.ws_run_info.cell(row=1, column=2).value = APP_NAME
-        session.ws_run_info.cell(row=2, column=1).value = "App version"
-        session.ws_run_info.cell(row=2, column=2).value = APP_VERSION
+        session.result_sink.write_run_info("App Name", APP_NAME)
+        session.result_sink.write_run_info("App version", APP_VERSION)
         session.logger.info(WELCOME_MSG)
         session.logger.info(AUTHORS)
-        session.ws_run_info.cell(row=3, column=1).value = "Authors"
-        session.ws_run_info.cell(row=3, column=2).value = AUTHORS
+        session.result_sink.write_run_info("Authors", AUTHORS)
         session.logger.info(SOURCE_LINK)
-        session.ws_run_info.cell(row=4, column=1).value = "Source repo"
-        session.ws_run_info.cell(row=4, column=2).value = SOURCE_LINK
+        session.result_sink.write_run_info("Source repo", SOURCE_LINK)
         session.logger.info(LOG_SECTION_FOOTER)
 
         session.logger.info("Analyzer starting. Time is " +
                             session.session_time )
-        session.ws_run_info.cell(row=5, column=1).value = "Analyzer start time"
-        session.ws_run_info.cell(row=5, column=2).value = session.session_time
-        session.xls_doc.save_doc()
+        session.result_sink.write_run_info("Analyzer start time", session.session_time)
+        session.result_sink.flush()
 
         return True
     except (Exception) as ex:
@@ -448,41 +2180,105 @@ def setup(session):
 
 def shutdown(session, exitStatus, exitStatusMessage):
     session.logger.info("Analyzer cleaning up ...")
+    if (session.run_profiler != None):
+        session.run_profiler.stop()
+        for report_line in session.run_profiler.get_report_lines(session.profile_top_n):
+            session.logger.info(report_line)
+        if (session.profile_calls == True):
+            profile_file = os.path.join(session.app_log_file_dir, session.session_time + "-profile.prof")
+            session.run_profiler.save_profile(profile_file)
+            session.logger.info("Profile saved to " + profile_file)
     session.logger.info(exitStatusMessage)
     session.logger.shutdown()
-    app_log_file_msg = "App log file for this session is " + session.app_log_file
-    print("\n" + app_log_file_msg + "\n")
+    if (session.summary_only != True):
+        app_log_file_msg = "App log file for this session is " + session.app_log_file
+        print("\n" + app_log_file_msg + "\n")
     sys.exit(exitStatus)
 
 
 def main():
 
     session = AnalysisSession()
+    session.run_start_time = session.stage_timer.start_section()
 
     load_config(session)
+    if (session.profile_calls == True or session.trace_memory == True):
+        session.run_profiler = RunProfiler(session.profile_calls, session.trace_memory)
+        session.run_profiler.start()
     if (verify_config(session) != True):
         print("\nError loading app configuration. Please check config file. Exiting.\n")
         sys.exit()
 
+    if (session.export_partial_state == True):
+        # The stats are written to a partial state file instead of the result sinks,
+        # so no results files are written or log details rows built
+        session.result_sink_names = []
+        session.write_to_excel = False
+        session.log_details_policy = "none"
+        session.log_details_heap = None
+    elif (session.summary_only == True):
+        set_summary_only(session)
+
     if (setup(session) != True): 
         print("\nError during setup. Exiting.\n")
         sys.exit()
-
-    # Read performance log file and load each log entry
-    # for analysis
-    if (load_performance_log(session) != True):
-        shutdown(session, 0, "Perforpathmance log not loaded. Analyzer exiting")
-
-
-    if (len(session.log_entry_list) == 0):
-        session.logger.info("No log entries suitable for analysis found in log file.")
-        shutdown(session, 0, "Analyzer exiting")
-
-    # Analyze the loaded log entries
-    analyze_performance_log(session)
-
-    # Write analysis results to log and optionally to stdout
-    write_analysis_results(session)
+    session.stage_timer.end_section(session.run_start_time, ["config"])
+
+    if (session.join_table != None and session.parallel_workers > 1 and session.follow_mode != True):
+        # A record's lines can be in different chunks, so correlated logs are analyzed in
+        # a single pass instead
+        session.logger.info("Correlating lines by " + session.correlation_key +
+                            " in a single process, since parallel chunks would split records.")
+        session.parallel_workers = 0
+        session.streaming_mode = True
+
+    if (session.follow_mode == True or session.parallel_workers > 1 or
+            session.streaming_mode == True):
+        section_start = session.stage_timer.start_section()
+        if (session.follow_mode == True):
+            # Analyze lines as they're added to the log, picking up
+            # where the last run left off
+            analyze_performance_log(session, time_log_entries(
+                session.stage_timer, get_analysis_entries(session, follow_performance_log(session))))
+        elif (session.parallel_workers > 1):
+            # Parse and analyze chunks of the log in parallel processes
+            analyze_performance_log_parallel(session)
+        else:
+            # Parse and analyze each log entry in a single pass without
+            # keeping the entries in memory
+            analyze_performance_log(session, time_log_entries(
+                session.stage_timer, get_analysis_entries(session, read_performance_log(session))))
+        session.stage_timer.end_section(section_start, ["parse", "load", "analyze"])
+
+        if (session.load_successful != True):
+            shutdown(session, 0, "Performance log not fully loaded. Analyzer exiting")
+
+        if (session.log_entry_count == 0):
+            session.logger.info("No log entries suitable for analysis found in log file.")
+            shutdown(session, 0, "Analyzer exiting")
+    else:
+        # Read performance log file and load each log entry
+        # for analysis
+        section_start = session.stage_timer.start_section()
+        if (load_performance_log(session) != True):
+            shutdown(session, 0, "Perforpathmance log not loaded. Analyzer exiting")
+        session.stage_timer.end_section(section_start, ["parse", "load"])
+
+
+        if (len(session.log_entry_list) == 0):
+            session.logger.info("No log entries suitable for analysis found in log file.")
+            shutdown(session, 0, "Analyzer exiting")
+
+        # Analyze the loaded log entries
+        section_start = session.stage_timer.start_section()
+        analyze_performance_log(session)
+        session.stage_timer.end_section(section_start, ["analyze"])
+
+    # Write analysis results to log and optionally to stdout, or export the stats
+    if (session.export_partial_state == True):
+        write_partial_state(session)
+    else:
+        write_analysis_results(session)
 
     shutdown(session, 0, "Analyzer exiting")
 
@@ -1,5 +1,7 @@
 """
-Log Utilities - This module provides logging functionality.
+Log Utilities - This module provides logging functionality. Log messages can be written
+by a background thread, and notes that may be logged for many log entries, like parsing
+and analysis notes, are rate limited by type.
 """
 
 """
@@ -8,10 +10,16 @@ Log Utilities - This module provides logging functionality.
 
 import os
 import sys
+import time
+import queue
 
 import logging
+import logging.handlers
 from enum import Enum
 
+# Notes of each type logged by default before further ones are suppressed. 0 means no limit.
+DEFAULT_NOTE_LIMIT = 100
+
 class LogLevel(Enum):
     DEBUG = 1
     INFO = 2
@@ -19,12 +27,38 @@ class LogLevel(Enum):
     ERROR = 4
     FATAL = 5
 
+# logging functions for each log level
+LOGGING_FUNCTIONS = {LogLevel.DEBUG: logging.debug, LogLevel.INFO: logging.info,
+                     LogLevel.WARNING: logging.warning, LogLevel.ERROR: logging.error,
+                     LogLevel.FATAL: logging.critical}
+
+
+""" DeferredQueueHandler class that queues log records without formatting them first """
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # QueueHandler formats each message before queuing it. Records are only passed
+    # between threads here, so they're queued as is and formatted by the listener.
+    def prepare(self, record):
+        return record
+
+
 """ Logger class that does all the logging work"""
 class Logger:
-    def __init__(self, logfile_path, logfile_name):
+    # Messages are written to the log file and, unless quiet is True, to the console.
+    # With background True, they're written by a background thread so logging doesn't
+    # wait on file and console writes. Messages may be %-style format strings followed
+    # by their args, which are only formatted when the message is written. Each note
+    # type logs at most note_limit notes per note_interval seconds (0 = the whole run),
+    # after which they're counted and reported as suppressed.
+    def __init__(self, logfile_path, logfile_name, quiet=False, background=True,
+                 note_limit=DEFAULT_NOTE_LIMIT, note_interval=0):
         self.logfile_name = logfile_name
         self.logfile_path = logfile_path
         self.logfile = os.path.join(logfile_path, logfile_name)
+        self.note_limit = note_limit
+        self.note_interval = note_interval
+        self.note_counts = {} # Note type -> notes logged in its current interval
+        self.suppressed_note_counts = {} # Note type -> notes suppressed in its current interval
+        self.note_interval_starts = {} # Note type -> start time of its current interval
         self.log_formatter = logging.Formatter(
             "%(asctime)s  %(message)s", '%Y-%m-%d-%H:%M:%S')
             #"%(asctime)s [%(threadName)s] [%(levelname)s]  %(message)s", '%Y-%m-%d %H:%M:%S')
@@ -32,25 +66,119 @@ class Logger:
         self.root_logger.setLevel(logging.INFO)
         self.logfile_handler = logging.FileHandler(self.logfile)
         self.logfile_handler.setFormatter(self.log_formatter)
-        self.root_logger.addHandler(self.logfile_handler)
-        self.console_handler = logging.StreamHandler(sys.stdout)
-        self.console_handler.setFormatter(self.log_formatter)
-        self.root_logger.addHandler(self.console_handler)
+        self.console_handler = None
+        log_handlers = [self.logfile_handler]
+        if (quiet != True):
+            self.console_handler = logging.StreamHandler(sys.stdout)
+            self.console_handler.setFormatter(self.log_formatter)
+            log_handlers.append(self.console_handler)
+        self.queue_listener = None
+        if (background == True):
+            log_queue = queue.SimpleQueue()
+            self.queue_handler = DeferredQueueHandler(log_queue)
+            self.root_logger.addHandler(self.queue_handler)
+            self.queue_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+            self.queue_listener.start()
+        else:
+            for log_handler in log_handlers:
+                self.root_logger.addHandler(log_handler)
     
-    def debug(self, logtext):
-        logging.debug(logtext)
+    def debug(self, logtext, *args):
+        logging.debug(logtext, *args)
 
-    def info(self, logtext):
-        logging.info(logtext)
+    def info(self, logtext, *args):
+        logging.info(logtext, *args)
 
-    def warning(self, logtext):
-        logging.warning(logtext)
+    def warning(self, logtext, *args):
+        logging.warning(logtext, *args)
 
-    def error(self, logtext):
-        logging.error(logtext)
+    def error(self, logtext, *args):
+        logging.error(logtext, *args)
 
-    def fatal(self, logtext):
-        logging.critical(logtext)
+    def fatal(self, logtext, *args):
+        logging.critical(logtext, *args)
+
+    # Log a note of note_type, a short description like "invalid pair", unless the
+    # type's note limit is reached. Suppressed notes are never formatted.
+    def note(self, note_type, logtext, *args, log_level=LogLevel.INFO):
+        if (self.note_limit > 0):
+            if (self.note_interval > 0):
+                now = time.monotonic()
+                if (now - self.note_interval_starts.setdefault(note_type, now) >= self.note_interval):
+                    self.log_suppressed_notes(note_type)
+                    self.note_interval_starts[note_type] = now
+            note_count = self.note_counts.get(note_type, 0)
+            if (note_count >= self.note_limit):
+                self.suppress_notes(note_type, 1)
+                return
+            self.note_counts[note_type] = note_count + 1
+        LOGGING_FUNCTIONS[log_level](logtext, *args)
+
+    # Count notes of note_type suppressed elsewhere, e.g. by a BufferedLogger
+    def suppress_notes(self, note_type, note_count):
+        self.suppressed_note_counts[note_type] = self.suppressed_note_counts.get(note_type, 0) + note_count
+
+    # Log how many notes of note_type were suppressed and start counting its notes again
+    def log_suppressed_notes(self, note_type):
+        suppressed_count = self.suppressed_note_counts.pop(note_type, 0)
+        if (suppressed_count > 0):
+            logging.info("%d similar notes suppressed: %s", suppressed_count, note_type)
+        self.note_counts[note_type] = 0
 
     def shutdown(self):
+        for note_type in list(self.suppressed_note_counts):
+            self.log_suppressed_notes(note_type)
+        if (self.queue_listener != None):
+            self.queue_listener.stop()
+            self.root_logger.removeHandler(self.queue_handler)
         logging.shutdown()
+
+
+""" BufferedLogger class that holds log messages so they can be written later by a Logger """
+class BufferedLogger:
+    # Holds at most note_limit notes of each type (0 = no limit) and counts the rest,
+    # so a worker with many notes doesn't hold them all
+    def __init__(self, note_limit=DEFAULT_NOTE_LIMIT):
+        self.messages = []
+        self.note_limit = note_limit
+        self.note_counts = {}
+        self.suppressed_note_counts = {}
+
+    def debug(self, logtext, *args):
+        self.messages.append((LogLevel.DEBUG, logtext, args, None))
+
+    def info(self, logtext, *args):
+        self.messages.append((LogLevel.INFO, logtext, args, None))
+
+    def warning(self, logtext, *args):
+        self.messages.append((LogLevel.WARNING, logtext, args, None))
+
+    def error(self, logtext, *args):
+        self.messages.append((LogLevel.ERROR, logtext, args, None))
+
+    def fatal(self, logtext, *args):
+        self.messages.append((LogLevel.FATAL, logtext, args, None))
+
+    def note(self, note_type, logtext, *args, log_level=LogLevel.INFO):
+        note_count = self.note_counts.get(note_type, 0)
+        if (self.note_limit > 0 and note_count >= self.note_limit):
+            self.suppressed_note_counts[note_type] = self.suppressed_note_counts.get(note_type, 0) + 1
+            return
+        self.note_counts[note_type] = note_count + 1
+        self.messages.append((log_level, logtext, args, note_type))
+
+    # Write the held messages to logger in the order they were logged, with the held
+    # notes going through logger's note limits
+    def replay(self, logger):
+        log_methods = {LogLevel.DEBUG: logger.debug, LogLevel.INFO: logger.info,
+                       LogLevel.WARNING: logger.warning, LogLevel.ERROR: logger.error,
+                       LogLevel.FATAL: logger.fatal}
+        for log_level, logtext, args, note_type in self.messages:
+            if (note_type == None):
+                log_methods[log_level](logtext, *args)
+            else:
+                logger.note(note_type, logtext, *args, log_level=log_level)
+        for note_type, note_count in self.suppressed_note_counts.items():
+            logger.suppress_notes(note_type, note_count)
+        self.messages = []
+        self.suppressed_note_counts = {}
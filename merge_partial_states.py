@@ -0,0 +1,51 @@
+"""
+Merge Partial States - This script combines the partial state files that log_analyzer
+runs with export_partial_state = True write, e.g. one from each host a performance log
+is written on, into the analysis results, as if the logs had been analyzed together.
+The config's result sinks and app log settings are used, and its timing pairs and
+groups should match the ones the partial states were exported with. Only stats are
+merged, so the results have no log details rows.
+
+Usage: python merge_partial_states.py PARTIAL_STATE_FILE [PARTIAL_STATE_FILE ...]
+       [--config log_analyzer.cfg]
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import sys
+import argparse
+
+from log_analyzer import *
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge log_analyzer partial state files into analysis results.")
+    parser.add_argument("partial_state_files", nargs='+', metavar="PARTIAL_STATE_FILE",
+                        help="Partial state file written by a log_analyzer run")
+    parser.add_argument("--config", default=None,
+                        help="log_analyzer config file (default log_analyzer.cfg in the script directory)")
+    args = parser.parse_args()
+
+    session = AnalysisSession()
+    session.run_start_time = session.stage_timer.start_section()
+    load_config(session, args.config)
+    session.perf_log_files = [] # The logs were analyzed on other hosts
+    if (not is_dir_writable(session.app_log_file_dir)):
+        print("\nDirectory " + session.app_log_file_dir + " must exist and be writable. Exiting.\n")
+        sys.exit(1)
+    if (setup(session) != True):
+        print("\nError during setup. Exiting.\n")
+        sys.exit(1)
+    session.stage_timer.end_section(session.run_start_time, ["config"])
+
+    write_log_details_header(session)
+    if (merge_partial_state_files(session, args.partial_state_files) == 0):
+        shutdown(session, 1, "No partial states merged. Exiting")
+    write_analysis_results(session)
+    shutdown(session, 0, "Merge complete. Analyzer exiting")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Parse Utilities - This module provides a line parser for performance logs made up of
+a row header followed by separated key-value pairs. Lines can be parsed from str or
+straight from a bytes buffer such as a memory mapped log file.
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import re
+import sys
+
+# Bytes rstrip() treats as whitespace, stripped from the end of a line in a buffer
+LINE_END_BYTES = b" \t\n\r\x0b\x0c"
+
+
+""" LineParser class that is compiled once from the log format and then parses log lines """
+class LineParser:
+    def __init__(self, row_header, pair_separator, field_separator, log_keys):
+        self.row_header = row_header
+        self.header_length = len(row_header) + 1 # Header is followed by one separating char
+        self.pair_separator = pair_separator
+        self.field_separator = field_separator
+        # Each key maps to its interned copy, which every entry's fields use as the key
+        # instead of the copy split from its line
+        self.log_keys = {sys.intern(key): sys.intern(key) for key in log_keys}
+
+        # Separators are regular expressions, but nearly always a single literal
+        # char like "," or ":". Those get a fast path using str.split and
+        # str.partition, which measure well ahead of any compiled regex for
+        # finding the pairs, and the regex split is only compiled for the rest.
+        self.pair_char = literal_char(pair_separator)
+        self.field_char = literal_char(field_separator)
+        self.fast_path = (self.pair_char != None and self.field_char != None)
+        if (not self.fast_path):
+            self.pair_split = re.compile(pair_separator).split
+            self.field_split = re.compile(field_separator).split
+
+        # For finding the row header in a bytes buffer without decoding the line
+        self.row_header_bytes = row_header.encode()
+        self.header_bytes_length = len(self.row_header_bytes) + 1
+
+    # Parse a log line. Returns a (full_log_entry, fields, invalid_pairs) tuple, where
+    # full_log_entry is the line without its newline, fields is a dict of the configured
+    # keys found in the line (None if the row header wasn't found), and invalid_pairs
+    # is a list of the pairs that couldn't be split into a key and value.
+    def parse(self, log_line):
+        full_log_entry = log_line.rstrip()
+        header_index = full_log_entry.find(self.row_header)
+        if (header_index == -1):
+            return (full_log_entry, None, [])
+
+        fields, invalid_pairs = self.parse_pairs(full_log_entry[header_index + self.header_length:])
+        return (full_log_entry, fields, invalid_pairs)
+
+    # Parse the log line in buffer[start:end], e.g. a line of a memory mapped log file,
+    # without decoding or copying the whole line. Returns the same tuple as parse(),
+    # except full_log_entry is a memoryview of the line in buffer (see get_line_text()).
+    # Only the pairs after the row header are decoded. Pass buffer_view, a memoryview
+    # of the whole buffer, when parsing many lines of it to save making one per line.
+    def parse_buffer(self, buffer, start, end, buffer_view=None):
+        while (end > start and buffer[end - 1] in LINE_END_BYTES):
+            end -= 1
+        if (buffer_view == None):
+            buffer_view = memoryview(buffer)
+        full_log_entry = buffer_view[start:end]
+        header_index = buffer.find(self.row_header_bytes, start, end)
+        if (header_index == -1):
+            return (full_log_entry, None, [])
+
+        # Decoding the pairs in one call measures well ahead of decoding
+        # each configured value on its own
+        fields, invalid_pairs = self.parse_pairs(
+            buffer[header_index + self.header_bytes_length:end].decode(errors='replace'))
+        return (full_log_entry, fields, invalid_pairs)
+
+    # Split the pairs after a line's row header. Returns a (fields, invalid_pairs) tuple.
+    def parse_pairs(self, pairs_text):
+        parse_line = pairs_text.replace(" ", "")
+        log_keys = self.log_keys
+        fields = {}
+        invalid_pairs = []
+        if (self.fast_path):
+            field_char = self.field_char
+            for item in parse_line.split(self.pair_char):
+                key, separator, value = item.partition(field_char)
+                if (separator and field_char not in value):
+                    log_key = log_keys.get(key)
+                    if (log_key != None):
+                        fields[log_key] = value
+                else:
+                    invalid_pairs.append(item)
+            return (fields, invalid_pairs)
+
+        for item in self.pair_split(parse_line):
+            split_pair = self.field_split(item)
+            if (len(split_pair) == 2):
+                log_key = log_keys.get(split_pair[0])
+                if (log_key != None):
+                    fields[log_key] = split_pair[1]
+            else:
+                invalid_pairs.append(item)
+        return (fields, invalid_pairs)
+
+
+# Return a line from LineParser.parse() or parse_buffer() as str, decoding it if it's
+# still a view of a buffer
+def get_line_text(line):
+    if (isinstance(line, memoryview)):
+        return str(line, errors='replace')
+    return line
+
+
+# Return the char a separator regex matches if it only matches one literal char, else None
+def literal_char(separator):
+    if (len(separator) == 1 and separator not in ".^$*+?{}[]\\|()"):
+        return separator
+    if (len(separator) == 2 and separator[0] == "\\" and not separator[1].isalnum()):
+        return separator[1]
+    return None
@@ -0,0 +1,157 @@
+"""
+Profile Utilities - This module provides the analyzer's self-instrumentation: wall and
+CPU time per stage of a run, peak memory, and optional profiling of the run with
+cProfile and tracemalloc to find its hot spots.
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import io
+import sys
+import time
+
+try:
+    import resource
+except (ImportError):
+    resource = None # Not available on Windows, so peak memory isn't reported
+
+
+# Return the peak RSS in MB of this process, or with children True, of its largest
+# finished child process, or None if it isn't available
+def get_peak_memory_mb(children=False):
+    if (resource == None):
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    if (sys.platform == "darwin"):
+        return peak_rss / (1024 * 1024) # Bytes on macOS
+    return peak_rss / 1024 # KB elsewhere
+
+
+""" StageTimer class that adds up the wall and CPU time of each stage of a run """
+class StageTimer:
+    # Stages can run one after another or interleaved, e.g. when each log entry is
+    # analyzed as soon as it's parsed. Either way, a section of the run is timed from
+    # start_section() to end_section(), which gets the stages that ran in it. Stages
+    # whose own wall time was added during the section with add_wall_time() keep it,
+    # and the rest of the section's wall time goes to the last stage. CPU time can't
+    # be measured cheaply per log entry, so the section's CPU time is split between
+    # its stages by their share of its wall time.
+    def __init__(self):
+        self.stage_times = {} # Stage name -> [wall secs, CPU secs], in the order first timed
+
+    def start_section(self):
+        return (time.perf_counter(), time.process_time(),
+                {stage_name: stage_time[0] for stage_name, stage_time in self.stage_times.items()})
+
+    def end_section(self, section_start, stage_names):
+        start_wall, start_cpu, start_stage_walls = section_start
+        section_wall = time.perf_counter() - start_wall
+        section_cpu = time.process_time() - start_cpu
+        stage_walls = {}
+        for stage_name in stage_names[:-1]:
+            stage_walls[stage_name] = (self.get_wall_time(stage_name) -
+                                       start_stage_walls.get(stage_name, 0))
+        stage_walls[stage_names[-1]] = max(0, section_wall - sum(stage_walls.values()))
+        for stage_name, stage_wall in stage_walls.items():
+            stage_time = self.stage_times.setdefault(stage_name, [0, 0])
+            if (stage_name == stage_names[-1]):
+                stage_time[0] += stage_wall
+            if (section_wall > 0):
+                stage_time[1] += section_cpu * stage_wall / section_wall
+
+    # Add wall time of a stage measured inside a section
+    def add_wall_time(self, stage_name, wall_secs):
+        stage_time = self.stage_times.get(stage_name)
+        if (stage_time == None):
+            stage_time = self.stage_times[stage_name] = [0, 0]
+        stage_time[0] += wall_secs
+
+    def get_wall_time(self, stage_name):
+        return self.stage_times.get(stage_name, (0, 0))[0]
+
+    def get_cpu_time(self, stage_name):
+        return self.stage_times.get(stage_name, (0, 0))[1]
+
+    # Add the stage times of another StageTimer, e.g. from a parallel worker
+    def merge(self, other):
+        for stage_name, (wall_secs, cpu_secs) in other.stage_times.items():
+            stage_time = self.stage_times.setdefault(stage_name, [0, 0])
+            stage_time[0] += wall_secs
+            stage_time[1] += cpu_secs
+
+
+# Generator that yields the log entries from log_entries, adding the wall time spent
+# getting each one to stage_name of stage_timer, less the time added to the
+# parse_stage_name stage meanwhile, so reading and parsing are separate stages
+def time_log_entries(stage_timer, log_entries, stage_name="load", parse_stage_name="parse"):
+    perf_counter = time.perf_counter
+    get_wall_time = stage_timer.get_wall_time
+    log_entries = iter(log_entries)
+    while (True):
+        start_time = perf_counter()
+        start_parse_time = get_wall_time(parse_stage_name)
+        try:
+            log_entry = next(log_entries)
+        except (StopIteration):
+            return
+        finally:
+            stage_timer.add_wall_time(stage_name, perf_counter() - start_time -
+                                      (get_wall_time(parse_stage_name) - start_parse_time))
+        yield log_entry
+
+
+""" RunProfiler class that profiles a run with cProfile and tracemalloc and reports its hot spots """
+class RunProfiler:
+    def __init__(self, profile_calls=True, trace_memory=False):
+        # Imported here so the profiling modules are only loaded when a run is profiled
+        import cProfile
+
+        self.profiler = cProfile.Profile() if profile_calls else None
+        self.trace_memory = trace_memory
+        self.memory_snapshot = None
+        self.traced_peak_bytes = 0
+
+    def start(self):
+        import tracemalloc
+
+        if (self.trace_memory):
+            tracemalloc.start()
+        if (self.profiler != None):
+            self.profiler.enable()
+
+    def stop(self):
+        import tracemalloc
+
+        if (self.profiler != None):
+            self.profiler.disable()
+        if (self.trace_memory and tracemalloc.is_tracing()):
+            self.memory_snapshot = tracemalloc.take_snapshot()
+            self.traced_peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    # Save the profile in pstats format, e.g. for snakeviz
+    def save_profile(self, profile_file):
+        if (self.profiler != None):
+            self.profiler.dump_stats(profile_file)
+
+    # Return lines reporting the top_n functions by time spent in them and, if memory
+    # was traced, the top_n lines by memory allocated
+    def get_report_lines(self, top_n):
+        import pstats
+
+        report_lines = []
+        if (self.profiler != None):
+            report_text = io.StringIO()
+            profile_stats = pstats.Stats(self.profiler, stream=report_text)
+            profile_stats.sort_stats(pstats.SortKey.TIME).print_stats(top_n)
+            report_lines.append("Top {} functions by time:".format(top_n))
+            report_lines += [line for line in report_text.getvalue().splitlines()
+                             if line.strip() != "" and "function calls" not in line]
+        if (self.memory_snapshot != None):
+            report_lines.append("Peak traced memory {:.1f} MB. Top {} lines by memory allocated:".format(
+                self.traced_peak_bytes / (1024 * 1024), top_n))
+            for line_stats in self.memory_snapshot.statistics('lineno')[:top_n]:
+                report_lines.append("  " + str(line_stats))
+        return report_lines
@@ -0,0 +1,358 @@
+"""
+Result Sink Utilities - This module provides the result sinks analysis results are
+written through: Excel, CSV, NDJSON, SQLite, and the console. Each sink gets the run
+info, the log details header and rows, and the summary tables, and writes them in its
+own format.
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import os
+import re
+import csv
+import sys
+import json
+
+# Rows a sink holds before writing them out in one batch
+SINK_BUFFER_ROWS = 10000
+
+# Names of the sinks that can be listed in the result_sinks config option
+RESULT_SINK_NAMES = ("excel", "csv", "ndjson", "sqlite", "console")
+
+
+# Convert a display name like "Min Time (ms)" to a column or table name like "min_time_ms"
+def get_column_name(display_name):
+    return re.sub("[^0-9a-zA-Z]+", "_", display_name).strip("_").lower()
+
+
+# Return the text to show for a cell, with floats like average times to two decimal places
+def get_cell_text(cell_value):
+    if (isinstance(cell_value, float)):
+        return "{:.2f}".format(cell_value)
+    return str(cell_value)
+
+
+""" ResultSink class that all result sinks derive from. Every method is optional. """
+class ResultSink:
+    def write_run_info(self, name, value):
+        pass
+
+    def write_log_details_header(self, header_row):
+        pass
+
+    def write_log_details_row(self, log_details_row):
+        pass
+
+    def write_summary_table(self, table_name, header_row, rows):
+        pass
+
+    # Make what's been written so far readable, where the format allows it
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    # Close without keeping the results, removing any files written, e.g. when the
+    # analysis they're from failed
+    def discard(self):
+        pass
+
+
+# Remove a results file if it was written
+def remove_results_file(file_path):
+    if (os.path.exists(file_path)):
+        os.remove(file_path)
+
+
+""" ResultSinks class that passes everything written to it on to a list of sinks """
+class ResultSinks(ResultSink):
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write_run_info(self, name, value):
+        for sink in self.sinks:
+            sink.write_run_info(name, value)
+
+    def write_log_details_header(self, header_row):
+        for sink in self.sinks:
+            sink.write_log_details_header(header_row)
+
+    def write_log_details_row(self, log_details_row):
+        for sink in self.sinks:
+            sink.write_log_details_row(log_details_row)
+
+    def write_summary_table(self, table_name, header_row, rows):
+        for sink in self.sinks:
+            sink.write_summary_table(table_name, header_row, rows)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def discard(self):
+        for sink in self.sinks:
+            sink.discard()
+
+
+""" ExcelSink class that writes results to the sheets of an Excel workbook """
+class ExcelSink(ResultSink):
+    def __init__(self, results_file_dir, results_file_name, write_only=False):
+        # Imported here so openpyxl is only loaded when results go to Excel
+        from excel_util import XLSDoc
+
+        self.xls_doc = XLSDoc(results_file_dir, results_file_name, write_only)
+        self.ws_run_info = self.xls_doc.create_worksheet("Run Info", 2)
+        self.ws_summary = self.xls_doc.create_worksheet("Analysis Summary", 0)
+        self.ws_full_log = self.xls_doc.create_sharded_worksheet("Analysis Log", 1)
+        self.xls_doc.delete_worksheet("Sheet")
+        self.run_info_row = 0
+        self.summary_row = 1 # Tables start two rows below the summary title
+        self.xls_doc.write_cell(self.ws_summary, 1, 1, "Analysis Results Summary")
+
+    def write_run_info(self, name, value):
+        self.run_info_row += 1
+        self.xls_doc.write_cell(self.ws_run_info, self.run_info_row, 1, name)
+        self.xls_doc.write_cell(self.ws_run_info, self.run_info_row, 2, value)
+
+    def write_log_details_header(self, header_row):
+        self.ws_full_log.set_header_row(header_row)
+
+    def write_log_details_row(self, log_details_row):
+        self.ws_full_log.append_row(log_details_row)
+
+    def write_summary_table(self, table_name, header_row, rows):
+        self.summary_row += 2 # Leave a blank row above each table
+        for ws_col, cell_value in enumerate(header_row, start=1):
+            self.xls_doc.write_cell(self.ws_summary, self.summary_row, ws_col, cell_value)
+        for row in rows:
+            self.summary_row += 1
+            for ws_col, cell_value in enumerate(row, start=1):
+                self.xls_doc.write_cell(self.ws_summary, self.summary_row, ws_col, cell_value)
+
+    def flush(self):
+        if (self.xls_doc.write_only != True): # A write-only workbook can only be saved once
+            self.xls_doc.save_doc()
+
+    def close(self):
+        self.xls_doc.save_doc()
+
+    def discard(self):
+        remove_results_file(self.xls_doc.excel_file) # In case flush() saved it
+
+
+""" CSVSink class that writes the log details and each summary table to its own CSV file """
+class CSVSink(ResultSink):
+    def __init__(self, results_file_dir, results_file_prefix):
+        self.results_file_prefix = os.path.join(results_file_dir, results_file_prefix)
+        self.run_info_rows = []
+        self.log_details_file = None
+        self.log_details_writer = None
+        self.log_details_rows = []
+        self.file_names = [] # Files written so far
+
+    def get_file_name(self, table_name):
+        file_name = "{}-{}.csv".format(self.results_file_prefix, get_column_name(table_name))
+        if (file_name not in self.file_names):
+            self.file_names.append(file_name)
+        return file_name
+
+    def write_run_info(self, name, value):
+        self.run_info_rows.append((name, value))
+
+    def write_log_details_header(self, header_row):
+        self.log_details_file = open(self.get_file_name("Analysis Log"), 'w', newline='',
+                                     buffering=1024 * 1024)
+        self.log_details_writer = csv.writer(self.log_details_file)
+        self.log_details_writer.writerow(header_row)
+
+    def write_log_details_row(self, log_details_row):
+        self.log_details_rows.append(log_details_row)
+        if (len(self.log_details_rows) >= SINK_BUFFER_ROWS):
+            self.flush()
+
+    def write_summary_table(self, table_name, header_row, rows):
+        with open(self.get_file_name(table_name), 'w', newline='') as table_file:
+            table_writer = csv.writer(table_file)
+            table_writer.writerow(header_row)
+            table_writer.writerows(rows)
+
+    def flush(self):
+        if (self.log_details_writer != None):
+            self.log_details_writer.writerows(self.log_details_rows)
+            self.log_details_file.flush()
+        self.log_details_rows = []
+
+    def close(self):
+        self.flush()
+        if (self.log_details_file != None):
+            self.log_details_file.close()
+            self.log_details_file = None
+        self.write_summary_table("Run Info", ("Name", "Value"), self.run_info_rows)
+
+    def discard(self):
+        if (self.log_details_file != None):
+            self.log_details_file.close()
+            self.log_details_file = None
+        for file_name in self.file_names:
+            remove_results_file(file_name)
+
+
+""" NDJSONSink class that writes every result as a JSON object on its own line of one file """
+class NDJSONSink(ResultSink):
+    def __init__(self, results_file_dir, results_file_name):
+        self.results_file_path = os.path.join(results_file_dir, results_file_name)
+        self.results_file = open(self.results_file_path, 'w', buffering=1024 * 1024)
+        self.log_details_columns = None
+        self.lines = []
+
+    # Each object has a "record_type" naming the table it's a row of
+    def write_record(self, record_type, columns, row):
+        record = {"record_type": record_type}
+        record.update(zip(columns, row))
+        self.lines.append(json.dumps(record, default=str))
+        if (len(self.lines) >= SINK_BUFFER_ROWS):
+            self.write_lines()
+
+    def write_lines(self):
+        if (len(self.lines) > 0):
+            self.results_file.write("\n".join(self.lines) + "\n")
+        self.lines = []
+
+    def write_run_info(self, name, value):
+        self.write_record("run_info", ("name", "value"), (name, value))
+
+    def write_log_details_header(self, header_row):
+        self.log_details_columns = [get_column_name(header) for header in header_row]
+
+    def write_log_details_row(self, log_details_row):
+        self.write_record("analysis_log", self.log_details_columns, log_details_row)
+
+    def write_summary_table(self, table_name, header_row, rows):
+        columns = [get_column_name(header) for header in header_row]
+        for row in rows:
+            self.write_record(get_column_name(table_name), columns, row)
+
+    def flush(self):
+        self.write_lines()
+        self.results_file.flush()
+
+    def close(self):
+        self.write_lines()
+        self.results_file.close()
+
+    def discard(self):
+        self.results_file.close()
+        remove_results_file(self.results_file_path)
+
+
+""" SQLiteSink class that writes results to tables of a SQLite database """
+class SQLiteSink(ResultSink):
+    def __init__(self, results_file_dir, results_file_name):
+        # Imported here so sqlite3 is only loaded when results go to SQLite
+        import sqlite3
+
+        self.results_file_path = os.path.join(results_file_dir, results_file_name)
+        self.connection = sqlite3.connect(self.results_file_path)
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.create_table("run_info", ("name", "value"))
+        self.log_details_insert = None
+        self.log_details_rows = []
+
+    # Create a table and return the statement that inserts a row into it. Names are quoted
+    # since some, like "group", are SQL keywords.
+    def create_table(self, table_name, columns):
+        with self.connection:
+            self.connection.execute('DROP TABLE IF EXISTS "{}"'.format(table_name))
+            self.connection.execute('CREATE TABLE "{}" ({})'.format(
+                table_name, ", ".join('"{}"'.format(column) for column in columns)))
+        return 'INSERT INTO "{}" VALUES ({})'.format(table_name, ", ".join("?" * len(columns)))
+
+    def write_run_info(self, name, value):
+        with self.connection:
+            self.connection.execute("INSERT INTO run_info VALUES (?, ?)", (name, value))
+
+    def write_log_details_header(self, header_row):
+        self.log_details_insert = self.create_table(
+            "analysis_log", [get_column_name(header) for header in header_row])
+
+    def write_log_details_row(self, log_details_row):
+        self.log_details_rows.append(log_details_row)
+        if (len(self.log_details_rows) >= SINK_BUFFER_ROWS):
+            self.flush()
+
+    def write_summary_table(self, table_name, header_row, rows):
+        table_insert = self.create_table(get_column_name(table_name),
+                                         [get_column_name(header) for header in header_row])
+        with self.connection:
+            self.connection.executemany(table_insert, rows)
+
+    # Insert the held log details rows in one transaction
+    def flush(self):
+        if (len(self.log_details_rows) > 0):
+            with self.connection:
+                self.connection.executemany(self.log_details_insert, self.log_details_rows)
+        self.log_details_rows = []
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+    def discard(self):
+        self.connection.close()
+        remove_results_file(self.results_file_path)
+
+
+""" ConsoleSink class that prints summary tables as text, for quick checks from a terminal or script """
+class ConsoleSink(ResultSink):
+    def __init__(self, output=None):
+        self.output = output if output != None else sys.stdout
+
+    def write_summary_table(self, table_name, header_row, rows):
+        text_rows = [[get_cell_text(cell_value) for cell_value in row] for row in [header_row] + list(rows)]
+        column_widths = [max(len(text_row[column]) for text_row in text_rows if column < len(text_row))
+                         for column in range(len(header_row))]
+        self.output.write("\n{}\n".format(table_name))
+        for row_index, text_row in enumerate(text_rows):
+            # The first column is a name, so it's left aligned and the numbers are right aligned
+            self.output.write("  ".join([text_row[0].ljust(column_widths[0])] +
+                                        [cell_text.rjust(column_width) for cell_text, column_width
+                                         in zip(text_row[1:], column_widths[1:])]).rstrip() + "\n")
+            if (row_index == 0):
+                self.output.write("  ".join("-" * column_width for column_width in column_widths) + "\n")
+        if (len(text_rows) == 1):
+            self.output.write("(no stats)\n")
+
+    def flush(self):
+        self.output.flush()
+
+    def close(self):
+        self.output.flush()
+
+
+# Create the result sinks named in sink_names (see RESULT_SINK_NAMES). Results files
+# are written to results_file_dir and named results_file_prefix plus each sink's
+# extension, except the Excel workbook, which is named excel_file_name.
+def create_result_sinks(sink_names, results_file_dir, results_file_prefix, excel_file_name,
+                        excel_write_only=False):
+    sinks = []
+    for sink_name in sink_names:
+        if (sink_name == "excel"):
+            sinks.append(ExcelSink(results_file_dir, excel_file_name, excel_write_only))
+        elif (sink_name == "csv"):
+            sinks.append(CSVSink(results_file_dir, results_file_prefix))
+        elif (sink_name == "ndjson"):
+            sinks.append(NDJSONSink(results_file_dir, results_file_prefix + ".ndjson"))
+        elif (sink_name == "sqlite"):
+            sinks.append(SQLiteSink(results_file_dir, results_file_prefix + ".sqlite"))
+        elif (sink_name == "console"):
+            sinks.append(ConsoleSink())
+        else:
+            raise ValueError("Unknown result sink \"{}\"".format(sink_name))
+    return ResultSinks(sinks)
@@ -0,0 +1,341 @@
+"""
+Statistics Utilities - This module provides latency statistics that can be accumulated
+one value at a time and merged with statistics accumulated elsewhere, e.g. in another
+process, including latency statistics for each of an unbounded number of groups kept
+in bounded memory.
+"""
+
+"""
+@author: Chris Lamke
+"""
+
+import heapq
+
+# Latencies below 2^SUB_BUCKET_BITS get a histogram bucket of their own. Above that,
+# each power of 2 is split into 2^(SUB_BUCKET_BITS - 1) buckets, so a percentile is
+# within about 1.6% of the true value however large latencies get.
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_HALF_COUNT = 1 << (SUB_BUCKET_BITS - 1)
+
+
+""" LatencyHistogram class that counts latencies in log-scaled buckets for percentiles """
+class LatencyHistogram:
+    def __init__(self):
+        self.count = 0
+        self.bucket_counts = {} # Bucket index -> count of latencies in the bucket
+
+    def add_latency(self, latency):
+        bucket_index = get_bucket_index(latency)
+        self.bucket_counts[bucket_index] = self.bucket_counts.get(bucket_index, 0) + 1
+        self.count += 1
+
+    def merge(self, other):
+        for bucket_index, bucket_count in other.bucket_counts.items():
+            self.bucket_counts[bucket_index] = self.bucket_counts.get(bucket_index, 0) + bucket_count
+        self.count += other.count
+
+    # Return the histogram as a dict that can be saved as JSON
+    def to_dict(self):
+        return {"count": self.count,
+                "buckets": [[bucket_index, bucket_count] for bucket_index, bucket_count
+                            in sorted(self.bucket_counts.items())]}
+
+    # Replace the histogram's counts with those in a dict from to_dict()
+    def load_dict(self, histogram_dict):
+        self.count = histogram_dict["count"]
+        self.bucket_counts = {bucket_index: bucket_count for bucket_index, bucket_count
+                              in histogram_dict["buckets"]}
+
+    # Return the latency at the given percentile (0-100), or None if the histogram is empty
+    def get_percentile(self, percentile):
+        if (self.count == 0):
+            return None
+        rank = max(1, -(-self.count * percentile // 100)) # Ceiling of count * percentile / 100
+        seen_count = 0
+        for bucket_index in sorted(self.bucket_counts):
+            seen_count += self.bucket_counts[bucket_index]
+            if (seen_count >= rank):
+                return get_bucket_value(bucket_index)
+        return get_bucket_value(max(self.bucket_counts))
+
+
+# Return the histogram bucket index for a latency. Negative latencies, e.g. from
+# unsynchronized clocks, get mirrored negative indexes.
+def get_bucket_index(latency):
+    latency = int(latency)
+    if (latency < 0):
+        return -1 - get_bucket_index(-latency)
+    shift = max(0, latency.bit_length() - SUB_BUCKET_BITS)
+    return (shift << (SUB_BUCKET_BITS - 1)) + (latency >> shift)
+
+
+# Return the latency in the middle of a histogram bucket
+def get_bucket_value(bucket_index):
+    if (bucket_index < 0):
+        return -get_bucket_value(-1 - bucket_index)
+    if (bucket_index < 2 * SUB_BUCKET_HALF_COUNT):
+        return bucket_index
+    shift = (bucket_index >> (SUB_BUCKET_BITS - 1)) - 1
+    bucket_start = (bucket_index - (shift << (SUB_BUCKET_BITS - 1))) << shift
+    return bucket_start + ((1 << shift) - 1) // 2
+
+
+""" LatencyStats class that accumulates count, total, min, max, and percentiles of latency """
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total_latency = 0 # Divide by count to get avg latency
+        self.min_latency = None
+        self.max_latency = None
+        self.histogram = LatencyHistogram()
+
+    def add_latency(self, latency):
+        self.histogram.add_latency(latency)
+        self.count += 1
+        self.total_latency += latency
+        if (self.min_latency == None or latency < self.min_latency):
+            self.min_latency = latency
+        if (self.max_latency == None or latency > self.max_latency):
+            self.max_latency = latency
+
+    def merge(self, other):
+        if (other.count == 0):
+            return
+        self.histogram.merge(other.histogram)
+        self.count += other.count
+        self.total_latency += other.total_latency
+        if (self.min_latency == None or other.min_latency < self.min_latency):
+            self.min_latency = other.min_latency
+        if (self.max_latency == None or other.max_latency > self.max_latency):
+            self.max_latency = other.max_latency
+
+    # Return the stats as a dict that can be saved as JSON
+    def to_dict(self):
+        return {"count": self.count, "total_latency": self.total_latency,
+                "min_latency": self.min_latency, "max_latency": self.max_latency,
+                "histogram": self.histogram.to_dict()}
+
+    # Replace the stats with those in a dict from to_dict()
+    def load_dict(self, stats_dict):
+        self.count = stats_dict["count"]
+        self.total_latency = stats_dict["total_latency"]
+        self.min_latency = stats_dict["min_latency"]
+        self.max_latency = stats_dict["max_latency"]
+        self.histogram.load_dict(stats_dict["histogram"])
+
+    def get_avg_latency(self):
+        if (self.count == 0):
+            return 0
+        return self.total_latency / self.count
+
+    # Return the latency at the given percentile (0-100), or None if there are no latencies
+    def get_percentile(self, percentile):
+        return clamp_percentile(self.histogram.get_percentile(percentile),
+                                self.min_latency, self.max_latency)
+
+
+# Keep a percentile from a histogram bucket within the exact min and max latency
+def clamp_percentile(percentile_latency, min_latency, max_latency):
+    if (percentile_latency == None):
+        return None
+    return min(max(percentile_latency, min_latency), max_latency)
+
+
+""" GroupedLatencyStats class that accumulates LatencyStats for each distinct group value """
+class GroupedLatencyStats:
+    # Up to max_groups groups are tracked exactly. Beyond that, it becomes a space-saving
+    # top-K summary: a new group replaces the group with the lowest count and takes that
+    # count as its count_error, an upper bound on the latencies it may have missed. The
+    # groups with the highest counts are always kept, with at most max_groups held.
+    def __init__(self, max_groups):
+        self.max_groups = max_groups
+        self.groups = {} # Group value -> LatencyStats
+        self.count_errors = {} # Group value -> count_error, for groups that replaced another
+        self.count_heap = [] # (estimated count, group value) heap to find the lowest count
+
+    def get_estimated_count(self, group_value):
+        return self.groups[group_value].count + self.count_errors.get(group_value, 0)
+
+    def add_latency(self, group_value, latency):
+        latency_stats = self.groups.get(group_value)
+        if (latency_stats == None):
+            latency_stats = self.add_group(group_value)
+        latency_stats.add_latency(latency)
+
+    def add_latency_stats(self, group_value, other_stats):
+        latency_stats = self.groups.get(group_value)
+        if (latency_stats == None):
+            latency_stats = self.add_group(group_value)
+        latency_stats.merge(other_stats)
+
+    # Start tracking a group, replacing the group with the lowest count if the summary is full
+    def add_group(self, group_value, count_error=0):
+        if (len(self.groups) >= self.max_groups):
+            count_error = max(count_error, self.remove_lowest_group())
+        if (count_error > 0):
+            self.count_errors[group_value] = count_error
+        latency_stats = LatencyStats()
+        self.groups[group_value] = latency_stats
+        heapq.heappush(self.count_heap, (count_error, group_value))
+        return latency_stats
+
+    # Stop tracking the group with the lowest estimated count and return that count.
+    # Heap entries are only updated when they reach the top, since counts only grow.
+    def remove_lowest_group(self):
+        while (True):
+            heap_count, group_value = self.count_heap[0]
+            if (group_value not in self.groups):
+                heapq.heappop(self.count_heap)
+                continue
+            estimated_count = self.get_estimated_count(group_value)
+            if (heap_count == estimated_count):
+                break
+            heapq.heapreplace(self.count_heap, (estimated_count, group_value))
+        heapq.heappop(self.count_heap)
+        del self.groups[group_value]
+        self.count_errors.pop(group_value, None)
+        return estimated_count
+
+    # Add the groups of another GroupedLatencyStats. If the other one is full, a group
+    # it doesn't have may have been dropped from it, so gets its lowest count as error.
+    def merge(self, other):
+        other_error = other.get_lowest_count() if (len(other.groups) >= other.max_groups) else 0
+        own_error = self.get_lowest_count() if (len(self.groups) >= self.max_groups) else 0
+        for group_value in self.groups:
+            if (group_value not in other.groups and other_error > 0):
+                self.count_errors[group_value] = self.count_errors.get(group_value, 0) + other_error
+                heapq.heappush(self.count_heap, (self.get_estimated_count(group_value), group_value))
+        for group_value, other_stats in other.groups.items():
+            other_count_error = other.count_errors.get(group_value, 0)
+            if (group_value in self.groups):
+                self.groups[group_value].merge(other_stats)
+                if (other_count_error > 0):
+                    self.count_errors[group_value] = (self.count_errors.get(group_value, 0) +
+                                                      other_count_error)
+            else:
+                self.add_group(group_value, other_count_error + own_error).merge(other_stats)
+
+    def get_lowest_count(self):
+        return min(self.get_estimated_count(group_value) for group_value in self.groups)
+
+    # Return a list of (group value, LatencyStats, count_error) tuples for the groups,
+    # highest estimated count first
+    def get_groups(self):
+        return sorted(((group_value, latency_stats, self.count_errors.get(group_value, 0))
+                       for group_value, latency_stats in self.groups.items()),
+                      key=lambda group: -(group[1].count + group[2]))
+
+    # Return the groups as a dict that can be saved as JSON. Group values are tuples of str.
+    def to_dict(self):
+        return {"max_groups": self.max_groups,
+                "groups": [[list(group_value), latency_stats.to_dict(), count_error]
+                           for group_value, latency_stats, count_error in self.get_groups()]}
+
+    # Replace the groups with those in a dict from to_dict()
+    def load_dict(self, grouped_dict):
+        self.groups = {}
+        self.count_errors = {}
+        self.count_heap = []
+        for group_value, stats_dict, count_error in grouped_dict["groups"]:
+            latency_stats = LatencyStats()
+            latency_stats.load_dict(stats_dict)
+            self.add_group(tuple(group_value), count_error).merge(latency_stats)
+
+
+""" TimeBucket class that holds the entry count and latency stats of one time bucket """
+class TimeBucket:
+    def __init__(self):
+        self.entry_count = 0
+        self.latency_stats = {} # Series key, e.g. a timing pair key -> LatencyStats
+
+    def add_latency(self, series_key, latency):
+        latency_stats = self.latency_stats.get(series_key)
+        if (latency_stats == None):
+            latency_stats = self.latency_stats[series_key] = LatencyStats()
+        latency_stats.add_latency(latency)
+
+    def add_latency_stats(self, series_key, other_stats):
+        latency_stats = self.latency_stats.get(series_key)
+        if (latency_stats == None):
+            latency_stats = self.latency_stats[series_key] = LatencyStats()
+        latency_stats.merge(other_stats)
+
+    def merge(self, other):
+        self.entry_count += other.entry_count
+        for series_key, other_stats in other.latency_stats.items():
+            self.add_latency_stats(series_key, other_stats)
+
+    def to_dict(self):
+        return {"entry_count": self.entry_count,
+                "latency_stats": {series_key: latency_stats.to_dict() for series_key, latency_stats
+                                  in self.latency_stats.items()}}
+
+    def load_dict(self, bucket_dict):
+        self.entry_count = bucket_dict["entry_count"]
+        self.latency_stats = {}
+        for series_key, stats_dict in bucket_dict["latency_stats"].items():
+            self.latency_stats[series_key] = LatencyStats()
+            self.latency_stats[series_key].load_dict(stats_dict)
+
+
+""" LatencyTimeSeries class that accumulates TimeBuckets of timestamps in bounded memory """
+class LatencyTimeSeries:
+    # Buckets are bucket_width ms long and start at multiples of bucket_width. Only
+    # buckets with entries are held, and when there would be more than max_buckets of
+    # them, bucket_width doubles and neighboring buckets are merged, so a long log gets
+    # coarser buckets rather than unbounded memory.
+    def __init__(self, bucket_width, max_buckets):
+        self.bucket_width = bucket_width
+        self.max_buckets = max_buckets
+        self.buckets = {} # Bucket start // bucket_width -> TimeBucket
+
+    # Return the bucket for a timestamp in ms, adding it if it's new
+    def get_bucket(self, timestamp):
+        bucket = self.buckets.get(timestamp // self.bucket_width)
+        if (bucket == None):
+            while (len(self.buckets) >= self.max_buckets):
+                self.coarsen()
+            bucket = self.buckets.setdefault(timestamp // self.bucket_width, TimeBucket())
+        return bucket
+
+    # Double the bucket width, merging each pair of neighboring buckets
+    def coarsen(self):
+        buckets = self.buckets
+        self.bucket_width *= 2
+        self.buckets = {}
+        for bucket_index, bucket in sorted(buckets.items()):
+            coarse_bucket = self.buckets.get(bucket_index // 2)
+            if (coarse_bucket == None):
+                self.buckets[bucket_index // 2] = bucket
+            else:
+                coarse_bucket.merge(bucket)
+
+    # Add the buckets of another time series whose bucket width is this one's
+    # configured width times a power of 2
+    def merge(self, other):
+        while (self.bucket_width < other.bucket_width):
+            self.coarsen()
+        for bucket_index, other_bucket in other.buckets.items():
+            self.get_bucket(bucket_index * other.bucket_width).merge(other_bucket)
+
+    # Return a list of (bucket start in ms, TimeBucket) tuples, oldest first
+    def get_buckets(self):
+        return [(bucket_index * self.bucket_width, bucket) for bucket_index, bucket
+                in sorted(self.buckets.items())]
+
+    def to_dict(self):
+        return {"bucket_width": self.bucket_width,
+                "buckets": [[bucket_start, bucket.to_dict()] for bucket_start, bucket
+                            in self.get_buckets()]}
+
+    # Replace the buckets with those in a dict from to_dict(), coarsening
+    # them if they're narrower than this time series' buckets
+    def load_dict(self, time_series_dict):
+        self.buckets = {}
+        loaded_width = time_series_dict["bucket_width"]
+        while (self.bucket_width < loaded_width):
+            self.bucket_width *= 2
+        for bucket_start, bucket_dict in time_series_dict["buckets"]:
+            bucket = TimeBucket()
+            bucket.load_dict(bucket_dict)
+            self.get_bucket(bucket_start).merge(bucket)